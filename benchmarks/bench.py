@@ -0,0 +1,225 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import List, Dict, Callable, Optional
+
+import yaml
+
+from src.catalog import generate_catalog
+from src.config import CompiledConfig, compile_config
+from src.description_generator import DescriptionGenerator
+from src.pipeline import StageRunner, chunk_counts
+from src.utils.data_writer import write_data, writer_options
+from src.utils.id_allocator import configure_id_allocation
+from src.utils.seeding import derive_seed, seed_generators
+from src.vendor_generator import generate_vendors
+
+# Throughput and memory benchmark for every generator stage and output writer.
+#
+#   python -m benchmarks.bench                                  # 1k/10k/100k POs, both engines
+#   python -m benchmarks.bench --scales 1000 10000 --output benchmarks/results.json
+#   python -m benchmarks.bench --compare benchmarks/baseline.json --threshold 0.2
+#
+# Each engine and scale runs in a fresh process with a fixed seed and the rate limiter disabled.
+# Stages run like the staged pipeline (chunk by chunk, seeded per stage and chunk); writers write
+# that scale's POs, invoices and payments. Peak RSS is the process high-water mark during the
+# stage, reset before it where Linux allows (/proc/self/clear_refs), and includes the stage inputs.
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DEFAULT_SCALES = [1000, 10000, 100000]
+DEFAULT_ENGINES = ["numpy", "python"]
+DEFAULT_FORMATS = ["csv", "jsonl", "json", "parquet", "sqlite"]
+# Metric -> +1 when higher is better, -1 when lower is better
+COMPARED_METRICS = {"records_per_sec": 1, "bytes_per_sec": 1, "peak_rss_mb": -1}
+
+
+def bench_config(engine: str, scale: int, seed: int) -> CompiledConfig:
+    with open(PROJECT_ROOT / "config" / "config.yaml", 'r') as file:
+        raw = yaml.safe_load(file)
+    raw['general'].update(engine=engine, seed=seed, max_operations_per_second=None, workers=1,
+                          compression=None, checkpoint_dir=None)
+    raw['purchase_orders']['total_count'] = scale
+    return compile_config(raw)
+
+
+def _reset_peak_rss() -> bool:
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS; it cannot be reset
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _directory_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(directory) for name in names)
+
+
+def _measure(results: List[Dict], entry: Dict, action: Callable, count: Callable = len,
+             output_dir: Optional[str] = None):
+    # Runs action() once and records its throughput; count(value) is the number of records produced
+    gc.collect()
+    _reset_peak_rss()
+    start = time.perf_counter()
+    value = action()
+    seconds = time.perf_counter() - start
+    records = count(value)
+    entry.update(records=records, seconds=round(seconds, 4), records_per_sec=round(records / seconds, 1),
+                 peak_rss_mb=round(_peak_rss_mb(), 1))
+    if output_dir is not None:
+        size = _directory_bytes(output_dir)
+        entry.update(output_bytes=size, bytes_per_sec=round(size / seconds, 1))
+    results.append(entry)
+    return value
+
+
+def run_scale(engine: str, scale: int, seed: int, formats: List[str]) -> List[Dict]:
+    config = bench_config(engine, scale, seed)
+    description_generator = DescriptionGenerator(PROJECT_ROOT / "config" / "description_config.yaml")
+    configure_id_allocation(seed, digits=config.id_digits)
+    results = []
+
+    def entry(stage: str) -> Dict:
+        return {"stage": stage, "engine": engine, "scale": scale}
+
+    def vendors_stage():
+        seed_generators(derive_seed(seed, 'vendors'))
+        return generate_vendors(config, description_generator)
+
+    vendors = _measure(results, entry("vendors"), vendors_stage)
+    catalog = _measure(results, entry("catalog"), lambda: generate_catalog(config, description_generator, seed),
+                       count=lambda catalog: len(catalog.items))
+
+    runner = StageRunner(config, vendors, catalog, derive_seed(seed, 'transactions'))
+    sources = list(enumerate(chunk_counts(scale, config['general'].get('chunk_size', 1000))))
+    stage_records = {}
+    for stage in ("purchase_orders", "invoices", "payments"):
+        chunks = _measure(results, entry(stage),
+                          lambda: [runner.run(stage, chunk_index, source) for chunk_index, source in sources],
+                          count=lambda chunks: sum(map(len, chunks)))
+        stage_records[stage] = [record for chunk in chunks for record in chunk]
+        sources = list(enumerate(chunks))
+    del sources, chunks
+
+    total = sum(len(records) for records in stage_records.values())
+    for output_format in formats:
+        if output_format == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                continue
+        output_dir = tempfile.mkdtemp(prefix="ap_bench_")
+        options = writer_options(config, output_format)
+
+        def write_stage():
+            for entity, records in stage_records.items():
+                write_data(records, os.path.join(output_dir, entity), output_format, options)
+            return None
+
+        try:
+            _measure(results, entry(f"write_{output_format}"), write_stage, count=lambda _: total,
+                     output_dir=output_dir)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def run_benchmarks(scales: List[int], engines: List[str], formats: List[str], seed: int) -> Dict:
+    results = []
+    # A fresh interpreter per engine and scale keeps peak RSS and warm caches independent
+    context = get_context('spawn')
+    for engine in engines:
+        for scale in scales:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                scale_results = executor.submit(run_scale, engine, scale, seed, formats).result()
+            for result in scale_results:
+                print(_format_result(result), flush=True)
+            results.extend(scale_results)
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "processor": platform.processor(), "seed": seed},
+        "results": results,
+    }
+
+
+def _format_result(result: Dict) -> str:
+    line = (f"{result['engine']:>6} {result['scale']:>8} {result['stage']:<16} "
+            f"{result['records_per_sec']:>12.0f} rec/s {result['peak_rss_mb']:>9.1f} MB")
+    if 'bytes_per_sec' in result:
+        line += f" {result['bytes_per_sec'] / (1024 * 1024):>9.1f} MB/s"
+    return line
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    # A regression is a metric more than `threshold` (a fraction) worse than the baseline
+    stored = {(entry['engine'], entry['scale'], entry['stage']): entry for entry in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        reference = stored.get((entry['engine'], entry['scale'], entry['stage']))
+        if reference is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            if metric not in entry or not reference.get(metric):
+                continue
+            change = (entry[metric] - reference[metric]) / reference[metric] * direction
+            if change < -threshold:
+                regressions.append(f"{entry['engine']} {entry['scale']} {entry['stage']}: {metric} "
+                                   f"{reference[metric]} -> {entry[metric]} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the AP data generator stages and writers")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="PO counts to run")
+    parser.add_argument('--engines', nargs='+', default=DEFAULT_ENGINES, choices=DEFAULT_ENGINES)
+    parser.add_argument('--formats', nargs='+', default=DEFAULT_FORMATS, choices=DEFAULT_FORMATS)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default="benchmarks/results.json", help="where to write the results")
+    parser.add_argument('--compare', help="baseline results file; exit with status 1 on a regression")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed slowdown or memory growth against the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, args.engines, args.formats, args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+import random
+from typing import List, Iterable
+import numpy as np
+from src.config import CompiledConfig
+from src.catalog import ItemCatalog
+from src.po_generator import PurchaseOrderGenerator
+from src.invoice_generator import InvoiceGenerator
+from src.payment_generator import PaymentGenerator
+from src.records import Vendor, PurchaseOrder, LineItem, Invoice, InvoiceLine, Payment
+
+# The vectorized generators draw every numeric column for a whole chunk in a handful of NumPy calls
+# and only build the output records at the end. Every batch seeds its NumPy generator from the
+# `random` module, so seed_generators() before a chunk (as the pipelines do per stage and chunk)
+# controls it. Dates are int64 epoch-day columns, handed to the records as plain ints.
+
+
+def _new_rng() -> np.random.Generator:
+    return np.random.default_rng(random.getrandbits(64))
+
+
+def _pad(rows: List[List[int]]) -> np.ndarray:
+    # Ragged per-vendor/per-region choice lists as a dense table; rows are indexed below their length only
+    width = max(len(row) for row in rows)
+    table = np.zeros((len(rows), width), dtype=np.int64)
+    for index, row in enumerate(rows):
+        table[index, :len(row)] = row
+    return table
+
+
+def _pick(rng: np.random.Generator, table: np.ndarray, lengths: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    choice = (rng.random(len(rows)) * lengths[rows]).astype(np.int64)
+    return table[rows, choice]
+
+
+def _rate_table(config: CompiledConfig, rows: List[List[float]]) -> np.ndarray:
+    # Daily rates as an array indexed [..., day offset]; a single column when no rate changes over time
+    width = config.last_day - config.first_day + 1 if config.dated_rates else 1
+    return np.array([row[:width] for row in rows])
+
+
+class _BusinessDays:
+    # The region calendars of a config as lookup arrays, to move a whole column of days forward
+    # to the next business day of each row's region
+    def __init__(self, config: CompiledConfig):
+        self.config = config
+        self.region_index = {name: index for index, name in enumerate(config.region_names)}
+        self.tables = {self.region_index[name]: (calendar, np.array(calendar.next_open, dtype=np.int64))
+                       for name, calendar in config.calendars.items()}
+
+    def roll(self, regions: np.ndarray, days: np.ndarray) -> np.ndarray:
+        if not self.tables:
+            return days
+        days = days.copy()
+        offsets = days - self.config.first_day
+        for region, (calendar, table) in self.tables.items():
+            rows = regions == region
+            inside = rows & (offsets >= 0) & (offsets < len(table))
+            days[inside] = table[offsets[inside]]
+            for row in np.flatnonzero(rows & ~inside).tolist():
+                days[row] = calendar.roll(int(days[row]))
+        return days
+
+
+def _segment_sum(values: np.ndarray, segments: np.ndarray, count: int) -> np.ndarray:
+    return np.bincount(segments, weights=values, minlength=count)
+
+
+class VectorizedPurchaseOrderGenerator(PurchaseOrderGenerator):
+    def __init__(self, config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog):
+        super().__init__(config, vendors, catalog)
+
+        config = self.config
+        self.region_names = config.region_names
+        self.categories = config.categories
+        region_index = {name: index for index, name in enumerate(self.region_names)}
+        category_index = {name: index for index, name in enumerate(self.categories)}
+
+        currencies = sorted({currency for region in config.regions.values() for currency in region.currencies})
+        self.currencies = currencies
+        currency_index = {name: index for index, name in enumerate(currencies)}
+        # [currency, day] and [region, category, day] rate tables, indexed by the PO date
+        self.fx_rates = _rate_table(config, [config.daily_fx_rates[currency] for currency in currencies])
+
+        vendor_regions = [[region_index[name] for name in vendor.regions] for vendor in vendors]
+        self.vendor_regions = _pad(vendor_regions)
+        self.vendor_region_counts = np.array([len(row) for row in vendor_regions])
+        vendor_categories = [[category_index[name] for name in vendor.specializations] for vendor in vendors]
+        self.vendor_categories = _pad(vendor_categories)
+        self.vendor_category_counts = np.array([len(row) for row in vendor_categories])
+
+        region_currencies = [[currency_index[name] for name in region.currencies] for region in config.regions.values()]
+        self.region_currencies = _pad(region_currencies)
+        self.region_currency_counts = np.array([len(row) for row in region_currencies])
+        self.region_countries = [region.countries for region in config.regions.values()]
+        self.region_country_counts = np.array([len(countries) for countries in self.region_countries])
+
+        # SKUs grouped by category: a line's SKU is an offset into its category's block
+        self.skus = [sku for category in self.categories for sku in catalog.by_category[category]]
+        sku_counts = [len(catalog.by_category[category]) for category in self.categories]
+        self.category_sku_counts = np.array(sku_counts)
+        self.category_sku_offsets = np.concatenate(([0], np.cumsum(sku_counts)[:-1]))
+        self.sku_base_prices = np.array([sku.base_price for sku in self.skus])
+
+        self.tax_rates = np.array([_rate_table(config, [config.daily_tax_rates[region, category]
+                                                        for category in self.categories])
+                                   for region in self.region_names])
+
+    def generate_batch(self, count: int) -> List[PurchaseOrder]:
+        self.rate_limiter.acquire(count)
+        rng = _new_rng()
+
+        if self.vendor_table is None:
+            vendor_idx = rng.integers(0, len(self.vendors), count)
+        else:
+            vendor_idx = self.vendor_table.draw_many(count, rng)
+        region_idx = _pick(rng, self.vendor_regions, self.vendor_region_counts, vendor_idx)
+        if self.date_table is None:
+            po_days = self.config.first_day + rng.integers(0, self.span_seconds + 1, count) // 86400
+        else:
+            po_days = self.config.first_day + self.date_table.draw_many(count, rng)
+        rate_days = np.minimum(po_days - self.config.first_day, self.fx_rates.shape[1] - 1)
+        currency_idx = _pick(rng, self.region_currencies, self.region_currency_counts, region_idx)
+        shipping_country = (rng.random(count) * self.region_country_counts[region_idx]).astype(np.int64).tolist()
+        billing_country = (rng.random(count) * self.region_country_counts[region_idx]).astype(np.int64).tolist()
+        note_idx = rng.integers(0, len(self.NOTES), count).tolist()
+
+        # Line items for the whole chunk, flattened and tagged with their PO's position
+        item_counts = rng.integers(self.config['purchase_orders']['min_items'],
+                                   self.config['purchase_orders']['max_items'] + 1, count)
+        item_po = np.repeat(np.arange(count), item_counts)
+        total_items = len(item_po)
+        item_vendor = vendor_idx[item_po]
+        if self.category_mix is None:
+            item_category = _pick(rng, self.vendor_categories, self.vendor_category_counts, item_vendor)
+        else:
+            columns = self.category_mix.draw_many(self.vendor_category_counts[item_vendor], rng)
+            item_category = self.vendor_categories[item_vendor, columns]
+        item_sku = (self.category_sku_offsets[item_category]
+                    + (rng.random(total_items) * self.category_sku_counts[item_category]).astype(np.int64))
+        quantities = rng.integers(1, 101, total_items)
+        variation = self.catalog.price_variation
+        price_factors = rng.uniform(1 - variation, 1 + variation, total_items)
+        item_rate_days = rate_days[item_po]
+        unit_prices = np.round(self.sku_base_prices[item_sku] * price_factors
+                               * self.fx_rates[currency_idx[item_po], item_rate_days], 2)
+        total_prices = quantities * unit_prices
+        tax_rates = self.tax_rates[region_idx[item_po], item_category, item_rate_days]
+        tax_amounts = total_prices * tax_rates
+        po_totals = _segment_sum(total_prices, item_po, count).tolist()
+        po_numbers = self.po_numbers.next_ids(count)
+
+        quantities = quantities.tolist()
+        unit_prices = unit_prices.tolist()
+        total_prices = total_prices.tolist()
+        tax_rates = tax_rates.tolist()
+        tax_amounts = tax_amounts.tolist()
+        item_sku = item_sku.tolist()
+        vendor_idx = vendor_idx.tolist()
+        region_idx = region_idx.tolist()
+        currency_idx = currency_idx.tolist()
+        po_days = po_days.tolist()
+
+        purchase_orders = []
+        position = 0
+        for index, item_count in enumerate(item_counts.tolist()):
+            vendor = self.vendors[vendor_idx[index]]
+            region = region_idx[index]
+            currency = self.currencies[currency_idx[index]]
+            items = []
+            for line in range(position, position + item_count):
+                items.append(LineItem(self.skus[item_sku[line]], quantities[line], unit_prices[line],
+                                      total_prices[line], currency, tax_rates[line], tax_amounts[line]))
+            position += item_count
+
+            countries = self.region_countries[region]
+            purchase_orders.append(PurchaseOrder(
+                po_number=po_numbers[index],
+                vendor_id=vendor.vendor_id,
+                vendor_name=vendor.name,
+                region=self.region_names[region],
+                po_date=po_days[index],
+                currency=currency,
+                items=items,
+                status="Open",
+                shipping_address=f"123 Business St, Anytown, {countries[shipping_country[index]]}",
+                billing_address=f"123 Business St, Anytown, {countries[billing_country[index]]}",
+                terms_and_conditions=f"Net {vendor.payment_terms}",
+                notes=self.NOTES[note_idx[index]],
+                total_amount=po_totals[index]
+            ))
+
+        return purchase_orders
+
+
+class VectorizedInvoiceGenerator(InvoiceGenerator):
+    def __init__(self, config: CompiledConfig, purchase_orders: Iterable[PurchaseOrder] = ()):
+        super().__init__(config, purchase_orders)
+        self.statuses = self.config.invoice_statuses.population
+        self.invoice_count_values = np.array(self.INVOICE_COUNTS)
+        self.block_reasons = self.config['invoices']['block_reasons']
+        self.business_days = _BusinessDays(self.config)
+
+    def generate_batch(self, purchase_orders: Iterable[PurchaseOrder]) -> List[Invoice]:
+        purchase_orders = list(purchase_orders)
+        po_count = len(purchase_orders)
+        if po_count == 0:
+            return []
+        self.rate_limiter.acquire(po_count)
+        rng = _new_rng()
+
+        invoice_counts = self.invoice_count_values[self.invoice_counts.draw_many(po_count, rng)]
+        invoice_po = np.repeat(np.arange(po_count), invoice_counts)
+        invoice_total = len(invoice_po)
+
+        po_days = np.array([po.po_day for po in purchase_orders], dtype=np.int64)
+        po_terms_days = np.array([self._parse_terms_days(po.terms_and_conditions) for po in purchase_orders])
+        po_regions = np.array([self.business_days.region_index[po.region] for po in purchase_orders])
+        invoice_days = po_days[invoice_po] + rng.integers(1, 31, invoice_total)
+        due_days = self.business_days.roll(po_regions[invoice_po], invoice_days + po_terms_days[invoice_po])
+
+        # Every invoice covers the lines of its PO; flatten those (invoice, PO line) pairs
+        po_line_counts = np.array([len(po.items) for po in purchase_orders])
+        po_line_offsets = np.concatenate(([0], np.cumsum(po_line_counts)[:-1]))
+        po_lines = [item for po in purchase_orders for item in po.items]
+        po_quantities = np.array([item.quantity for item in po_lines], dtype=np.int64)
+        po_unit_prices = np.array([item.unit_price for item in po_lines], dtype=np.float64)
+        po_tax_rates = np.array([item.tax_rate for item in po_lines], dtype=np.float64)
+
+        line_counts = po_line_counts[invoice_po]
+        line_invoice = np.repeat(np.arange(invoice_total), line_counts)
+        line_starts = np.concatenate(([0], np.cumsum(line_counts)[:-1]))
+        line_source = (po_line_offsets[invoice_po][line_invoice]
+                       + np.arange(len(line_invoice)) - line_starts[line_invoice])
+        line_total = len(line_source)
+
+        included = rng.random(line_total) < 0.95
+        price_changed = rng.random(line_total) < 0.1
+        price_factors = rng.uniform(0.95, 1.05, line_total)
+        quantity_changed = rng.random(line_total) < 0.05
+        quantity_deltas = rng.choice([-1, 1], size=line_total)
+
+        unit_prices = po_unit_prices[line_source]
+        unit_prices = np.where(price_changed, np.round(unit_prices * price_factors, 2), unit_prices)
+        quantities = po_quantities[line_source]
+        quantities = np.where(quantity_changed, np.maximum(1, quantities + quantity_deltas), quantities)
+        total_prices = quantities * unit_prices
+        tax_amounts = total_prices * po_tax_rates[line_source]
+
+        subtotals = _segment_sum(np.where(included, total_prices, 0.0), line_invoice, invoice_total)
+        tax_totals = _segment_sum(np.where(included, tax_amounts, 0.0), line_invoice, invoice_total)
+        totals = subtotals + tax_totals
+
+        invoice_numbers = self.invoice_numbers.next_ids(invoice_total)
+        status_idx = self.config.invoice_statuses.draw_many(invoice_total, rng).tolist()
+        note_idx = rng.integers(0, len(self.NOTES), invoice_total).tolist()
+        block_idx = rng.integers(0, len(self.block_reasons), invoice_total).tolist()
+        has_grir = (rng.random(invoice_total) < self.config['invoices']['grir_probability']).tolist()
+        grir_idx = rng.integers(0, len(self.GRIR_ISSUES), invoice_total).tolist()
+
+        invoice_days = invoice_days.tolist()
+        due_days = due_days.tolist()
+        invoice_po = invoice_po.tolist()
+        line_counts = line_counts.tolist()
+        line_source = line_source.tolist()
+        included = included.tolist()
+        price_changed = price_changed.tolist()
+        quantity_changed = quantity_changed.tolist()
+        unit_prices = unit_prices.tolist()
+        quantities = quantities.tolist()
+        subtotals = subtotals.tolist()
+        tax_totals = tax_totals.tolist()
+        totals = totals.tolist()
+
+        invoices = []
+        position = 0
+        for index in range(invoice_total):
+            po = purchase_orders[invoice_po[index]]
+            items = []
+            for line in range(position, position + line_counts[index]):
+                if not included[line]:
+                    continue
+                items.append(InvoiceLine(po_lines[line_source[line]],
+                                         unit_prices[line] if price_changed[line] else None,
+                                         quantities[line] if quantity_changed[line] else None))
+            position += line_counts[index]
+
+            status = self.statuses[status_idx[index]]
+            invoices.append(Invoice(
+                invoice_number=invoice_numbers[index],
+                po_number=po.po_number,
+                vendor_id=po.vendor_id,
+                vendor_name=po.vendor_name,
+                region=po.region,
+                invoice_date=invoice_days[index],
+                due_date=due_days[index],
+                currency=po.currency,
+                items=items,
+                subtotal=subtotals[index],
+                tax_amount=tax_totals[index],
+                total_amount=totals[index],
+                status=status,
+                payment_terms=po.terms_and_conditions,
+                notes=self.NOTES[note_idx[index]],
+                block_reason=self.block_reasons[block_idx[index]] if status == 'Blocked' else None,
+                grir_issue=self.GRIR_ISSUES[grir_idx[index]] if has_grir[index] else None
+            ))
+
+        return invoices
+
+
+class VectorizedPaymentGenerator(PaymentGenerator):
+    def __init__(self, config: CompiledConfig, invoices: Iterable[Invoice] = ()):
+        super().__init__(config, invoices)
+        self.methods = self.config['payments']['methods']
+        self.business_days = _BusinessDays(self.config)
+
+    def generate_batch(self, invoices: Iterable[Invoice]) -> List[Payment]:
+        invoices = list(invoices)
+        self.rate_limiter.acquire(len(invoices))
+        invoices = [invoice for invoice in invoices if invoice.status in self.PAID_STATUSES]
+        count = len(invoices)
+        if count == 0:
+            return []
+        rng = _new_rng()
+
+        invoice_days = np.array([invoice.invoice_day for invoice in invoices], dtype=np.int64)
+        due_days = np.array([invoice.due_day for invoice in invoices], dtype=np.int64)
+        totals = np.array([invoice.total_amount for invoice in invoices], dtype=np.float64)
+        has_discount_terms = np.array(["2% 10" in invoice.payment_terms for invoice in invoices])
+
+        # Simulate early, on-time, and late payments; early and late ones go out on business days
+        scenarios = self.payment_scenarios.draw_many(count, rng)
+        terms_span = due_days - invoice_days
+        early_offsets = 1 + (rng.random(count) * np.maximum(terms_span - 1, 1)).astype(np.int64)
+        late_offsets = rng.integers(1, 31, count)
+        payment_days = np.where(scenarios == 0, invoice_days + early_offsets, due_days + late_offsets)
+        if self.business_days.tables:
+            regions = np.array([self.business_days.region_index[invoice.region] for invoice in invoices])
+            payment_days = self.business_days.roll(regions, payment_days)
+        payment_days = np.where(scenarios == 1, due_days, payment_days)
+
+        # Apply early payment discount if applicable, then simulate partial payments
+        days_after_invoice = payment_days - invoice_days
+        discount_applied = has_discount_terms & (days_after_invoice <= 10)
+        amounts = np.where(discount_applied, np.round(totals * 0.98, 2), totals)
+        partial = rng.random(count) < 0.1
+        partial_factors = rng.uniform(0.5, 0.99, count)
+        amounts = np.where(partial, np.round(amounts * partial_factors, 2), amounts)
+
+        payment_ids = self.payment_ids.next_ids(count)
+        method_idx = rng.integers(0, len(self.methods), count).tolist()
+        is_early = (payment_days < due_days).tolist()
+        is_late = (payment_days > due_days).tolist()
+        payment_days = payment_days.tolist()
+        discount_applied = discount_applied.tolist()
+        amounts = amounts.tolist()
+
+        payments = []
+        for index, invoice in enumerate(invoices):
+            amount = amounts[index]
+            payments.append(Payment(
+                payment_id=payment_ids[index],
+                invoice_number=invoice.invoice_number,
+                po_number=invoice.po_number,
+                vendor_id=invoice.vendor_id,
+                vendor_name=invoice.vendor_name,
+                region=invoice.region,
+                payment_date=payment_days[index],
+                amount=amount,
+                currency=invoice.currency,
+                payment_method=self.methods[method_idx[index]],
+                status="Completed" if amount == invoice.total_amount else "Partial",
+                notes=self._compose_payment_notes(is_early[index], is_late[index], discount_applied[index],
+                                                  invoice.total_amount - amount, invoice.currency)
+            ))
+
+        return payments
@@ -0,0 +1,64 @@
+import random
+import sys
+from typing import List, Dict, Optional
+from src.config import CompiledConfig, compile_config
+from src.description_generator import DescriptionGenerator
+from src.records import CatalogItem
+from src.utils.id_allocator import get_id_allocator
+from src.utils.metrics import track
+from src.utils.seeding import derive_seed, seed_generators
+
+
+class ItemCatalog:
+    # Fixed SKU master: items.items_per_category SKUs per category, each with a description, brand,
+    # model and USD base price rendered once. Line items reference a SKU and vary its price by up to
+    # items.price_variation, so the same products are bought again and again.
+    def __init__(self, items: List[CatalogItem], price_variation: float):
+        self.items = items
+        self.price_variation = price_variation
+        self.by_category: Dict[str, List[CatalogItem]] = {}
+        for item in items:
+            self.by_category.setdefault(item.category, []).append(item)
+
+    def pick(self, category: str) -> CatalogItem:
+        return random.choice(self.by_category[category])
+
+    def unit_price(self, sku: CatalogItem, exchange_rate: float) -> float:
+        variation = random.uniform(1 - self.price_variation, 1 + self.price_variation)
+        return round(sku.base_price * variation * exchange_rate, 2)
+
+
+class CatalogGenerator:
+    def __init__(self, config: CompiledConfig, description_generator: DescriptionGenerator):
+        self.config = compile_config(config)
+        self.description_generator = description_generator
+        self.item_numbers = get_id_allocator('item')
+
+    def generate_catalog(self) -> ItemCatalog:
+        per_category = self.config['items']['items_per_category']
+        with track("stage.catalog") as section:
+            items = [self._generate_single_item(category)
+                     for category in self.config.categories for _ in range(per_category)]
+            section.add(rows=len(items))
+        return ItemCatalog(items, self.config['items'].get('price_variation', 0))
+
+    def _generate_single_item(self, category: str) -> CatalogItem:
+        item_desc = self.description_generator.generate_item_description(category)
+        # Interned so every structure holding these strings shares a single copy
+        return CatalogItem(
+            item_number=self.item_numbers.next_id(),
+            description=sys.intern(item_desc['description']),
+            category=sys.intern(category),
+            brand=sys.intern(item_desc['brand']),
+            model=sys.intern(item_desc['model']),
+            base_price=round(random.uniform(10, 1000), 2)
+        )
+
+
+def generate_catalog(config: CompiledConfig, description_generator: DescriptionGenerator,
+                     master_seed: Optional[int] = None) -> ItemCatalog:
+    if master_seed is not None:
+        # The catalog has its own random stream, like the vendor master
+        seed_generators(derive_seed(master_seed, 'catalog'))
+    generator = CatalogGenerator(config, description_generator)
+    return generator.generate_catalog()
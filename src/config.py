@@ -0,0 +1,326 @@
+from collections.abc import Mapping
+from datetime import date, datetime
+from typing import List, Dict, NamedTuple, Optional, Sequence, Tuple, Union
+from src.utils.dates import BusinessCalendar, daily_values, to_day
+from src.utils.id_allocator import ID_FORMATS
+from src.utils.sampling import AliasTable
+
+OUTPUT_FORMATS = ("csv", "jsonl", "json", "parquet", "sqlite")
+ENGINES = ("numpy", "python")
+DISTRIBUTIONS = ("uniform", "zipf")
+SEEDING_MODES = ("chunk", "record")
+# Invoice and payment counters each PO reserves under record seeding; must equal the largest of
+# InvoiceGenerator.INVOICE_COUNTS, which src/invoice_generator.py asserts on import
+RECORD_INVOICES_PER_PO = 3
+# Business-day calendars reach this far past general.end_date, which covers due and payment dates
+CALENDAR_MARGIN_DAYS = 400
+REQUIRED_SECTIONS = ("general", "regions", "vendors", "items", "purchase_orders", "invoices", "payments",
+                     "exchange_rates")
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class WeightedChoice:
+    # A population with its weights compiled once into an alias table, so choice() costs one
+    # random number and a comparison however many entries there are; draw_many() draws a chunk's
+    # positions in the population at once with a NumPy Generator.
+    def __init__(self, population: Sequence, weights: Optional[Sequence[float]] = None):
+        self.population = list(population)
+        self.weights = [1.0] * len(self.population) if weights is None else list(weights)
+        if not self.population or len(self.weights) != len(self.population):
+            raise ConfigError("Weighted choice needs one weight per (non-empty) population entry")
+        self.total = sum(self.weights) + 0.0
+        if self.total <= 0.0 or any(weight < 0 for weight in self.weights):
+            raise ConfigError("Weights must be non-negative with a positive total")
+        self.table = AliasTable(self.weights)
+
+    def choice(self):
+        return self.population[self.table.draw()]
+
+    def draw_many(self, count: int, rng):
+        return self.table.draw_many(count, rng)
+
+    @property
+    def probabilities(self) -> List[float]:
+        return [weight / self.total for weight in self.weights]
+
+
+class RegionTable(NamedTuple):
+    name: str
+    countries: List[str]
+    currencies: List[str]
+    # Category -> tax rate, with by_category overrides already applied over the default
+    tax_rates: Dict[str, float]
+
+
+class CompiledConfig(Mapping):
+    # config.yaml validated once and indexed for the lookups generators make per record.
+    # It is still a read-only mapping over the raw YAML, so config['section'][...] keeps working.
+    def __init__(self, raw: Dict):
+        validate_config(raw)
+        self.raw = raw
+        self.start_date = datetime.strptime(raw['general']['start_date'], "%Y-%m-%d")
+        self.end_date = datetime.strptime(raw['general']['end_date'], "%Y-%m-%d")
+        self.categories = list(raw['items']['categories'])
+        self.fx_rates = dict(raw['exchange_rates']['rates'])
+
+        self.regions: Dict[str, RegionTable] = {}
+        self.tax_rates: Dict[Tuple[str, str], float] = {}
+        for region in raw['regions']:
+            rates = _category_tax_rates(region['tax_rates'], self.categories)
+            self.regions[region['name']] = RegionTable(region['name'], list(region['countries']),
+                                                       list(region['currencies']), rates)
+            for category, rate in rates.items():
+                self.tax_rates[region['name'], category] = rate
+        self.region_names = list(self.regions)
+
+        # Daily FX and tax rates over the PO date range (the dates lines are priced and taxed on),
+        # so a lookup by transaction date is list indexing. Effective-dated `history` entries
+        # change a rate from their date on; without them every day holds the static rate.
+        self.first_day = to_day(self.start_date)
+        self.last_day = to_day(self.end_date)
+        fx_history = raw['exchange_rates'].get('history') or {}
+        tax_histories = [region['tax_rates'].get('history') for region in raw['regions']]
+        # False when every rate is static, so rate tables need no day dimension
+        self.dated_rates = bool(fx_history) or any(tax_histories)
+        self.daily_fx_rates = {currency: daily_values(rate, fx_history.get(currency), self.first_day, self.last_day)
+                               for currency, rate in self.fx_rates.items()}
+        self.daily_tax_rates: Dict[Tuple[str, str], List[float]] = {}
+        self.calendars: Dict[str, BusinessCalendar] = {}
+        for region in raw['regions']:
+            name = region['name']
+            history = {effective: _category_tax_rates(rates, self.categories)
+                       for effective, rates in (region['tax_rates'].get('history') or {}).items()}
+            daily = daily_values(self.regions[name].tax_rates, history, self.first_day, self.last_day)
+            for category in self.categories:
+                self.daily_tax_rates[name, category] = [rates[category] for rates in daily]
+            calendar = region.get('calendar')
+            if calendar:
+                self.calendars[name] = BusinessCalendar(calendar.get('weekend') or [], calendar.get('holidays') or [],
+                                                        self.first_day, self.last_day + CALENDAR_MARGIN_DAYS)
+
+        # Digits per document number, over the defaults in ID_FORMATS
+        self.id_digits = {entity: digits for entity, (_, digits) in ID_FORMATS.items()}
+        self.id_digits.update((raw.get('ids') or {}).get('digits') or {})
+
+        invoices = raw['invoices']
+        self.invoice_statuses = WeightedChoice(invoices['statuses'], invoices.get('status_weights'))
+
+    def day_offset(self, day: int) -> int:
+        # Position of an epoch day in the daily tables; days outside the range take its first or last day
+        return min(max(day - self.first_day, 0), self.last_day - self.first_day)
+
+    def fx_rate(self, currency: str, day: Optional[int] = None) -> float:
+        if day is None:
+            return self.fx_rates[currency]
+        return self.daily_fx_rates[currency][self.day_offset(day)]
+
+    def tax_rate(self, category: str, region: str, day: Optional[int] = None) -> float:
+        if day is None:
+            return self.tax_rates[region, category]
+        return self.daily_tax_rates[region, category][self.day_offset(day)]
+
+    def business_day(self, region: str, day: int) -> int:
+        # The day itself, or the next business day of the region's calendar
+        calendar = self.calendars.get(region)
+        return day if calendar is None else calendar.roll(day)
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+
+def _category_tax_rates(tax_rates: Dict, categories: List[str]) -> Dict[str, float]:
+    by_category = tax_rates.get('by_category') or {}
+    # Flat "<category>: rate" entries next to default are accepted as well
+    return {category: by_category.get(category, tax_rates.get(category, tax_rates['default']))
+            for category in categories}
+
+
+def _is_date(value) -> bool:
+    # YAML reads unquoted dates as date objects
+    if isinstance(value, date):
+        return True
+    try:
+        date.fromisoformat(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _check_tax_rates(errors: List[str], label: str, tax_rates: Dict, categories: List[str]):
+    if 'default' not in tax_rates:
+        errors.append(f"{label} has no default tax rate")
+    by_category = tax_rates.get('by_category') or {}
+    for category in by_category:
+        if category not in categories:
+            errors.append(f"{label} has a tax rate for unknown category '{category}'")
+    for rate in [tax_rates.get('default', 0)] + list(by_category.values()):
+        if not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+            errors.append(f"{label} has a tax rate outside [0, 1]")
+
+
+def compile_config(config: Union[Dict, CompiledConfig]) -> CompiledConfig:
+    if isinstance(config, CompiledConfig):
+        return config
+    return CompiledConfig(config)
+
+
+def validate_config(raw: Dict):
+    # Collects every problem so a bad config.yaml is reported in one go, before any generation
+    errors = [f"missing section '{section}'" for section in REQUIRED_SECTIONS if section not in (raw or {})]
+    if errors:
+        raise ConfigError("Invalid configuration: " + "; ".join(errors))
+
+    general = raw['general']
+    try:
+        start = datetime.strptime(general['start_date'], "%Y-%m-%d")
+        end = datetime.strptime(general['end_date'], "%Y-%m-%d")
+        if end < start:
+            errors.append("general.end_date is before general.start_date")
+    except (KeyError, TypeError, ValueError):
+        errors.append("general.start_date and general.end_date must be YYYY-MM-DD dates")
+    if general.get('output_format') not in OUTPUT_FORMATS:
+        errors.append(f"general.output_format must be one of {', '.join(OUTPUT_FORMATS)}")
+    if general.get('engine', 'python') not in ENGINES:
+        errors.append(f"general.engine must be one of {', '.join(ENGINES)}")
+    if general.get('seeding', 'chunk') not in SEEDING_MODES:
+        errors.append(f"general.seeding must be one of {', '.join(SEEDING_MODES)}")
+
+    categories = raw['items'].get('categories') or []
+    if not categories:
+        errors.append("items.categories is empty")
+    items_per_category = raw['items'].get('items_per_category')
+    if not isinstance(items_per_category, int) or items_per_category < 1:
+        errors.append("items.items_per_category must be a positive integer")
+        items_per_category = 0
+    if not 0 <= raw['items'].get('price_variation', 0) < 1:
+        errors.append("items.price_variation must be within [0, 1)")
+    rates = raw['exchange_rates'].get('rates') or {}
+    for currency, rate in rates.items():
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            errors.append(f"exchange rate for {currency} must be positive")
+    for currency, history in (raw['exchange_rates'].get('history') or {}).items():
+        if currency not in rates:
+            errors.append(f"exchange_rates.history has unknown currency {currency}")
+        for effective, rate in (history or {}).items():
+            if not _is_date(effective) or not isinstance(rate, (int, float)) or rate <= 0:
+                errors.append(f"exchange_rates.history.{currency} needs YYYY-MM-DD dates with positive rates")
+
+    names = set()
+    for region in raw['regions'] or []:
+        name = region.get('name')
+        if name in names:
+            errors.append(f"region '{name}' is defined twice")
+        names.add(name)
+        if not region.get('countries'):
+            errors.append(f"region '{name}' has no countries")
+        if not region.get('currencies'):
+            errors.append(f"region '{name}' has no currencies")
+        for currency in region.get('currencies') or []:
+            if currency not in rates:
+                errors.append(f"region '{name}' uses currency {currency} without an exchange rate")
+        tax_rates = region.get('tax_rates') or {}
+        _check_tax_rates(errors, f"region '{name}'", tax_rates, categories)
+        for effective, history_rates in (tax_rates.get('history') or {}).items():
+            if not _is_date(effective):
+                errors.append(f"region '{name}' has a tax rate history date that is not YYYY-MM-DD")
+            _check_tax_rates(errors, f"region '{name}' tax rate history", history_rates or {}, categories)
+        calendar = region.get('calendar') or {}
+        weekend = calendar.get('weekend') or []
+        if any(day not in range(7) for day in weekend) or len(set(weekend)) == 7:
+            errors.append(f"region '{name}' calendar.weekend must list weekdays 0 (Monday) to 6, not all of them")
+        if not all(_is_date(holiday) for holiday in calendar.get('holidays') or []):
+            errors.append(f"region '{name}' calendar.holidays must be YYYY-MM-DD dates")
+    if not names:
+        errors.append("no regions configured")
+
+    if not raw['vendors'].get('payment_terms'):
+        errors.append("vendors.payment_terms is empty")
+    pool_size = raw['vendors'].get('attribute_pool_size', 0)
+    if pool_size is not None and (not isinstance(pool_size, int) or pool_size < 0):
+        errors.append("vendors.attribute_pool_size must be a non-negative integer")
+    single_region = (raw['vendors'].get('allowed_regions_distribution') or {}).get('single_region')
+    if not isinstance(single_region, (int, float)) or not 0 <= single_region <= 1:
+        errors.append("vendors.allowed_regions_distribution.single_region must be within [0, 1]")
+
+    purchase_orders = raw['purchase_orders']
+    if not 1 <= purchase_orders.get('min_items', 0) <= purchase_orders.get('max_items', 0):
+        errors.append("purchase_orders needs 1 <= min_items <= max_items")
+
+    invoices = raw['invoices']
+    if not invoices.get('statuses'):
+        errors.append("invoices.statuses is empty")
+    elif invoices.get('status_weights') is not None and \
+            len(invoices['status_weights']) != len(invoices['statuses']):
+        errors.append("invoices.status_weights needs one weight per status")
+    if not invoices.get('block_reasons'):
+        errors.append("invoices.block_reasons is empty")
+    if not 0 <= invoices.get('grir_probability', 0) <= 1:
+        errors.append("invoices.grir_probability must be within [0, 1]")
+    if not raw['payments'].get('methods'):
+        errors.append("payments.methods is empty")
+
+    sampling = raw.get('sampling') or {}
+    for name in ('vendor_popularity', 'category_mix'):
+        distribution = sampling.get(name) or {}
+        if distribution.get('distribution', 'uniform') not in DISTRIBUTIONS:
+            errors.append(f"sampling.{name}.distribution must be one of {', '.join(DISTRIBUTIONS)}")
+        exponent = distribution.get('exponent', 1.0)
+        if not isinstance(exponent, (int, float)) or exponent < 0:
+            errors.append(f"sampling.{name}.exponent must be a non-negative number")
+    seasonality = sampling.get('seasonality') or {}
+    for name, length in (('month_weights', 12), ('weekday_weights', 7)):
+        weights = seasonality.get(name)
+        if weights is not None and (not isinstance(weights, list) or len(weights) != length or
+                                    any(not isinstance(weight, (int, float)) or weight < 0 for weight in weights)):
+            errors.append(f"sampling.seasonality.{name} must be {length} non-negative numbers or null")
+
+    incremental = raw.get('incremental') or {}
+    window_days = incremental.get('window_days', 1)
+    if not isinstance(window_days, int) or window_days < 1:
+        errors.append("incremental.window_days must be a positive integer")
+    per_day = incremental.get('purchase_orders_per_day')
+    if per_day is not None and (not isinstance(per_day, (int, float)) or per_day < 0):
+        errors.append("incremental.purchase_orders_per_day must be a non-negative number or null")
+
+    interval = (raw.get('metrics') or {}).get('rss_sample_interval', 1.0)
+    if interval is not None and (not isinstance(interval, (int, float)) or interval <= 0):
+        errors.append("metrics.rss_sample_interval must be a positive number of seconds or null")
+
+    service = raw.get('service') or {}
+    for key in ('port', 'chunk_size', 'first_chunk_size', 'prefetch_chunks', 'max_count'):
+        if key in service and (not isinstance(service[key], int) or service[key] < 1):
+            errors.append(f"service.{key} must be a positive integer")
+    if service.get('workers') is not None and (not isinstance(service['workers'], int) or service['workers'] < 1):
+        errors.append("service.workers must be a positive integer or null")
+
+    digits = dict((entity, default) for entity, (_, default) in ID_FORMATS.items())
+    for entity, value in ((raw.get('ids') or {}).get('digits') or {}).items():
+        if entity not in ID_FORMATS:
+            errors.append(f"ids.digits has unknown entity '{entity}'")
+        elif not isinstance(value, int) or not 1 <= value <= 18:
+            errors.append(f"ids.digits.{entity} must be an integer from 1 to 18")
+        else:
+            digits[entity] = value
+    # Every vendor, PO and catalog item needs its own number; with record seeding every PO also
+    # reserves the counters for its largest possible number of invoices and payments
+    needed_numbers = [("vendor", raw['vendors'].get('total_count', 0)),
+                      ("purchase_order", purchase_orders.get('total_count', 0)),
+                      ("item", len(categories) * items_per_category)]
+    if general.get('seeding') == 'record':
+        reserved = purchase_orders.get('total_count', 0) * RECORD_INVOICES_PER_PO
+        needed_numbers += [("invoice", reserved), ("payment", reserved)]
+    for entity, needed in needed_numbers:
+        if needed > 9 * 10 ** (digits[entity] - 1):
+            errors.append(f"ids.digits.{entity} is too small for {needed} numbers")
+
+    if errors:
+        raise ConfigError("Invalid configuration: " + "; ".join(errors))
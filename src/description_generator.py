@@ -1,12 +1,9 @@
 import random
-import nltk
-from nltk.corpus import words
 import yaml
+from pathlib import Path
 from typing import List, Dict
-
-# Download required NLTK data
-nltk.download('words', quiet=True)
-nltk.download('averaged_perceptron_tagger', quiet=True)
+from src.lexicon import Lexicon
+from src.utils.metrics import hot_path
 
 
 class DescriptionGenerator:
@@ -22,13 +19,18 @@ class DescriptionGenerator:
         self.model_prefixes = self.config['model_prefixes']
         self.model_suffixes = self.config['model_suffixes']
 
-        self.word_list = set(words.words())
+        # Resolved relative to the project root, next to the config/ directory
+        lexicon_cache = Path(self.config.get('lexicon_cache', 'cache/lexicon.bin'))
+        if not lexicon_cache.is_absolute():
+            lexicon_cache = Path(config_path).resolve().parent.parent / lexicon_cache
+        self.lexicon = Lexicon(str(lexicon_cache))
 
     def generate_description(self, category: str) -> str:
         template = random.choice(self.templates[category])
         description = self._fill_template(template, category)
         return description
 
+    @hot_path("descriptions.fill_template")
     def _fill_template(self, template: str, category: str) -> str:
         words = template.split()
         filled_words = []
@@ -59,12 +61,11 @@ class DescriptionGenerator:
         number = random.randint(100, 9999)
         return f"{prefix}{number}{suffix}"
 
+    @hot_path("descriptions.random_word")
     def _generate_random_word(self, pos: str) -> str:
-        while True:
-            word = random.choice(list(self.word_list))
-            if nltk.pos_tag([word])[0][1].startswith(pos):
-                return word
+        return self.lexicon.random_word(pos)
 
+    @hot_path("descriptions.item_description")
     def generate_item_description(self, category: str) -> Dict[str, str]:
         description = self.generate_description(category)
         brand = random.choice(self.brand_names[category])
@@ -0,0 +1,116 @@
+import copy
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from datetime import datetime, timedelta
+from typing import List, Dict, Iterable, Tuple
+from src.config import CompiledConfig, compile_config
+from src.catalog import ItemCatalog
+from src.records import Vendor, Invoice, Payment
+from src.utils.dates import to_day
+
+STATE_VERSION = 1
+
+
+class StateError(RuntimeError):
+    pass
+
+
+class Backlog:
+    # Invoices and payments are generated together with their PO, but the ones dated on or after
+    # the end of the window being written have not happened yet. They wait here (and in the run
+    # state) until a later window reaches their date, so documents for earlier POs keep arriving.
+    # Records are compared by their epoch days.
+    def __init__(self):
+        self.window_end = None
+        self.invoices: List[Invoice] = []
+        self.payments: List[Payment] = []
+
+    def release(self, window_end: str) -> Tuple[List[Invoice], List[Payment]]:
+        # Starts the window ending at window_end and returns what falls due before it
+        self.window_end = to_day(window_end)
+        invoices, self.invoices = self._split(self.invoices, 'invoice_day')
+        payments, self.payments = self._split(self.payments, 'payment_day')
+        return invoices, payments
+
+    def hold(self, invoices: Iterable[Invoice], payments: Iterable[Payment]) -> Tuple[List[Invoice], List[Payment]]:
+        # Keeps the records dated after the current window and returns the rest for writing
+        due_invoices, later_invoices = self._split(invoices, 'invoice_day')
+        due_payments, later_payments = self._split(payments, 'payment_day')
+        self.invoices.extend(later_invoices)
+        self.payments.extend(later_payments)
+        return due_invoices, due_payments
+
+    def _split(self, records: Iterable, day_field: str) -> Tuple[List, List]:
+        due, later = [], []
+        for record in records:
+            (due if getattr(record, day_field) < self.window_end else later).append(record)
+        return due, later
+
+
+class RunState:
+    # Everything a continuation run needs from the runs before it: the master data it must keep
+    # referencing, where every document number counter stopped, and the held-back documents
+    def __init__(self, master_seed: int, config_key: str, end_date: str, run_index: int, vendors: List[Vendor],
+                 catalog: ItemCatalog, id_positions: Dict[str, int], backlog: Backlog):
+        self.master_seed = master_seed
+        self.config_key = config_key
+        self.end_date = end_date
+        self.run_index = run_index
+        self.vendors = vendors
+        self.catalog = catalog
+        self.id_positions = id_positions
+        self.backlog = backlog
+
+
+def state_config_key(config: CompiledConfig) -> str:
+    # Settings a dataset cannot change between windows: they shape the vendor master, catalog and
+    # document numbers, or the layout of the files being appended to
+    vendors = {key: value for key, value in config['vendors'].items() if key != 'cache_dir'}
+    general = {key: config['general'].get(key) for key in ('output_format', 'normalize_lines', 'compression')}
+    material = json.dumps([vendors, config['regions'], config['items'], config.id_digits, general],
+                          sort_keys=True, default=str)
+    return hashlib.blake2b(material.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_state(path: str, config: CompiledConfig) -> RunState:
+    if not os.path.exists(path):
+        raise StateError(f"No incremental state at {path}; run without --continue first to create the dataset")
+    with open(path, 'rb') as file:
+        version, state = pickle.load(file)
+    if version != STATE_VERSION:
+        raise StateError(f"{path} was written by an incompatible version of the generator")
+    if state.config_key != state_config_key(config):
+        raise StateError(f"{path} was written with different vendors, regions, items, ids or output settings; "
+                         f"restore them or start a new dataset")
+    return state
+
+
+def save_state(path: str, state: RunState):
+    # Written to a temporary file first so an interrupted run leaves the previous state intact
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        pickle.dump((STATE_VERSION, state), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def window_config(config: CompiledConfig, start_date: str, days: int) -> CompiledConfig:
+    # The config for one continuation window: general.start_date/end_date cover the window and
+    # purchase_orders.total_count is its share at incremental.purchase_orders_per_day (by default
+    # the average daily rate of the full configured range)
+    incremental = config.get('incremental') or {}
+    per_day = incremental.get('purchase_orders_per_day')
+    if per_day is None:
+        range_days = max((config.end_date - config.start_date).days, 1)
+        per_day = config['purchase_orders']['total_count'] / range_days
+    raw = copy.deepcopy(config.raw)
+    end_date = datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=days)
+    raw['general']['start_date'] = start_date
+    raw['general']['end_date'] = end_date.strftime("%Y-%m-%d")
+    raw['purchase_orders']['total_count'] = round(per_day * days)
+    return compile_config(raw)
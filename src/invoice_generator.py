@@ -1,129 +1,161 @@
+import functools
 import random
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import List, Dict, Iterable, Iterator
 from tqdm import tqdm
-from src.utils.rate_limiter import RateLimiter
+from src.config import RECORD_INVOICES_PER_PO, CompiledConfig, WeightedChoice, compile_config
+from src.records import PurchaseOrder, LineItem, Invoice, InvoiceLine
+from src.utils.id_allocator import get_id_allocator
+from src.utils.metrics import hot_path
+from src.utils.rate_limiter import get_rate_limiter
 
 
 class InvoiceGenerator:
-    def __init__(self, config: Dict, purchase_orders: List[Dict]):
-        self.config = config
+    INVOICE_COUNTS = [1, 2, 3]
+    INVOICE_COUNT_WEIGHTS = [0.8, 0.15, 0.05]
+    NOTES = [
+        "Please process for payment",
+        "Discount applied as per contract",
+        "Partial delivery - more to follow",
+        "Rush processing requested",
+        "Credit memo to follow for previous overcharge"
+    ]
+    GRIR_ISSUES = [
+        {"type": "Quantity Mismatch", "description": "Invoice quantity doesn't match goods received"},
+        {"type": "Price Mismatch", "description": "Unit price on invoice differs from PO price"},
+        {"type": "Missing Goods Receipt", "description": "No record of goods receipt in the system"},
+        {"type": "Delivery Date Mismatch", "description": "Invoice date is earlier than the delivery date"},
+    ]
+
+    def __init__(self, config: CompiledConfig, purchase_orders: Iterable[PurchaseOrder] = ()):
+        self.config = compile_config(config)
         self.purchase_orders = purchase_orders
-        self.rate_limiter = RateLimiter(config['general']['max_operations_per_second'])
+        self.rate_limiter = get_rate_limiter(config['general']['max_operations_per_second'])
+        self.invoice_numbers = get_id_allocator('invoice')
+        self.invoice_counts = WeightedChoice(self.INVOICE_COUNTS, self.INVOICE_COUNT_WEIGHTS)
 
-    def generate_invoices(self) -> List[Dict]:
-        invoices = []
+    def generate_invoices(self) -> List[Invoice]:
+        return list(self.iter_invoices())
+
+    def iter_invoices(self) -> Iterator[Invoice]:
         for po in tqdm(self.purchase_orders, desc="Generating Invoices"):
-            self.rate_limiter.limit()
-            invoice_count = self._determine_invoice_count(po)
-            for _ in range(invoice_count):
-                invoice = self._generate_single_invoice(po)
-                invoices.append(invoice)
+            self.rate_limiter.acquire()
+            yield from self._generate_po_invoices(po)
+
+    def generate_batch(self, purchase_orders: Iterable[PurchaseOrder]) -> List[Invoice]:
+        purchase_orders = list(purchase_orders)
+        self.rate_limiter.acquire(len(purchase_orders))
+        invoices = []
+        for po in purchase_orders:
+            invoices.extend(self._generate_po_invoices(po))
         return invoices
 
-    def _determine_invoice_count(self, po: Dict) -> int:
-        # Simulate scenarios where a PO might have multiple invoices
-        return random.choices([1, 2, 3], weights=[0.8, 0.15, 0.05])[0]
+    def _generate_po_invoices(self, po: PurchaseOrder) -> List[Invoice]:
+        invoice_count = self._determine_invoice_count(po)
+        return [self._generate_single_invoice(po) for _ in range(invoice_count)]
 
-    def _generate_single_invoice(self, po: Dict) -> Dict:
-        invoice_date = self._generate_invoice_date(po['po_date'])
-        items = self._generate_invoice_items(po['items'])
-        subtotal = sum(item['total_price'] for item in items)
-        tax_amount = sum(item['tax_amount'] for item in items)
+    def _determine_invoice_count(self, po: PurchaseOrder) -> int:
+        # Simulate scenarios where a PO might have multiple invoices
+        return self.invoice_counts.choice()
+
+    @hot_path("invoices.single_invoice")
+    def _generate_single_invoice(self, po: PurchaseOrder) -> Invoice:
+        invoice_day = self._generate_invoice_day(po.po_day)
+        items = self._generate_invoice_items(po.items)
+        subtotal = sum(item.total_price for item in items)
+        tax_amount = sum(item.tax_amount for item in items)
         total_amount = subtotal + tax_amount
 
-        invoice = {
-            "invoice_number": f"INV{random.randint(1000000, 9999999)}",
-            "po_number": po['po_number'],
-            "vendor_id": po['vendor_id'],
-            "vendor_name": po['vendor_name'],
-            "invoice_date": invoice_date.strftime("%Y-%m-%d"),
-            "due_date": self._calculate_due_date(invoice_date, po['terms_and_conditions']),
-            "currency": po['currency'],
-            "items": items,
-            "subtotal": subtotal,
-            "tax_amount": tax_amount,
-            "total_amount": total_amount,
-            "status": self._determine_invoice_status(),
-            "payment_terms": po['terms_and_conditions'],
-            "notes": self._generate_invoice_notes()
-        }
-
-        if invoice['status'] == 'Blocked':
-            invoice['block_reason'] = random.choice(self.config['invoices']['block_reasons'])
+        invoice = Invoice(
+            invoice_number=self.invoice_numbers.next_id(),
+            po_number=po.po_number,
+            vendor_id=po.vendor_id,
+            vendor_name=po.vendor_name,
+            region=po.region,
+            invoice_date=invoice_day,
+            due_date=self._calculate_due_day(invoice_day, po.region, po.terms_and_conditions),
+            currency=po.currency,
+            items=items,
+            subtotal=subtotal,
+            tax_amount=tax_amount,
+            total_amount=total_amount,
+            status=self._determine_invoice_status(),
+            payment_terms=po.terms_and_conditions,
+            notes=self._generate_invoice_notes()
+        )
+
+        if invoice.status == 'Blocked':
+            invoice.block_reason = random.choice(self.config['invoices']['block_reasons'])
 
         # Simulate GRIR issues
         if random.random() < self.config['invoices']['grir_probability']:
-            invoice['grir_issue'] = self._generate_grir_issue()
+            invoice.grir_issue = self._generate_grir_issue()
 
         return invoice
 
-    def _generate_invoice_date(self, po_date: str) -> datetime:
-        po_date = datetime.strptime(po_date, "%Y-%m-%d")
+    @hot_path("invoices.invoice_date")
+    def _generate_invoice_day(self, po_day: int) -> int:
         max_days = 30  # Assume invoice is created within 30 days of PO
-        return po_date + timedelta(days=random.randint(1, max_days))
-
-    def _calculate_due_date(self, invoice_date: datetime, payment_terms: str) -> str:
-        # Extract the number of days from payment terms
-        terms_parts = payment_terms.split()
-        if len(terms_parts) >= 2 and terms_parts[-1].isdigit():
-            terms_days = int(terms_parts[-1])
-        elif "2% 10 Net 30" in payment_terms:
-            terms_days = 30
-        else:
-            # Default to 30 days if unable to parse
-            terms_days = 30
-
-        return (invoice_date + timedelta(days=terms_days)).strftime("%Y-%m-%d")
-
-    def _generate_invoice_items(self, po_items: List[Dict]) -> List[Dict]:
+        return po_day + random.randint(1, max_days)
+
+    @hot_path("invoices.due_date")
+    def _calculate_due_day(self, invoice_day: int, region: str, payment_terms: str) -> int:
+        # Due after the payment terms, moved to the next business day where the region has a calendar
+        return self.config.business_day(region, invoice_day + self._parse_terms_days(payment_terms))
+
+    def _parse_terms_days(self, payment_terms: str) -> int:
+        return parse_terms_days(payment_terms)
+
+    @hot_path("invoices.invoice_items")
+    def _generate_invoice_items(self, po_items: List[LineItem]) -> List[InvoiceLine]:
         invoice_items = []
         for item in po_items:
             if random.random() < 0.95:  # 95% chance to include each PO item
-                invoice_item = item.copy()
+                # The invoice line references the PO line and only keeps what differs from it
+                unit_price = None
+                quantity = None
 
                 # Simulate price discrepancies
                 if random.random() < 0.1:  # 10% chance of price discrepancy
-                    invoice_item['unit_price'] = round(item['unit_price'] * random.uniform(0.95, 1.05), 2)
+                    unit_price = round(item.unit_price * random.uniform(0.95, 1.05), 2)
 
                 # Simulate quantity discrepancies
                 if random.random() < 0.05:  # 5% chance of quantity discrepancy
-                    invoice_item['quantity'] = max(1, item['quantity'] + random.choice([-1, 1]))
+                    quantity = max(1, item.quantity + random.choice([-1, 1]))
 
-                invoice_item['total_price'] = invoice_item['quantity'] * invoice_item['unit_price']
-                invoice_item['tax_amount'] = invoice_item['total_price'] * invoice_item['tax_rate']
-
-                invoice_items.append(invoice_item)
+                invoice_items.append(InvoiceLine(item, unit_price, quantity))
 
         return invoice_items
 
     def _determine_invoice_status(self) -> str:
-        return random.choices(
-            self.config['invoices']['statuses'],
-            weights=[0.2, 0.6, 0.15, 0.05],  # Adjust these weights as needed
-            k=1
-        )[0]
+        # Statuses and their weights (invoices.status_weights) are compiled into one table at load time
+        return self.config.invoice_statuses.choice()
 
     def _generate_invoice_notes(self) -> str:
-        notes = [
-            "Please process for payment",
-            "Discount applied as per contract",
-            "Partial delivery - more to follow",
-            "Rush processing requested",
-            "Credit memo to follow for previous overcharge"
-        ]
-        return random.choice(notes)
+        return random.choice(self.NOTES)
 
     def _generate_grir_issue(self) -> Dict:
-        issues = [
-            {"type": "Quantity Mismatch", "description": "Invoice quantity doesn't match goods received"},
-            {"type": "Price Mismatch", "description": "Unit price on invoice differs from PO price"},
-            {"type": "Missing Goods Receipt", "description": "No record of goods receipt in the system"},
-            {"type": "Delivery Date Mismatch", "description": "Invoice date is earlier than the delivery date"},
-        ]
-        return random.choice(issues)
+        return random.choice(self.GRIR_ISSUES)
+
+
+# Record seeding reserves RECORD_INVOICES_PER_PO invoice and payment numbers per PO; a PO with more
+# invoices would take numbers reserved for the next one
+assert max(InvoiceGenerator.INVOICE_COUNTS) == RECORD_INVOICES_PER_PO, \
+    "RECORD_INVOICES_PER_PO must equal the largest of InvoiceGenerator.INVOICE_COUNTS"
+
+
+@functools.lru_cache(maxsize=None)
+def parse_terms_days(payment_terms: str) -> int:
+    # Extract the number of days from payment terms; memoized, as only a handful of distinct terms exist
+    terms_parts = payment_terms.split()
+    if len(terms_parts) >= 2 and terms_parts[-1].isdigit():
+        return int(terms_parts[-1])
+    elif "2% 10 Net 30" in payment_terms:
+        return 30
+    else:
+        # Default to 30 days if unable to parse
+        return 30
 
 
-def generate_invoices(config: Dict, purchase_orders: List[Dict]) -> List[Dict]:
+def generate_invoices(config: CompiledConfig, purchase_orders: List[PurchaseOrder]) -> List[Invoice]:
     generator = InvoiceGenerator(config, purchase_orders)
     return generator.generate_invoices()
\ No newline at end of file
@@ -0,0 +1,137 @@
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+from array import array
+from typing import List, Dict, Tuple
+
+LEXICON_VERSION = 2
+_HEADER_SIZE = struct.Struct('<Q')
+
+
+class Lexicon:
+    # English words grouped by Penn Treebank POS tag, stored in one file as
+    # [header length][JSON header][uint32 word offsets][UTF-8 word blob]. Words of the same tag
+    # are contiguous, so a random word for a tag prefix is an index into a few ranges.
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self._mmap = None
+        self._offsets = None
+        self._blob_start = 0
+        self._tag_ranges = {}
+        self._prefix_ranges = {}
+
+    def random_word(self, pos: str) -> str:
+        if self._mmap is None:
+            self._load()
+        ranges, total = self._ranges_for(pos)
+        if total == 0:
+            raise ValueError(f"No words in lexicon for POS tag: {pos}")
+        index = random.randrange(total)
+        for start, count in ranges:
+            if index < count:
+                return self._word(start + index)
+            index -= count
+
+    def _ranges_for(self, pos: str) -> Tuple[List[Tuple[int, int]], int]:
+        if pos not in self._prefix_ranges:
+            ranges = [tuple(span) for tag, span in sorted(self._tag_ranges.items()) if tag.startswith(pos)]
+            self._prefix_ranges[pos] = (ranges, sum(count for _, count in ranges))
+        return self._prefix_ranges[pos]
+
+    def _word(self, index: int) -> str:
+        start = self._blob_start + self._offsets[index]
+        end = self._blob_start + self._offsets[index + 1]
+        return self._mmap[start:end].decode('utf-8')
+
+    def _load(self):
+        if not self._try_load():
+            build_lexicon(self.cache_path)
+            if not self._try_load():
+                raise RuntimeError(f"Unable to load lexicon cache: {self.cache_path}")
+
+    def _try_load(self) -> bool:
+        try:
+            with open(self.cache_path, 'rb') as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        try:
+            header_length, = _HEADER_SIZE.unpack_from(mapped, 0)
+            header = json.loads(mapped[_HEADER_SIZE.size:_HEADER_SIZE.size + header_length])
+        except (struct.error, ValueError):
+            header = {}
+        if header.get('version') != LEXICON_VERSION or header.get('byteorder') != sys.byteorder:
+            mapped.close()
+            return False
+
+        offsets_start = _HEADER_SIZE.size + header_length
+        offsets_end = offsets_start + 4 * (header['word_count'] + 1)
+        self._offsets = memoryview(mapped)[offsets_start:offsets_end].cast('I')
+        self._blob_start = offsets_end
+        self._tag_ranges = header['tags']
+        self._prefix_ranges = {}
+        self._mmap = mapped
+        return True
+
+
+def build_lexicon(cache_path: str):
+    # NLTK is only needed to (re)build the cache, so it is imported here rather than at module load
+    import nltk
+
+    try:
+        from nltk.corpus import words
+        word_list = sorted(set(words.words()))
+    except LookupError:
+        nltk.download('words', quiet=True)
+        from nltk.corpus import words
+        word_list = sorted(set(words.words()))
+
+    # Each word is tagged on its own, as a one-word sentence; tagging the list as one sentence would
+    # let every tag depend on its alphabetical neighbours
+    sentences = [[word] for word in word_list]
+    try:
+        tagged = [sentence[0] for sentence in nltk.pos_tag_sents(sentences)]
+    except LookupError:
+        nltk.download('averaged_perceptron_tagger', quiet=True)
+        tagged = [sentence[0] for sentence in nltk.pos_tag_sents(sentences)]
+
+    by_tag: Dict[str, List[str]] = {}
+    for word, tag in tagged:
+        by_tag.setdefault(tag, []).append(word)
+
+    offsets = array('I', [0])
+    blob = bytearray()
+    tags = {}
+    for tag in sorted(by_tag):
+        tags[tag] = [len(offsets) - 1, len(by_tag[tag])]
+        for word in by_tag[tag]:
+            blob += word.encode('utf-8')
+            offsets.append(len(blob))
+
+    header = {"version": LEXICON_VERSION, "byteorder": sys.byteorder, "word_count": len(offsets) - 1, "tags": tags}
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Pad so the offset table starts on a 4-byte boundary
+    header_bytes += b' ' * (-(_HEADER_SIZE.size + len(header_bytes)) % 4)
+
+    directory = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(directory, exist_ok=True)
+    # Written to a temporary file and renamed so concurrent workers never see a partial cache
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(_HEADER_SIZE.pack(len(header_bytes)))
+        file.write(header_bytes)
+        offsets.tofile(file)
+        file.write(blob)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, cache_path)
+
+
+if __name__ == "__main__":
+    # Prebuild the cache, e.g. on a connected host before copying it to air-gapped machines
+    build_lexicon(sys.argv[1] if len(sys.argv) > 1 else os.path.join("cache", "lexicon.bin"))
@@ -1,49 +1,245 @@
+import argparse
+import cProfile
+import os
+import sys
 import yaml
 import logging
 from pathlib import Path
+from typing import Optional
+from src.config import CompiledConfig, ConfigError, compile_config
 from src.description_generator import DescriptionGenerator
-from src.vendor_generator import generate_vendors
-from src.po_generator import generate_purchase_orders
-from src.invoice_generator import generate_invoices
-from src.payment_generator import generate_payments
-from src.utils.data_writer import write_data
+from src.vendor_generator import load_or_generate_vendors
+from src.catalog import generate_catalog
+from src.pipeline import record_positions, run_staged_pipeline, run_streaming_pipeline
+from src.parallel import run_sharded_pipeline
+from src.planner import DEFAULT_SAMPLE_SIZE, plan_report, plan_run
+from src.incremental import Backlog, RunState, StateError, load_state, save_state, state_config_key, window_config
+from src.utils.data_writer import write_data, writer_options
+from src.utils.id_allocator import configure_id_allocation, id_positions
+from src.utils.metrics import configure_metrics, write_metrics_report
+from src.utils.result_cache import ResultCache
+from src.utils.seeding import derive_seed, resolve_master_seed
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def load_config(config_path: str) -> dict:
+def load_config(config_path: str) -> CompiledConfig:
+    # Validated and indexed once here; generators receive the compiled object
     with open(config_path, 'r') as file:
-        return yaml.safe_load(file)
+        return compile_config(yaml.safe_load(file))
 
 
-def main():
-    config_path = Path(__file__).parent.parent / "config" / "config.yaml"
-    config = load_config(config_path)
+def record_range(value: str) -> range:
+    try:
+        start, stop = (int(part) for part in value.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected START:STOP")
+    if not 0 <= start < stop:
+        raise argparse.ArgumentTypeError("expected 0 <= START < STOP")
+    return range(start, stop)
+
+
+def sample_size(value: str) -> int:
+    try:
+        size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a number of POs")
+    if size < 8:
+        raise argparse.ArgumentTypeError("expected at least 8 POs")
+    return size
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate synthetic Accounts Payable data")
+    parser.add_argument('--continue', dest='continue_dataset', action='store_true',
+                        help="append the next window of activity to the dataset in incremental.state_file")
+    parser.add_argument('--days', type=int, default=None,
+                        help="length of the --continue window in days (default: incremental.window_days)")
+    parser.add_argument('--records', type=record_range, default=None, metavar='START:STOP',
+                        help="regenerate POs START to STOP-1 with their invoices and payments into "
+                             "records_START_STOP/ (needs general.seeding: record and a fixed seed)")
+    parser.add_argument('--plan', type=sample_size, nargs='?', const=DEFAULT_SAMPLE_SIZE, default=None,
+                        metavar='SAMPLE_POS',
+                        help="estimate the wall time, peak memory and output size of the configured run from a "
+                             f"sample of SAMPLE_POS POs (default {DEFAULT_SAMPLE_SIZE}) without writing any output")
+    return parser.parse_args(argv)
+
+
+def log_counts(counts):
+    logger.info(f"Generated {counts['purchase_orders']} purchase orders")
+    logger.info(f"Generated {counts['invoices']} invoices")
+    logger.info(f"Generated {counts['payments']} payments")
+
+
+def open_result_cache(config: CompiledConfig) -> Optional[ResultCache]:
+    # Stage results are only reusable when the seed is fixed, like the vendor master
+    checkpoint_dir = config['general'].get('checkpoint_dir')
+    if checkpoint_dir is None or config['general'].get('seed') is None:
+        return None
+    return ResultCache(str(Path(__file__).parent.parent / checkpoint_dir))
+
+
+def log_cache(cache: Optional[ResultCache]):
+    if cache is not None:
+        logger.info(f"Reused {cache.hits} of {cache.hits + cache.misses} stage results from {cache.directory}")
+
+
+def vendor_cache_path(config: CompiledConfig) -> Optional[str]:
+    # The vendor master is only reusable when the seed is fixed
+    vendor_cache_dir = config['vendors'].get('cache_dir')
+    if vendor_cache_dir is None or config['general'].get('seed') is None:
+        return None
+    return str(Path(__file__).parent.parent / vendor_cache_dir)
+
 
+def regenerate_records(config: CompiledConfig, records: range) -> str:
+    # A slice of a record-seeded dataset, identical to the same POs, invoices and payments of the
+    # full run. Vendors and the catalog are rebuilt (or loaded) whole since every record refers to them.
+    if config['general'].get('seeding', 'chunk') != 'record' or config['general'].get('seed') is None:
+        raise ConfigError("--records needs general.seeding: \"record\" and a fixed general.seed")
+    description_generator = DescriptionGenerator(Path(__file__).parent.parent / "config" / "description_config.yaml")
+    master_seed = resolve_master_seed(config['general']['seed'])
+    configure_id_allocation(master_seed, digits=config.id_digits)
+    vendors = load_or_generate_vendors(config, description_generator, master_seed, vendor_cache_path(config))
+    catalog = generate_catalog(config, description_generator, master_seed)
+
+    configure_id_allocation(master_seed, positions=record_positions(records.start), digits=config.id_digits)
+    output_dir = f"records_{records.start}_{records.stop}"
+    os.makedirs(output_dir, exist_ok=True)
+    counts = run_streaming_pipeline(config, vendors, catalog, config['general']['output_format'],
+                                    derive_seed(master_seed, 'transactions'), total_count=len(records),
+                                    output_dir=output_dir)
+    log_counts(counts)
+    return output_dir
+
+
+def plan_dataset(config: CompiledConfig, sample_size: int) -> bool:
+    # Dry run: logs the estimates and returns whether the run fits this machine
+    description_generator = DescriptionGenerator(Path(__file__).parent.parent / "config" / "description_config.yaml")
+    plan = plan_run(config, description_generator, resolve_master_seed(config['general'].get('seed')), sample_size)
+    for line in plan_report(config, plan):
+        logger.info(line)
+    for warning in plan['warnings']:
+        logger.warning(warning)
+    return not plan['warnings']
+
+
+def continue_dataset(config: CompiledConfig, state_file: str, days: int):
+    # Appends one window after the last one: the vendor master, catalog, number positions and
+    # held-back documents come from the state, and each window has its own transaction stream
+    state = load_state(state_file, config)
+    window = window_config(config, state.end_date, days)
+    logger.info(f"Continuing dataset from {state.end_date} to {window['general']['end_date']}")
+
+    configure_id_allocation(state.master_seed, positions=state.id_positions, digits=config.id_digits)
+    run_index = state.run_index + 1
+    cache = open_result_cache(config)
+    counts = run_streaming_pipeline(window, state.vendors, state.catalog, config['general']['output_format'],
+                                    derive_seed(state.master_seed, 'transactions', run_index),
+                                    backlog=state.backlog, append=True, cache=cache)
+    log_counts(counts)
+    log_cache(cache)
+
+    state.end_date = window['general']['end_date']
+    state.run_index = run_index
+    state.id_positions = id_positions()
+    save_state(state_file, state)
+    logger.info(f"Holding back {len(state.backlog.invoices)} invoices and {len(state.backlog.payments)} payments "
+                f"dated {state.end_date} or later")
+
+
+def generate_dataset(config: CompiledConfig):
+    state_file = (config.get('incremental') or {}).get('state_file')
     description_config_path = Path(__file__).parent.parent / "config" / "description_config.yaml"
     description_generator = DescriptionGenerator(description_config_path)
 
     logger.info("Starting AP data generation process")
 
-    vendors = generate_vendors(config, description_generator)
+    options = writer_options(config, config['general']['output_format'])
+    master_seed = resolve_master_seed(config['general'].get('seed'))
+    configure_id_allocation(master_seed, digits=config.id_digits)
+    logger.info(f"Using master seed {master_seed}")
+
+    vendors = load_or_generate_vendors(config, description_generator, master_seed, vendor_cache_path(config))
     logger.info(f"Generated {len(vendors)} vendors")
-    write_data(vendors, 'vendors', config['general']['output_format'])
+    write_data(vendors, 'vendors', config['general']['output_format'], options)
+
+    catalog = generate_catalog(config, description_generator, master_seed)
+    logger.info(f"Generated {len(catalog.items)} catalog items")
+    write_data(catalog.items, 'catalog', config['general']['output_format'], options)
+
+    # POs, invoices and payments are seeded per stage and chunk from this seed
+    transactions_seed = derive_seed(master_seed, 'transactions')
+    cache = open_result_cache(config)
 
-    purchase_orders = generate_purchase_orders(config, vendors, description_generator)
-    logger.info(f"Generated {len(purchase_orders)} purchase orders")
-    write_data(purchase_orders, 'purchase_orders', config['general']['output_format'])
+    if state_file is not None:
+        # The first window of an incremental dataset; later windows are appended with --continue
+        if config['general'].get('workers', 1) != 1 or not config['general'].get('streaming', False):
+            logger.info("Incremental datasets are generated by the streaming pipeline in a single process")
+        backlog = Backlog()
+        counts = run_streaming_pipeline(config, vendors, catalog, config['general']['output_format'],
+                                        transactions_seed, backlog=backlog, cache=cache)
+        log_counts(counts)
+        save_state(state_file, RunState(master_seed, state_config_key(config), config['general']['end_date'], 0,
+                                        vendors, catalog, id_positions(), backlog))
+        logger.info(f"Holding back {len(backlog.invoices)} invoices and {len(backlog.payments)} payments "
+                    f"dated {config['general']['end_date']} or later")
+    elif config['general'].get('workers', 1) != 1:
+        counts = run_sharded_pipeline(config, vendors, catalog, config['general']['output_format'], master_seed,
+                                      cache)
+        log_counts(counts)
+    elif config['general'].get('streaming', False):
+        counts = run_streaming_pipeline(config, vendors, catalog, config['general']['output_format'],
+                                        transactions_seed, cache=cache)
+        log_counts(counts)
+    else:
+        counts = run_staged_pipeline(config, vendors, catalog, config['general']['output_format'],
+                                     transactions_seed, cache)
+        log_counts(counts)
+    log_cache(cache)
 
-    invoices = generate_invoices(config, purchase_orders)
-    logger.info(f"Generated {len(invoices)} invoices")
-    write_data(invoices, 'invoices', config['general']['output_format'])
 
-    payments = generate_payments(config, invoices)
-    logger.info(f"Generated {len(payments)} payments")
-    write_data(payments, 'payments', config['general']['output_format'])
+def main(argv=None):
+    args = parse_args(argv)
+    config_path = Path(__file__).parent.parent / "config" / "config.yaml"
+    config = load_config(config_path)
+    state_file = (config.get('incremental') or {}).get('state_file')
+    if args.plan is not None:
+        # Before metrics are set up, so the sample runs are timed without instrumentation
+        return 0 if plan_dataset(config, args.plan) else 1
+
+    # Every module with @hot_path functions is imported above, so they are all instrumented
+    metrics = config.get('metrics') or {}
+    configure_metrics(metrics.get('report_file') is not None, metrics.get('trace_allocations', False),
+                      metrics.get('rss_sample_interval', 1.0))
+    profiler = cProfile.Profile() if metrics.get('profile_file') else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        if args.continue_dataset:
+            if state_file is None:
+                raise StateError("--continue needs incremental.state_file in config.yaml")
+            continue_dataset(config, state_file, args.days or config['incremental'].get('window_days', 1))
+        elif args.records is not None:
+            output_dir = regenerate_records(config, args.records)
+            logger.info(f"Records {args.records.start} to {args.records.stop - 1} written to {output_dir}")
+        else:
+            generate_dataset(config)
+    finally:
+        # Also written when the run fails, to show where it got to
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(metrics['profile_file'])
+            logger.info(f"Profile written to {metrics['profile_file']}")
+        if metrics.get('report_file') is not None:
+            write_metrics_report(metrics['report_file'])
+            logger.info(f"Metrics report written to {metrics['report_file']}")
+        configure_metrics(False)
 
     logger.info("AP data generation process completed")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
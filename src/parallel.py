@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from tqdm import tqdm
+from src.config import CompiledConfig
+from src.catalog import ItemCatalog
+from src.pipeline import record_positions, run_streaming_pipeline
+from src.records import Vendor
+from src.utils.data_writer import merge_parts, writer_options
+from src.utils.id_allocator import configure_id_allocation, id_positions, advance_id_positions
+from src.utils.metrics import configure_metrics, merge_metrics, metrics_settings, metrics_snapshot
+from src.utils.rate_limiter import create_rate_limiter, install_rate_limiter
+from src.utils.result_cache import ResultCache
+from src.utils.seeding import derive_seed
+
+# Per-process state set up once by _init_worker so the vendor master and item catalog are
+# transferred to each worker a single time instead of with every shard.
+_worker_state = {}
+
+
+def split_count(total: int, shards: int) -> List[int]:
+    base, extra = divmod(total, shards)
+    return [base + (1 if index < extra else 0) for index in range(shards)]
+
+
+def _init_worker(config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog, rate_limiter,
+                 metrics: Optional[Dict]):
+    install_rate_limiter(rate_limiter)
+    _worker_state['config'] = config
+    _worker_state['vendors'] = vendors
+    _worker_state['catalog'] = catalog
+    _worker_state['metrics'] = metrics
+
+
+def _run_shard(shard_index: int, shards: int, master_seed: int, id_start: Dict[str, int], po_count: int,
+               output_format: str, part_dir: str,
+               cache_dir: Optional[str]) -> Tuple[Dict[str, int], Dict[str, int], Tuple[int, int], Dict]:
+    config = _worker_state['config']
+    if config['general'].get('seeding', 'chunk') == 'record':
+        # Shards take consecutive PO counters and records are seeded one by one from the run's
+        # transaction seed, so the output is the same as a single-process run
+        configure_id_allocation(master_seed, positions=id_start, digits=config.id_digits)
+        seed = derive_seed(master_seed, 'transactions')
+    else:
+        # Shards interleave ID counters from the same start, so their numbers can never collide
+        configure_id_allocation(master_seed, shard_index, shards, id_start, config.id_digits)
+        seed = derive_seed(master_seed, 'shard', shard_index)
+    shard_dir = os.path.join(part_dir, f"shard-{shard_index:05d}")
+    os.makedirs(shard_dir)
+    if _worker_state['metrics'] is not None:
+        # A fresh collector per shard, so each snapshot returned to the parent is counted once
+        configure_metrics(True, **_worker_state['metrics'])
+    cache = ResultCache(cache_dir) if cache_dir is not None else None
+    counts = run_streaming_pipeline(config, _worker_state['vendors'], _worker_state['catalog'], output_format, seed,
+                                    total_count=po_count, output_dir=shard_dir, show_progress=False,
+                                    write_header=shard_index == 0, cache=cache)
+    cache_counts = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    return counts, id_positions(), cache_counts, metrics_snapshot()
+
+
+def run_sharded_pipeline(config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog,
+                         output_format: str, master_seed: int,
+                         cache: Optional[ResultCache] = None) -> Dict[str, int]:
+    workers = config['general'].get('workers') or os.cpu_count()
+    shards = config['general'].get('shards') or workers
+    shard_counts = split_count(config['purchase_orders']['total_count'], shards)
+
+    # One bucket in shared memory keeps max_operations_per_second global across all workers
+    rate_limiter = create_rate_limiter(config['general']['max_operations_per_second'], shared=True)
+
+    part_dir = tempfile.mkdtemp(prefix="ap_shards_", dir='.')
+    id_start = [id_positions()] * shards
+    if config['general'].get('seeding', 'chunk') == 'record':
+        first_po = id_start[0].get('purchase_order', 0)
+        id_start = [record_positions(first_po + sum(shard_counts[:index])) for index in range(shards)]
+    cache_dir = cache.directory if cache is not None else None
+    counts = {"purchase_orders": 0, "invoices": 0, "payments": 0}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(config, vendors, catalog, rate_limiter,
+                                           metrics_settings())) as executor:
+            futures = [
+                executor.submit(_run_shard, index, shards, master_seed, id_start[index], count, output_format,
+                                part_dir, cache_dir)
+                for index, count in enumerate(shard_counts)
+            ]
+            for future in tqdm(futures, desc="Generating Shards"):
+                result_counts, shard_positions, (hits, misses), shard_metrics = future.result()
+                merge_metrics(shard_metrics)
+                for entity, count in result_counts.items():
+                    counts[entity] += count
+                advance_id_positions(shard_positions)
+                if cache is not None:
+                    cache.hits += hits
+                    cache.misses += misses
+
+        # Parts are concatenated in shard order, so output only depends on the seed and shard count
+        for entity in counts:
+            parts = [os.path.join(part_dir, f"shard-{index:05d}", entity) for index in range(shards)]
+            merge_parts(parts, entity, output_format, writer_options(config, output_format))
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+    return counts
@@ -1,68 +1,94 @@
 import random
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import List, Iterable, Iterator, Optional
 from tqdm import tqdm
-from src.utils.rate_limiter import RateLimiter
+from src.config import CompiledConfig, WeightedChoice, compile_config
+from src.records import Invoice, Payment
+from src.utils.id_allocator import get_id_allocator
+from src.utils.metrics import hot_path
+from src.utils.rate_limiter import get_rate_limiter
 
 
 class PaymentGenerator:
-    def __init__(self, config: Dict, invoices: List[Dict]):
-        self.config = config
+    PAID_STATUSES = ['Approved', 'Paid']
+    PAYMENT_SCENARIOS = ['early', 'on-time', 'late']
+    PAYMENT_SCENARIO_WEIGHTS = [0.2, 0.6, 0.2]
+
+    def __init__(self, config: CompiledConfig, invoices: Iterable[Invoice] = ()):
+        self.config = compile_config(config)
         self.invoices = invoices
-        self.rate_limiter = RateLimiter(config['general']['max_operations_per_second'])
+        self.rate_limiter = get_rate_limiter(config['general']['max_operations_per_second'])
+        self.payment_ids = get_id_allocator('payment')
+        self.payment_scenarios = WeightedChoice(self.PAYMENT_SCENARIOS, self.PAYMENT_SCENARIO_WEIGHTS)
 
-    def generate_payments(self) -> List[Dict]:
-        payments = []
+    def generate_payments(self) -> List[Payment]:
+        return list(self.iter_payments())
+
+    def iter_payments(self) -> Iterator[Payment]:
         for invoice in tqdm(self.invoices, desc="Generating Payments"):
-            self.rate_limiter.limit()
-            if invoice['status'] in ['Approved', 'Paid']:
-                payment = self._generate_single_payment(invoice)
+            self.rate_limiter.acquire()
+            payment = self._generate_invoice_payment(invoice)
+            if payment is not None:
+                yield payment
+
+    def generate_batch(self, invoices: Iterable[Invoice]) -> List[Payment]:
+        invoices = list(invoices)
+        self.rate_limiter.acquire(len(invoices))
+        payments = []
+        for invoice in invoices:
+            payment = self._generate_invoice_payment(invoice)
+            if payment is not None:
                 payments.append(payment)
         return payments
 
-    def _generate_single_payment(self, invoice: Dict) -> Dict:
-        payment_date = self._generate_payment_date(invoice)
-        payment_amount = self._calculate_payment_amount(invoice, payment_date)
-
-        payment = {
-            "payment_id": f"PAY{random.randint(1000000, 9999999)}",
-            "invoice_number": invoice['invoice_number'],
-            "po_number": invoice['po_number'],
-            "vendor_id": invoice['vendor_id'],
-            "vendor_name": invoice['vendor_name'],
-            "payment_date": payment_date.strftime("%Y-%m-%d"),
-            "amount": payment_amount,
-            "currency": invoice['currency'],
-            "payment_method": self._select_payment_method(),
-            "status": "Completed" if payment_amount == invoice['total_amount'] else "Partial",
-            "notes": self._generate_payment_notes(invoice, payment_date, payment_amount)
-        }
+    def _generate_invoice_payment(self, invoice: Invoice) -> Optional[Payment]:
+        if invoice.status in self.PAID_STATUSES:
+            return self._generate_single_payment(invoice)
+        return None
+
+    @hot_path("payments.single_payment")
+    def _generate_single_payment(self, invoice: Invoice) -> Payment:
+        payment_day = self._generate_payment_day(invoice)
+        payment_amount = self._calculate_payment_amount(invoice, payment_day)
+
+        payment = Payment(
+            payment_id=self.payment_ids.next_id(),
+            invoice_number=invoice.invoice_number,
+            po_number=invoice.po_number,
+            vendor_id=invoice.vendor_id,
+            vendor_name=invoice.vendor_name,
+            region=invoice.region,
+            payment_date=payment_day,
+            amount=payment_amount,
+            currency=invoice.currency,
+            payment_method=self._select_payment_method(),
+            status="Completed" if payment_amount == invoice.total_amount else "Partial",
+            notes=self._generate_payment_notes(invoice, payment_day, payment_amount)
+        )
 
         return payment
 
-    def _generate_payment_date(self, invoice: Dict) -> datetime:
-        invoice_date = datetime.strptime(invoice['invoice_date'], "%Y-%m-%d")
-        due_date = datetime.strptime(invoice['due_date'], "%Y-%m-%d")
+    @hot_path("payments.payment_date")
+    def _generate_payment_day(self, invoice: Invoice) -> int:
+        invoice_day = invoice.invoice_day
+        due_day = invoice.due_day
 
-        # Simulate early, on-time, and late payments
-        payment_scenario = random.choices(['early', 'on-time', 'late'], weights=[0.2, 0.6, 0.2])[0]
+        # Simulate early, on-time, and late payments; payments go out on business days
+        payment_scenario = self.payment_scenarios.choice()
 
         if payment_scenario == 'early':
-            return invoice_date + timedelta(days=random.randint(1, (due_date - invoice_date).days - 1))
+            return self.config.business_day(invoice.region, invoice_day + random.randint(1, due_day - invoice_day - 1))
         elif payment_scenario == 'on-time':
-            return due_date
+            return due_day
         else:  # late payment
-            return due_date + timedelta(days=random.randint(1, 30))  # Assume max 30 days late
-
-    def _calculate_payment_amount(self, invoice: Dict, payment_date: datetime) -> float:
-        invoice_date = datetime.strptime(invoice['invoice_date'], "%Y-%m-%d")
-        due_date = datetime.strptime(invoice['due_date'], "%Y-%m-%d")
+            return self.config.business_day(invoice.region, due_day + random.randint(1, 30))  # Assume max 30 days late
 
+    @hot_path("payments.payment_amount")
+    def _calculate_payment_amount(self, invoice: Invoice, payment_day: int) -> float:
         # Apply early payment discount if applicable
-        if "2% 10" in invoice['payment_terms'] and (payment_date - invoice_date).days <= 10:
-            discounted_amount = round(invoice['total_amount'] * 0.98, 2)
+        if "2% 10" in invoice.payment_terms and payment_day - invoice.invoice_day <= 10:
+            discounted_amount = round(invoice.total_amount * 0.98, 2)
         else:
-            discounted_amount = invoice['total_amount']
+            discounted_amount = invoice.total_amount
 
         # Simulate partial payments
         if random.random() < 0.1:  # 10% chance of partial payment
@@ -73,22 +99,28 @@ class PaymentGenerator:
     def _select_payment_method(self) -> str:
         return random.choice(self.config['payments']['methods'])
 
-    def _generate_payment_notes(self, invoice: Dict, payment_date: datetime, payment_amount: float) -> str:
-        notes = []
+    @hot_path("payments.payment_notes")
+    def _generate_payment_notes(self, invoice: Invoice, payment_day: int, payment_amount: float) -> str:
+        discount_applied = "2% 10" in invoice.payment_terms and payment_day - invoice.invoice_day <= 10
 
-        invoice_date = datetime.strptime(invoice['invoice_date'], "%Y-%m-%d")
-        due_date = datetime.strptime(invoice['due_date'], "%Y-%m-%d")
+        return self._compose_payment_notes(payment_day < invoice.due_day, payment_day > invoice.due_day,
+                                           discount_applied, invoice.total_amount - payment_amount,
+                                           invoice.currency)
+
+    def _compose_payment_notes(self, is_early: bool, is_late: bool, discount_applied: bool,
+                               remaining_balance: float, currency: str) -> str:
+        notes = []
 
-        if payment_date < due_date:
+        if is_early:
             notes.append("Early payment")
-            if "2% 10" in invoice['payment_terms'] and (payment_date - invoice_date).days <= 10:
+            if discount_applied:
                 notes.append("2% discount applied")
-        elif payment_date > due_date:
+        elif is_late:
             notes.append("Late payment")
 
-        if payment_amount < invoice['total_amount']:
+        if remaining_balance > 0:
             notes.append("Partial payment")
-            notes.append(f"Remaining balance: {invoice['total_amount'] - payment_amount:.2f} {invoice['currency']}")
+            notes.append(f"Remaining balance: {remaining_balance:.2f} {currency}")
 
         if not notes:
             notes.append("Payment processed as per terms")
@@ -96,6 +128,6 @@ class PaymentGenerator:
         return "; ".join(notes)
 
 
-def generate_payments(config: Dict, invoices: List[Dict]) -> List[Dict]:
+def generate_payments(config: CompiledConfig, invoices: List[Invoice]) -> List[Payment]:
     generator = PaymentGenerator(config, invoices)
     return generator.generate_payments()
\ No newline at end of file
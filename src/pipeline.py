@@ -0,0 +1,214 @@
+import itertools
+import os
+from typing import List, Dict, Optional, Tuple
+from tqdm import tqdm
+from src.config import RECORD_INVOICES_PER_PO, CompiledConfig
+from src.catalog import ItemCatalog
+from src.po_generator import PurchaseOrderGenerator
+from src.invoice_generator import InvoiceGenerator
+from src.payment_generator import PaymentGenerator
+from src.records import Vendor
+from src.incremental import Backlog
+from src.utils.data_writer import open_writer, write_data, writer_options
+from src.utils.id_allocator import advance_id_positions, get_id_allocator, id_positions
+from src.utils.metrics import track
+from src.utils.result_cache import RESULT_CACHE_VERSION, ResultCache, content_key
+from src.utils.seeding import derive_seed, seed_generators
+
+# Stage -> (entity whose document numbers it allocates, stage whose output it consumes)
+STAGES = {
+    "purchase_orders": ("purchase_order", None),
+    "invoices": ("invoice", "purchase_orders"),
+    "payments": ("payment", "invoices"),
+}
+
+
+def get_generator_classes(config: CompiledConfig) -> Tuple[type, type, type]:
+    engine = config['general'].get('engine', 'python')
+    if engine == 'numpy':
+        # Imported lazily so NumPy stays optional for the pure-Python engine
+        from src.batch_engine import (VectorizedPurchaseOrderGenerator, VectorizedInvoiceGenerator,
+                                      VectorizedPaymentGenerator)
+        return VectorizedPurchaseOrderGenerator, VectorizedInvoiceGenerator, VectorizedPaymentGenerator
+    elif engine == 'python':
+        return PurchaseOrderGenerator, InvoiceGenerator, PaymentGenerator
+    else:
+        raise ValueError(f"Unsupported engine: {engine}")
+
+
+def stage_settings(config: CompiledConfig, stage: str) -> List:
+    # The parts of config.yaml a stage's output depends on, besides its upstream input and seed
+    if stage == 'purchase_orders':
+        return [config['general']['start_date'], config['general']['end_date'], config['purchase_orders'],
+                config['regions'], config['exchange_rates'], config['items'].get('price_variation', 0),
+                config.get('sampling')]
+    return [config[stage]]
+
+
+def record_positions(first_po: int) -> Dict[str, int]:
+    # Where a record-seeded run starting at PO counter first_po begins numbering: PO n owns the
+    # invoice and payment counters from n * RECORD_INVOICES_PER_PO on
+    first_invoice = first_po * RECORD_INVOICES_PER_PO
+    return {"purchase_order": first_po, "invoice": first_invoice, "payment": first_invoice}
+
+
+def chunk_counts(total_count: int, chunk_size: int) -> List[int]:
+    return [min(chunk_size, total_count - start) for start in range(0, total_count, chunk_size)]
+
+
+class StageRunner:
+    # Runs the PO, invoice and payment stages one chunk at a time. Every stage of every chunk is
+    # seeded with derive_seed(seed, stage, chunk), so its result only depends on its input and
+    # not on what ran before it. With a result cache, each result is stored under a key over the
+    # stage's settings, its upstream result's key (the vendor master and catalog for POs), the
+    # seed and where its document numbers start; a matching entry is reloaded instead of
+    # regenerated. That makes each stored chunk a checkpoint, and unchanged stages are reused
+    # when only downstream settings change.
+    #
+    # With general.seeding: "record", every PO is instead seeded from (seed, its PO counter), its
+    # invoices from the same counter and every payment from its invoice's counter, and their
+    # numbers come from those counters too. Each record is then a pure function of the seed and
+    # its index, whatever the chunking, sharding or range it is generated in.
+    def __init__(self, config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog, seed: int,
+                 cache: Optional[ResultCache] = None):
+        po_class, invoice_class, payment_class = get_generator_classes(config)
+        self.generators = {
+            "purchase_orders": po_class(config, vendors, catalog),
+            "invoices": invoice_class(config),
+            "payments": payment_class(config),
+        }
+        self.seed = seed
+        self.by_record = config['general'].get('seeding', 'chunk') == 'record'
+        self.cache = cache
+        self.keys: Dict[Tuple[str, int], str] = {}
+        if cache is not None:
+            self.settings = {stage: stage_settings(config, stage) for stage in STAGES}
+            numbering = [self._numbering(entity) for entity, _ in STAGES.values()]
+            # The seeding mode decides which stream every record is drawn from, like the seed itself
+            self.inputs_key = content_key(RESULT_CACHE_VERSION, seed, config['general'].get('engine', 'python'),
+                                          self.by_record, numbering, vendors, catalog.items)
+
+    def run(self, stage: str, chunk_index: int, source) -> List:
+        # source is the PO count for the PO stage and the upstream stage's chunk otherwise
+        entity, upstream = STAGES[stage]
+        key = None
+        if self.cache is not None:
+            parent = self.inputs_key if upstream is None else self.keys[upstream, chunk_index]
+            key = content_key(parent, stage, chunk_index, source if upstream is None else None,
+                              self.settings[stage], id_positions().get(entity, 0))
+            self.keys[stage, chunk_index] = key
+            with track(f"cache.{stage}") as section:
+                entry = self.cache.load(key)
+                if entry is not None:
+                    records, position = entry
+                    advance_id_positions({entity: position})
+                    section.add(rows=len(records))
+                    return records
+        with track(f"stage.{stage}") as section:
+            if self.by_record:
+                records = self._generate_by_record(stage, source)
+            else:
+                seed_generators(derive_seed(self.seed, stage, chunk_index))
+                records = self.generators[stage].generate_batch(source)
+            section.add(rows=len(records))
+        if key is not None:
+            self.cache.store(key, (records, id_positions()[entity]))
+        return records
+
+    def _generate_by_record(self, stage: str, source) -> List:
+        generator = self.generators[stage]
+        records = []
+        if stage == 'purchase_orders':
+            po_numbers = get_id_allocator('purchase_order')
+            for _ in range(source):
+                seed_generators(derive_seed(self.seed, stage, po_numbers.position))
+                records.extend(generator.generate_batch(1))
+        elif stage == 'invoices':
+            po_numbers, invoice_numbers = get_id_allocator('purchase_order'), get_id_allocator('invoice')
+            for po in source:
+                index = po_numbers.counter(po.po_number)
+                invoice_numbers.seek(index * RECORD_INVOICES_PER_PO)
+                seed_generators(derive_seed(self.seed, stage, index))
+                records.extend(generator.generate_batch([po]))
+        else:
+            invoice_numbers, payment_ids = get_id_allocator('invoice'), get_id_allocator('payment')
+            for invoice in source:
+                index = invoice_numbers.counter(invoice.invoice_number)
+                payment_ids.seek(index)
+                seed_generators(derive_seed(self.seed, stage, index))
+                records.extend(generator.generate_batch([invoice]))
+        return records
+
+    def _numbering(self, entity: str) -> List:
+        allocator = get_id_allocator(entity)
+        return [allocator.prefix, allocator.size, allocator.stride, allocator.offset, allocator.round_keys]
+
+
+def run_streaming_pipeline(config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog,
+                           output_format: str, seed: int, total_count: Optional[int] = None,
+                           output_dir: str = '.', show_progress: bool = True, write_header: bool = True,
+                           backlog: Optional[Backlog] = None, append: bool = False,
+                           cache: Optional[ResultCache] = None) -> Dict[str, int]:
+    # POs are produced in fixed-size chunks and each chunk is carried through invoices and
+    # payments before the next one is generated, so memory stays flat regardless of total_count.
+    # With a backlog, invoices and payments dated after general.end_date are held back for a
+    # later window and those an earlier window held back are written once they fall due.
+    chunk_size = config['general'].get('chunk_size', 1000)
+    total_count = config['purchase_orders']['total_count'] if total_count is None else total_count
+    options = writer_options(config, output_format)
+    if output_format.lower() in ('csv', 'jsonl'):
+        options['header'] = write_header
+    if append:
+        options['append'] = True
+    runner = StageRunner(config, vendors, catalog, seed, cache)
+
+    counts = {"purchase_orders": 0, "invoices": 0, "payments": 0}
+    with open_writer(os.path.join(output_dir, 'purchase_orders'), output_format, options) as po_writer, \
+            open_writer(os.path.join(output_dir, 'invoices'), output_format, options) as invoice_writer, \
+            open_writer(os.path.join(output_dir, 'payments'), output_format, options) as payment_writer, \
+            tqdm(total=total_count, desc="Generating Purchase Orders", disable=not show_progress) as progress:
+        if backlog is not None:
+            invoices, payments = backlog.release(config['general']['end_date'])
+            invoice_writer.write_many(invoices)
+            payment_writer.write_many(payments)
+            counts["invoices"] += len(invoices)
+            counts["payments"] += len(payments)
+
+        for chunk_index, count in enumerate(chunk_counts(total_count, chunk_size)):
+            purchase_orders = runner.run('purchase_orders', chunk_index, count)
+            invoices = runner.run('invoices', chunk_index, purchase_orders)
+            payments = runner.run('payments', chunk_index, invoices)
+            if backlog is not None:
+                invoices, payments = backlog.hold(invoices, payments)
+
+            po_writer.write_many(purchase_orders)
+            invoice_writer.write_many(invoices)
+            payment_writer.write_many(payments)
+
+            counts["purchase_orders"] += len(purchase_orders)
+            counts["invoices"] += len(invoices)
+            counts["payments"] += len(payments)
+            progress.update(count)
+
+    return counts
+
+
+def run_staged_pipeline(config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog,
+                        output_format: str, seed: int, cache: Optional[ResultCache] = None) -> Dict[str, int]:
+    # Stage by stage: every PO chunk, then every invoice chunk, then every payment chunk, with each
+    # stage held as a full list and written before the next one starts. Chunks are seeded the same
+    # way as in run_streaming_pipeline, so both produce the same records.
+    chunks = chunk_counts(config['purchase_orders']['total_count'], config['general'].get('chunk_size', 1000))
+    options = writer_options(config, output_format)
+    runner = StageRunner(config, vendors, catalog, seed, cache)
+
+    counts = {}
+    sources = list(enumerate(chunks))
+    for stage, description in (("purchase_orders", "Generating Purchase Orders"),
+                               ("invoices", "Generating Invoices"), ("payments", "Generating Payments")):
+        results = [runner.run(stage, chunk_index, source) for chunk_index, source in tqdm(sources, desc=description)]
+        records = list(itertools.chain.from_iterable(results))
+        write_data(records, stage, output_format, options)
+        counts[stage] = len(records)
+        sources = list(enumerate(results))
+    return counts
@@ -0,0 +1,406 @@
+import copy
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from src.config import CompiledConfig, WeightedChoice, compile_config
+from src.catalog import generate_catalog
+from src.description_generator import DescriptionGenerator
+from src.invoice_generator import InvoiceGenerator
+from src.payment_generator import PaymentGenerator
+from src.pipeline import STAGES, StageRunner, chunk_counts, get_generator_classes
+from src.utils.data_writer import open_writer, writer_options
+from src.utils.database_writer import DIALECTS
+from src.utils.id_allocator import configure_id_allocation
+from src.utils.metrics import current_rss_mb, output_size
+from src.utils.schema import LINE_TABLES
+from src.utils.seeding import derive_seed, seed_generators
+from src.vendor_generator import generate_vendors
+
+# Dry-run capacity planning (`python -m src.main --plan`). Nothing is written to the output
+# directory. A sample of every entity is generated with the configured engine, without rate
+# limiting, and written in the configured output format to a scratch directory: once at a
+# quarter of the sample size and once at the full size. A line through the two runs splits each
+# entity's time and output bytes into a fixed part (set-up, headers, partition files) and a
+# per-row part. A third pass over one chunk measures with tracemalloc what each record keeps
+# alive, the transient peak of generating a chunk and what writers buffer per row.
+#
+# Those rates are scaled to the configured run (invoices from the invoice-count weights, payments
+# from invoices.status_weights) and combined with the pipeline that will run it (staged,
+# streaming or sharded) into wall time, peak memory and disk use, which are checked against the
+# memory available and the free disk space.
+
+DEFAULT_SAMPLE_SIZE = 2000
+# Share of the available memory or free disk an estimate may take before the run is flagged
+HEADROOM = 0.9
+# tracemalloc counts the bytes requested; pymalloc's size classes and partly used pools make the
+# resident size of generated records about this much larger
+ALLOCATOR_OVERHEAD = 1.2
+ENTITIES = ["vendors", "catalog"] + list(STAGES)
+
+
+class LinearCost(NamedTuple):
+    fixed: float
+    per_row: float
+
+    def at(self, rows: float) -> float:
+        return self.fixed + self.per_row * rows
+
+
+def fit_cost(small: Tuple[int, float], large: Tuple[int, float]) -> LinearCost:
+    # The line through two (rows, value) samples. When both have the same rows, or noise makes
+    # either part negative, the value is taken as proportional to the larger sample instead.
+    (small_rows, small_value), (large_rows, large_value) = small, large
+    if large_rows > small_rows:
+        per_row = (large_value - small_value) / (large_rows - small_rows)
+        fixed = small_value - per_row * small_rows
+        if per_row >= 0 and fixed >= 0:
+            return LinearCost(fixed, per_row)
+    return LinearCost(0.0, large_value / max(large_rows, 1))
+
+
+def expected_rows(config: CompiledConfig) -> Dict[str, float]:
+    # Mean row counts of the configured run: each PO draws its invoice count from the invoice
+    # generator's weights and an invoice is paid when its status is one the payment generator pays
+    invoice_counts = WeightedChoice(InvoiceGenerator.INVOICE_COUNTS, InvoiceGenerator.INVOICE_COUNT_WEIGHTS)
+    invoices_per_po = sum(count * share for count, share in
+                          zip(invoice_counts.population, invoice_counts.probabilities))
+    statuses = config.invoice_statuses
+    paid_share = sum(share for status, share in zip(statuses.population, statuses.probabilities)
+                     if status in PaymentGenerator.PAID_STATUSES)
+    purchase_orders = config['purchase_orders']['total_count']
+    return {
+        "vendors": config['vendors']['total_count'],
+        "catalog": len(config.categories) * config['items']['items_per_category'],
+        "purchase_orders": purchase_orders,
+        "invoices": purchase_orders * invoices_per_po,
+        "payments": purchase_orders * invoices_per_po * paid_share,
+    }
+
+
+def sample_config(config: CompiledConfig, po_count: int) -> CompiledConfig:
+    raw = copy.deepcopy(config.raw)
+    raw['general']['max_operations_per_second'] = None
+    raw['vendors']['total_count'] = min(raw['vendors']['total_count'], po_count)
+    raw['purchase_orders']['total_count'] = po_count
+    return compile_config(raw)
+
+
+def buffered_rows(output_format: str, options: Dict) -> int:
+    # Rows a writer holds per table before flushing them; the other formats stream rows out
+    if output_format == 'parquet':
+        return options.get('row_group_size', 100000)
+    if output_format in DIALECTS:
+        return options.get('batch_size', 50000)
+    return 0
+
+
+def _entity_writer(directory: str, entity: str, output_format: str, options: Dict):
+    # Every entity gets its own subdirectory, so one that shares a file with the others in a
+    # real run (the sqlite database) is still measured on its own
+    os.makedirs(os.path.join(directory, entity))
+    return open_writer(os.path.join(directory, entity, entity), output_format, options)
+
+
+def _line_rows(entity: str, records: List) -> int:
+    return sum(len(record.items) for record in records) if entity in LINE_TABLES else 0
+
+
+def sample_run(config: CompiledConfig, description_generator: DescriptionGenerator, master_seed: int,
+               directory: str) -> Dict[str, Tuple[int, float, int]]:
+    # (rows, seconds generating and writing, bytes written) per entity for one sample, run chunk
+    # by chunk like the streaming pipeline
+    output_format = config['general']['output_format'].lower()
+    options = writer_options(config, output_format)
+    rows = dict.fromkeys(ENTITIES, 0)
+    seconds = dict.fromkeys(ENTITIES, 0.0)
+
+    def timed(entity: str, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds[entity] += time.perf_counter() - start
+        return result
+
+    configure_id_allocation(master_seed, digits=config.id_digits)
+    seed_generators(derive_seed(master_seed, 'vendors'))
+    vendors = timed('vendors', generate_vendors, config, description_generator)
+    catalog = timed('catalog', generate_catalog, config, description_generator, master_seed)
+    for entity, records in (("vendors", vendors), ("catalog", catalog.items)):
+        writer = timed(entity, _entity_writer, directory, entity, output_format, options)
+        timed(entity, writer.write_many, records)
+        timed(entity, writer.close)
+        rows[entity] = len(records)
+
+    runner = StageRunner(config, vendors, catalog, derive_seed(master_seed, 'transactions'))
+    writers = {stage: timed(stage, _entity_writer, directory, stage, output_format, options) for stage in STAGES}
+    try:
+        for chunk_index, count in enumerate(chunk_counts(config['purchase_orders']['total_count'],
+                                                         config['general'].get('chunk_size', 1000))):
+            source = count
+            for stage in STAGES:
+                records = timed(stage, runner.run, stage, chunk_index, source)
+                timed(stage, writers[stage].write_many, records)
+                rows[stage] += len(records)
+                source = records
+    finally:
+        for stage, writer in writers.items():
+            timed(stage, writer.close)
+    return {entity: (rows[entity], seconds[entity], output_size(os.path.join(directory, entity)))
+            for entity in ENTITIES}
+
+
+def _traced(function, *args):
+    # The result and the bytes it still holds once returned, plus the peak above that while running
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    return result, current - before, peak - current
+
+
+def sample_memory(config: CompiledConfig, description_generator: DescriptionGenerator, master_seed: int,
+                  directory: str) -> Dict[str, Dict[str, float]]:
+    # Per entity, for one chunk: bytes each record keeps alive, the transient peak of generating
+    # the chunk, the bytes of an open writer (file buffers) and per buffered row (parent and line
+    # rows alike), line rows per record and pickled bytes per record (the result and vendor caches)
+    output_format = config['general']['output_format'].lower()
+    options = writer_options(config, output_format)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        configure_id_allocation(master_seed, digits=config.id_digits)
+        seed_generators(derive_seed(master_seed, 'vendors'))
+        vendors, vendor_bytes, vendor_peak = _traced(generate_vendors, config, description_generator)
+        catalog, catalog_bytes, catalog_peak = _traced(generate_catalog, config, description_generator, master_seed)
+        results = {"vendors": (vendors, vendor_bytes, vendor_peak),
+                   "catalog": (catalog.items, catalog_bytes, catalog_peak)}
+        runner = StageRunner(config, vendors, catalog, derive_seed(master_seed, 'transactions'))
+        source = min(config['general'].get('chunk_size', 1000), config['purchase_orders']['total_count'])
+        for stage in STAGES:
+            records, retained, peak = _traced(runner.run, stage, 0, source)
+            results[stage] = (records, retained, peak)
+            source = records
+
+        memory = {}
+        for entity, (records, retained, peak) in results.items():
+            count = max(len(records), 1)
+            line_rows = _line_rows(entity, records)
+            writer, opened, _ = _traced(_entity_writer, directory, entity, output_format, options)
+            _, held, _ = _traced(writer.write_many, records)
+            writer.close()
+            memory[entity] = {
+                "record_bytes": retained / count,
+                "transient_bytes": peak,
+                "writer_bytes": opened,
+                "writer_row_bytes": max(held, 0) / max(len(records) + line_rows, 1),
+                "lines_per_record": line_rows / count,
+                "pickled_bytes": len(pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)) / count,
+            }
+        return memory
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+
+def available_memory() -> Optional[int]:
+    # Memory the system can still hand out without swapping, where the platform reports it
+    try:
+        with open('/proc/meminfo') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def plan_run(config: CompiledConfig, description_generator: DescriptionGenerator, master_seed: int,
+             sample_size: int = DEFAULT_SAMPLE_SIZE) -> Dict:
+    general = config['general']
+    output_format = general['output_format'].lower()
+    options = writer_options(config, output_format)
+    # The interpreter with everything the run imports, including the engine (NumPy is imported lazily)
+    get_generator_classes(config)
+    base_memory = current_rss_mb() * 1024 * 1024
+    large = max(min(sample_size, config['purchase_orders']['total_count']), 1)
+    small = max(large // 4, 1)
+
+    scratch = tempfile.mkdtemp(prefix="ap_plan_", dir='.')
+    try:
+        samples = []
+        for index, po_count in enumerate((small, large)):
+            directory = os.path.join(scratch, f"sample-{index}")
+            samples.append(sample_run(sample_config(config, po_count), description_generator, master_seed, directory))
+        memory = sample_memory(sample_config(config, large), description_generator, master_seed,
+                               os.path.join(scratch, "memory"))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    rows = expected_rows(config)
+    entities = {}
+    for entity in ENTITIES:
+        (small_rows, small_seconds, small_bytes), (large_rows, large_seconds, large_bytes) = \
+            samples[0][entity], samples[1][entity]
+        entities[entity] = {
+            "rows": round(rows[entity]),
+            "seconds": fit_cost((small_rows, small_seconds), (large_rows, large_seconds)).at(rows[entity]),
+            "bytes": fit_cost((small_rows, small_bytes), (large_rows, large_bytes)).at(rows[entity]),
+        }
+
+    # Which pipeline main() will run, in how many processes, and how many of them can run at once
+    incremental = (config.get('incremental') or {}).get('state_file') is not None
+    workers = general.get('workers', 1)
+    pipeline, processes, shards = "streaming" if general.get('streaming', False) else "staged", 1, 1
+    if incremental:
+        pipeline = "streaming"
+    elif workers != 1:
+        workers = workers or os.cpu_count()
+        shards = general.get('shards') or workers
+        pipeline, processes = "sharded", min(workers, shards)
+    parallel = min(processes, os.cpu_count() or 1)
+
+    # Wall time: the vendor master and catalog, then the transaction stages spread over the worker
+    # processes that can run at once, but never faster than the rate limit allows. Every vendor
+    # and PO takes a token, and invoices and payments take one per PO and per invoice.
+    reference_seconds = entities['vendors']['seconds'] + entities['catalog']['seconds']
+    compute_seconds = reference_seconds + sum(entities[stage]['seconds'] for stage in STAGES) / parallel
+    rate = general.get('max_operations_per_second')
+    operations = rows['vendors'] + 2 * rows['purchase_orders'] + rows['invoices']
+    rate_seconds = operations / rate if rate else 0.0
+
+    # Peak memory: the interpreter, the vendor master and catalog, and the records alive at once
+    chunk_size = min(general.get('chunk_size', 1000), rows['purchase_orders'])
+    reference_bytes = sum(memory[entity]['record_bytes'] * rows[entity] for entity in ("vendors", "catalog"))
+    transient = max(memory[stage]['transient_bytes'] for stage in STAGES)
+    held_rows = buffered_rows(output_format, options)
+
+    def writer_bytes(stage: str, stage_rows: float, streaming: bool) -> float:
+        # Rows buffered until a row group or batch is full; parquet buffers hold the records
+        # themselves, which a streaming run would otherwise have released with their chunk
+        parents = min(stage_rows, held_rows)
+        lines = min(stage_rows * memory[stage]['lines_per_record'], held_rows)
+        if output_format in DIALECTS and memory[stage]['lines_per_record']:
+            # A database writer flushes a table and its lines together, when either batch is full
+            parents = min(parents, held_rows / memory[stage]['lines_per_record'])
+        held = memory[stage]['writer_bytes'] + (parents + lines) * memory[stage]['writer_row_bytes']
+        if streaming and output_format == 'parquet':
+            chunk_rows = chunk_size * rows[stage] / max(rows['purchase_orders'], 1)
+            held += max(parents - chunk_rows, 0) * memory[stage]['record_bytes']
+        return held
+
+    def streaming_bytes(po_count: float) -> float:
+        # One chunk of POs with their invoices and payments, plus what the writers buffer
+        per_po = {stage: rows[stage] / max(rows['purchase_orders'], 1) for stage in STAGES}
+        chunk = sum(memory[stage]['record_bytes'] * per_po[stage] * min(chunk_size, po_count) for stage in STAGES)
+        return chunk + transient + sum(writer_bytes(stage, per_po[stage] * po_count, True) for stage in STAGES)
+
+    if pipeline == "staged":
+        # One stage's records are held while the next one is generated from them, then written
+        totals = {stage: memory[stage]['record_bytes'] * rows[stage] for stage in STAGES}
+        working = (max(totals['purchase_orders'] + totals['invoices'], totals['invoices'] + totals['payments'])
+                   + transient + max(writer_bytes(stage, rows[stage], False) for stage in STAGES))
+        peak_memory = base_memory + ALLOCATOR_OVERHEAD * (reference_bytes + working)
+    elif pipeline == "sharded":
+        # Every worker process holds the vendor master and catalog next to its own streaming shard
+        shard_bytes = streaming_bytes(rows['purchase_orders'] / shards)
+        worker = base_memory + ALLOCATOR_OVERHEAD * (reference_bytes + shard_bytes)
+        peak_memory = base_memory + ALLOCATOR_OVERHEAD * reference_bytes + processes * worker
+    else:
+        peak_memory = base_memory + ALLOCATOR_OVERHEAD * (reference_bytes + streaming_bytes(rows['purchase_orders']))
+
+    # Disk: the output, a second copy while sharded flat files and databases are merged (parquet
+    # shards are moved instead), and the result and vendor caches when they are enabled
+    output_bytes = sum(entity['bytes'] for entity in entities.values())
+    disk_bytes = output_bytes
+    if pipeline == "sharded" and output_format != 'parquet':
+        disk_bytes += sum(entities[stage]['bytes'] for stage in STAGES)
+    cache_bytes = 0.0
+    if general.get('seed') is not None:
+        if general.get('checkpoint_dir') is not None:
+            cache_bytes += sum(memory[stage]['pickled_bytes'] * rows[stage] for stage in STAGES)
+        if config['vendors'].get('cache_dir') is not None:
+            cache_bytes += memory['vendors']['pickled_bytes'] * rows['vendors']
+    disk_bytes += cache_bytes
+
+    memory_limit = available_memory()
+    if memory_limit is not None:
+        # The memory this process already uses is available to the run as well
+        memory_limit += base_memory
+    free_disk = shutil.disk_usage(os.getcwd()).free
+
+    warnings = []
+    if memory_limit is not None and peak_memory > HEADROOM * memory_limit:
+        advice = {"staged": "set general.streaming: true so only one chunk is held at a time",
+                  "sharded": "lower general.workers or general.chunk_size",
+                  "streaming": "lower general.chunk_size"}[pipeline]
+        if held_rows:
+            setting = 'row_group_size' if output_format == 'parquet' else 'batch_size'
+            advice += f", or general.{output_format}.{setting}"
+        warnings.append(f"Peak memory of about {format_bytes(peak_memory)} will not fit in the "
+                        f"{format_bytes(memory_limit)} available; {advice}")
+    if disk_bytes > HEADROOM * free_disk:
+        warnings.append(f"About {format_bytes(disk_bytes)} of output will not fit in the "
+                        f"{format_bytes(free_disk)} free on this disk")
+
+    return {
+        "sample_sizes": [small, large],
+        "pipeline": pipeline,
+        "processes": processes,
+        "entities": entities,
+        "compute_seconds": compute_seconds,
+        "rate_limited_seconds": rate_seconds,
+        "wall_seconds": max(compute_seconds, rate_seconds),
+        "peak_memory_bytes": peak_memory,
+        "available_memory_bytes": memory_limit,
+        "output_bytes": output_bytes,
+        "cache_bytes": cache_bytes,
+        "disk_bytes": disk_bytes,
+        "free_disk_bytes": free_disk,
+        "warnings": warnings,
+    }
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_duration(seconds: float) -> str:
+    return str(timedelta(seconds=round(seconds)))
+
+
+def plan_report(config: CompiledConfig, plan: Dict) -> List[str]:
+    general = config['general']
+    lines = [f"Plan for {config['purchase_orders']['total_count']} POs: {general['output_format']} output, "
+             f"{general.get('engine', 'python')} engine, {plan['pipeline']} pipeline in {plan['processes']} "
+             f"process(es), calibrated on samples of {plan['sample_sizes'][0]} and {plan['sample_sizes'][1]} POs"]
+    for entity, estimate in plan['entities'].items():
+        lines.append(f"  {entity:<16} {estimate['rows']:>12,} rows  {format_duration(estimate['seconds']):>10}  "
+                     f"{format_bytes(estimate['bytes']):>10}")
+    wall = f"Estimated wall time {format_duration(plan['wall_seconds'])}"
+    if plan['rate_limited_seconds'] > plan['compute_seconds']:
+        wall += (f", set by max_operations_per_second ({general['max_operations_per_second']}); "
+                 f"generation alone takes {format_duration(plan['compute_seconds'])}")
+    lines.append(wall)
+    available = plan['available_memory_bytes']
+    lines.append(f"Estimated peak memory {format_bytes(plan['peak_memory_bytes'])}"
+                 + (f" of {format_bytes(available)} available" if available is not None else ""))
+    disk = f"Estimated output {format_bytes(plan['output_bytes'])}"
+    if plan['cache_bytes']:
+        disk += f" plus {format_bytes(plan['cache_bytes'])} of caches"
+    merge_bytes = plan['disk_bytes'] - plan['output_bytes'] - plan['cache_bytes']
+    if merge_bytes > 0:
+        disk += f" plus {format_bytes(merge_bytes)} of shard parts while they are merged"
+    lines.append(f"{disk}; {format_bytes(plan['free_disk_bytes'])} free on disk")
+    return lines
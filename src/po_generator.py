@@ -1,112 +1,143 @@
 import random
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import List, Iterator, Optional
 from tqdm import tqdm
-from src.description_generator import DescriptionGenerator
-from src.utils.rate_limiter import RateLimiter
+from src.config import CompiledConfig, compile_config
+from src.catalog import ItemCatalog
+from src.records import Vendor, PurchaseOrder, LineItem, CatalogItem
+from src.utils.id_allocator import get_id_allocator
+from src.utils.metrics import hot_path
+from src.utils.rate_limiter import get_rate_limiter
+from src.utils.sampling import category_mix, date_table, vendor_table
 
 
 class PurchaseOrderGenerator:
-    def __init__(self, config: Dict, vendors: List[Dict], description_generator: DescriptionGenerator):
-        self.config = config
+    NOTES = [
+        "Please deliver during business hours",
+        "Fragile items included, handle with care",
+        "Contact provided number before delivery",
+        "Installation services required",
+        "Rush order, please expedite"
+    ]
+
+    def __init__(self, config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog):
+        self.config = compile_config(config)
         self.vendors = vendors
-        self.description_generator = description_generator
-        self.rate_limiter = RateLimiter(config['general']['max_operations_per_second'])
-        self.start_date = datetime.strptime(config['general']['start_date'], "%Y-%m-%d")
-        self.end_date = datetime.strptime(config['general']['end_date'], "%Y-%m-%d")
-
-    def generate_purchase_orders(self) -> List[Dict]:
-        total_pos = self.config['purchase_orders']['total_count']
-        purchase_orders = []
-
-        for _ in tqdm(range(total_pos), desc="Generating Purchase Orders"):
-            self.rate_limiter.limit()
-            po = self._generate_single_po()
-            purchase_orders.append(po)
-
-        return purchase_orders
-
-    def _generate_single_po(self) -> Dict:
-        vendor = random.choice(self.vendors)
-        region = random.choice(vendor['regions'])
-        po_date = self._random_date(self.start_date, self.end_date)
-        region_config = next(r for r in self.config['regions'] if r['name'] == region)
-        currency = random.choice(region_config['currencies'])
-
-        po = {
-            "po_number": f"PO{random.randint(1000000, 9999999)}",
-            "vendor_id": vendor['vendor_id'],
-            "vendor_name": vendor['name'],
-            "region": region,
-            "po_date": po_date.strftime("%Y-%m-%d"),
-            "currency": currency,
-            "items": self._generate_line_items(vendor['specializations'], region, currency),
-            "status": "Open",
-            "shipping_address": self._generate_address(region),
-            "billing_address": self._generate_address(region),
-            "terms_and_conditions": f"Net {vendor['payment_terms']}",
-            "notes": self._generate_notes()
-        }
-
-        po["total_amount"] = sum(item['total_price'] for item in po['items'])
+        self.catalog = catalog
+        self.rate_limiter = get_rate_limiter(config['general']['max_operations_per_second'])
+        self.po_numbers = get_id_allocator('purchase_order')
+        self.start_date = self.config.start_date
+        self.end_date = self.config.end_date
+        # Alias tables for the skewed distributions in config.yaml `sampling`; None draws uniformly
+        self.vendor_table = vendor_table(self.config, len(vendors))
+        self.category_mix = category_mix(self.config)
+        self.date_table = date_table(self.config, self.start_date, self.end_date)
+        self.span_seconds = int((self.end_date - self.start_date).total_seconds())
+
+    def generate_purchase_orders(self) -> List[PurchaseOrder]:
+        return list(self.iter_purchase_orders())
+
+    def iter_purchase_orders(self, chunk_size: int = 1000) -> Iterator[PurchaseOrder]:
+        for chunk in self.iter_chunks(chunk_size):
+            yield from chunk
+
+    def iter_chunks(self, chunk_size: int, total_count: Optional[int] = None,
+                    show_progress: bool = True) -> Iterator[List[PurchaseOrder]]:
+        total_pos = self.config['purchase_orders']['total_count'] if total_count is None else total_count
+        with tqdm(total=total_pos, desc="Generating Purchase Orders", disable=not show_progress) as progress:
+            remaining = total_pos
+            while remaining > 0:
+                count = min(chunk_size, remaining)
+                yield self.generate_batch(count)
+                progress.update(count)
+                remaining -= count
+
+    def generate_batch(self, count: int) -> List[PurchaseOrder]:
+        self.rate_limiter.acquire(count)
+        return [self._generate_single_po() for _ in range(count)]
+
+    @hot_path("purchase_orders.single_po")
+    def _generate_single_po(self) -> PurchaseOrder:
+        vendor = self._pick_vendor()
+        region = random.choice(vendor.regions)
+        po_day = self._pick_po_day()
+        currency = random.choice(self.config.regions[region].currencies)
+
+        po = PurchaseOrder(
+            po_number=self.po_numbers.next_id(),
+            vendor_id=vendor.vendor_id,
+            vendor_name=vendor.name,
+            region=region,
+            po_date=po_day,
+            currency=currency,
+            items=self._generate_line_items(vendor.specializations, region, currency, po_day),
+            status="Open",
+            shipping_address=self._generate_address(region),
+            billing_address=self._generate_address(region),
+            terms_and_conditions=f"Net {vendor.payment_terms}",
+            notes=self._generate_notes()
+        )
+
+        po.total_amount = sum(item.total_price for item in po.items)
         return po
 
-    def _generate_line_items(self, specializations: List[str], region: str, currency: str) -> List[Dict]:
+    @hot_path("purchase_orders.line_items")
+    def _generate_line_items(self, specializations: List[str], region: str, currency: str,
+                             po_day: int) -> List[LineItem]:
         num_items = random.randint(self.config['purchase_orders']['min_items'],
                                    self.config['purchase_orders']['max_items'])
         items = []
         for _ in range(num_items):
-            category = random.choice(specializations)
-            item_desc = self.description_generator.generate_item_description(category)
+            category = self._pick_category(specializations)
+            sku = self.catalog.pick(category)
             quantity = random.randint(1, 100)
-            unit_price = self._generate_unit_price(category, currency)
+            unit_price = self._generate_unit_price(sku, currency, po_day)
             total_price = quantity * unit_price
-            tax_rate = self._get_tax_rate(category, region)
-
-            item = {
-                "item_number": f"ITEM{random.randint(100000, 999999)}",
-                "description": item_desc['description'],
-                "category": category,
-                "quantity": quantity,
-                "unit_price": unit_price,
-                "total_price": total_price,
-                "currency": currency,
-                "tax_rate": tax_rate,
-                "tax_amount": total_price * tax_rate,
-                "brand": item_desc['brand'],
-                "model": item_desc['model']
-            }
+            tax_rate = self._get_tax_rate(category, region, po_day)
+
+            item = LineItem(
+                sku=sku,
+                quantity=quantity,
+                unit_price=unit_price,
+                total_price=total_price,
+                currency=currency,
+                tax_rate=tax_rate,
+                tax_amount=total_price * tax_rate
+            )
             items.append(item)
         return items
 
-    def _generate_unit_price(self, category: str, currency: str) -> float:
-        base_price = random.uniform(10, 1000)
-        exchange_rate = self.config['exchange_rates']['rates'][currency]
-        return round(base_price * exchange_rate, 2)
+    def _generate_unit_price(self, sku: CatalogItem, currency: str, po_day: int) -> float:
+        # The SKU's base price with the configured variation, converted to the PO currency at the PO date's rate
+        exchange_rate = self.config.fx_rate(currency, po_day)
+        return self.catalog.unit_price(sku, exchange_rate)
 
-    def _get_tax_rate(self, category: str, region: str) -> float:
-        region_config = next(r for r in self.config['regions'] if r['name'] == region)
-        return region_config['tax_rates'].get(category, region_config['tax_rates']['default'])
+    def _get_tax_rate(self, category: str, region: str, po_day: int) -> float:
+        return self.config.tax_rate(category, region, po_day)
 
-    def _random_date(self, start: datetime, end: datetime) -> datetime:
-        return start + timedelta(seconds=random.randint(0, int((end - start).total_seconds())))
+    def _pick_vendor(self) -> Vendor:
+        if self.vendor_table is None:
+            return random.choice(self.vendors)
+        return self.vendors[self.vendor_table.draw()]
+
+    def _pick_category(self, specializations: List[str]) -> str:
+        if self.category_mix is None:
+            return random.choice(specializations)
+        return self.category_mix.pick(specializations)
+
+    def _pick_po_day(self) -> int:
+        # An epoch day; the uniform draw picks a second of the range and keeps its day
+        if self.date_table is None:
+            return self.config.first_day + random.randint(0, self.span_seconds) // 86400
+        return self.config.first_day + self.date_table.draw()
 
     def _generate_address(self, region: str) -> str:
-        region_config = next(r for r in self.config['regions'] if r['name'] == region)
-        return f"123 Business St, Anytown, {random.choice(region_config['countries'])}"
+        return f"123 Business St, Anytown, {random.choice(self.config.regions[region].countries)}"
 
     def _generate_notes(self) -> str:
-        notes = [
-            "Please deliver during business hours",
-            "Fragile items included, handle with care",
-            "Contact provided number before delivery",
-            "Installation services required",
-            "Rush order, please expedite"
-        ]
-        return random.choice(notes)
-
-
-def generate_purchase_orders(config: Dict, vendors: List[Dict], description_generator: DescriptionGenerator) -> List[
-    Dict]:
-    generator = PurchaseOrderGenerator(config, vendors, description_generator)
+        return random.choice(self.NOTES)
+
+
+def generate_purchase_orders(config: CompiledConfig, vendors: List[Vendor],
+                             catalog: ItemCatalog) -> List[PurchaseOrder]:
+    generator = PurchaseOrderGenerator(config, vendors, catalog)
     return generator.generate_purchase_orders()
\ No newline at end of file
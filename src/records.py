@@ -0,0 +1,176 @@
+from typing import Dict, Iterator, Optional
+from src.utils.dates import day_field
+from src.utils.schema import ITEM_FIELDS
+
+# Generated entities are slotted records rather than dicts: no per-instance __dict__ and no
+# repeated key storage. Writers read fields through get()/[] so records and plain dicts are
+# interchangeable for them; to_dict() builds a plain dict only when one is actually needed.
+# Document dates are kept as epoch days (po_day, ...) and read as ISO text through their fields.
+
+
+class Record:
+    __slots__ = ()
+    FIELDS = ()
+    # Fields left out of to_dict() while unset, matching keys that used to be added conditionally
+    OPTIONAL_FIELDS = ()
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+
+    def get(self, field: str, default=None):
+        return getattr(self, field, default)
+
+    def __getitem__(self, field: str):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def keys(self) -> Iterator[str]:
+        return iter(self.to_dict())
+
+    def to_dict(self) -> Dict:
+        values = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is None and field in self.OPTIONAL_FIELDS:
+                continue
+            values[field] = [item.to_dict() for item in value] if field == "items" else value
+        return values
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Vendor(Record):
+    FIELDS = (
+        "vendor_id", "name", "description", "address", "tax_id", "payment_terms", "regions",
+        "specializations", "rating", "is_preferred", "contact"
+    )
+    __slots__ = FIELDS
+
+
+class CatalogItem(Record):
+    # One SKU of the item catalog; its strings are interned and shared by every line ordering it
+    FIELDS = ("item_number", "description", "category", "brand", "model", "base_price")
+    __slots__ = FIELDS
+
+
+class LineItem(Record):
+    # A PO line: the ordered SKU plus what is specific to this order
+    FIELDS = tuple(ITEM_FIELDS)
+    __slots__ = ("sku", "quantity", "unit_price", "total_price", "currency", "tax_rate", "tax_amount")
+
+    def __init__(self, sku: CatalogItem, quantity: int, unit_price: float, total_price: float, currency: str,
+                 tax_rate: float, tax_amount: float):
+        self.sku = sku
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.total_price = total_price
+        self.currency = currency
+        self.tax_rate = tax_rate
+        self.tax_amount = tax_amount
+
+    @property
+    def item_number(self) -> str:
+        return self.sku.item_number
+
+    @property
+    def description(self) -> str:
+        return self.sku.description
+
+    @property
+    def category(self) -> str:
+        return self.sku.category
+
+    @property
+    def brand(self) -> str:
+        return self.sku.brand
+
+    @property
+    def model(self) -> str:
+        return self.sku.model
+
+
+class InvoiceLine(Record):
+    # An invoiced PO line. Only a unit price or quantity that differs from the PO line is
+    # stored; the remaining fields are read through from the referenced LineItem.
+    FIELDS = tuple(ITEM_FIELDS)
+    __slots__ = ("po_line", "unit_price", "quantity")
+
+    def __init__(self, po_line: LineItem, unit_price: Optional[float] = None, quantity: Optional[int] = None):
+        self.po_line = po_line
+        if unit_price is not None:
+            self.unit_price = unit_price
+        if quantity is not None:
+            self.quantity = quantity
+
+    def __getattr__(self, name: str):
+        # Only reached for unset slots and fields the line does not store itself
+        if name == "po_line" or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.po_line, name)
+
+    def __getstate__(self):
+        # Pickle only the slots that are set; delegated fields come from po_line again
+        state = {}
+        for name in self.__slots__:
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return None, state
+
+    @property
+    def total_price(self) -> float:
+        return self.quantity * self.unit_price
+
+    @property
+    def tax_amount(self) -> float:
+        return self.total_price * self.tax_rate
+
+
+class PurchaseOrder(Record):
+    FIELDS = (
+        "po_number", "vendor_id", "vendor_name", "region", "po_date", "currency", "items", "status",
+        "shipping_address", "billing_address", "terms_and_conditions", "notes", "total_amount"
+    )
+    __slots__ = tuple(field for field in FIELDS if field != "po_date") + ("po_day",)
+    po_date = day_field("po_day")
+
+
+class Invoice(Record):
+    FIELDS = (
+        "invoice_number", "po_number", "vendor_id", "vendor_name", "region", "invoice_date", "due_date",
+        "currency", "items", "subtotal", "tax_amount", "total_amount", "status", "payment_terms", "notes",
+        "block_reason", "grir_issue"
+    )
+    OPTIONAL_FIELDS = ("block_reason", "grir_issue")
+    __slots__ = tuple(field for field in FIELDS
+                      if field not in ("invoice_date", "due_date")) + ("invoice_day", "due_day")
+    invoice_date = day_field("invoice_day")
+    due_date = day_field("due_day")
+
+
+class Payment(Record):
+    FIELDS = (
+        "payment_id", "invoice_number", "po_number", "vendor_id", "vendor_name", "region", "payment_date",
+        "amount", "currency", "payment_method", "status", "notes"
+    )
+    __slots__ = tuple(field for field in FIELDS if field != "payment_date") + ("payment_day",)
+    payment_date = day_field("payment_day")
+
+
+def json_default(value):
+    # json.dump(s) hook so records serialise wherever a dict would
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
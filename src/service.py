@@ -0,0 +1,404 @@
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import logging
+import os
+import signal
+import stat
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from src.config import RECORD_INVOICES_PER_PO, CompiledConfig, ConfigError, compile_config
+from src.catalog import ItemCatalog, generate_catalog
+from src.description_generator import DescriptionGenerator
+from src.main import load_config, vendor_cache_path
+from src.pipeline import STAGES, StageRunner, chunk_counts, record_positions
+from src.records import Vendor, json_default
+from src.utils.id_allocator import configure_id_allocation, get_id_allocator
+from src.utils.rate_limiter import create_rate_limiter, install_rate_limiter
+from src.utils.seeding import resolve_master_seed
+from src.vendor_generator import load_or_generate_vendors
+
+# A resident generator: `python -m src.service` loads config.yaml, the lexicon, the vendor master
+# and the catalog once, hands them once to a pool of worker processes and then serves batches
+# over HTTP on a TCP port or a Unix socket:
+#
+#   GET /batches?count=N[&region=NAME][&start_date=YYYY-MM-DD][&end_date=YYYY-MM-DD][&seed=Z][&offset=K]
+#
+# streams N POs with their invoices and payments as JSON Lines ({"table": "invoices", ...}) in a
+# chunked response. A request is split into a small first chunk, so the first records arrive
+# within milliseconds, and then chunks of service.chunk_size POs that the workers generate in
+# parallel. At most service.prefetch_chunks chunks of a request are generated ahead of what has
+# been written to its client, and the next one is only submitted once the last write has drained,
+# so a slow reader holds back its own request rather than the other requests or the server's
+# memory. Chunk i is seeded with derive_seed(seed, stage, i) and numbered from PO counter
+# offset + its first PO, like a --records range, so a response only depends on the request and
+# the service's config: the same request gets the same bytes. GET /vendors and GET /catalog stream
+# the reference data the batches refer to, and GET /health reports the service's state.
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DEFAULTS = {
+    "host": "127.0.0.1",
+    "port": 8765,
+    "socket": None,
+    "workers": 2,
+    "chunk_size": 500,
+    "first_chunk_size": 10,
+    "prefetch_chunks": 2,
+    "max_count": 100000,
+}
+BATCH_PARAMETERS = ("count", "region", "start_date", "end_date", "seed", "offset")
+# Generators kept per worker, one per (region, start_date, end_date) requested
+CACHED_RUNNERS = 16
+REQUEST_TIMEOUT = 10.0
+MAX_HEADERS = 100
+REFERENCE_BLOCK = 64 * 1024
+
+_worker_state = {}
+
+
+class RequestError(ValueError):
+    pass
+
+
+class BatchRequest(NamedTuple):
+    count: int
+    region: Optional[str]
+    start_date: str
+    end_date: str
+    seed: int
+    offset: int
+
+
+def request_config(config: CompiledConfig, region: Optional[str], start_date: str, end_date: str) -> CompiledConfig:
+    # config.yaml narrowed to one region (or all of them) and a date range
+    raw = copy.deepcopy(config.raw)
+    raw['general']['start_date'] = start_date
+    raw['general']['end_date'] = end_date
+    if region is not None:
+        raw['regions'] = [entry for entry in raw['regions'] if entry['name'] == region]
+    return compile_config(raw)
+
+
+def region_vendors(vendors: List[Vendor], region: Optional[str]) -> List[Vendor]:
+    # The vendors serving a region, narrowed to it so every PO they are given is placed there
+    if region is None:
+        return vendors
+    return [Vendor(**dict(vendor.to_dict(), regions=[region])) for vendor in vendors if region in vendor.regions]
+
+
+def request_chunks(count: int, chunk_size: int, first_chunk_size: int) -> List[Tuple[int, int]]:
+    # (first PO, PO count) of every chunk of a request: a small first chunk, then full ones
+    first = min(first_chunk_size, count)
+    sizes = [first] + chunk_counts(count - first, chunk_size)
+    return list(zip(itertools.accumulate([0] + sizes[:-1]), sizes))
+
+
+def json_lines(table: str, records) -> bytes:
+    return "".join(json.dumps(dict(table=table, **record.to_dict()), ensure_ascii=False, separators=(',', ':'),
+                              default=json_default) + "\n" for record in records).encode('utf-8')
+
+
+def _init_worker(config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog, master_seed: int,
+                 rate_limiter):
+    install_rate_limiter(rate_limiter)
+    # Document numbers are keyed by the service's master seed; every chunk seeks to its own counters
+    configure_id_allocation(master_seed, digits=config.id_digits)
+    _worker_state['config'] = config
+    _worker_state['vendors'] = vendors
+    _worker_state['catalog'] = catalog
+    _worker_state['runners'] = OrderedDict()
+
+
+def _runner(request: BatchRequest) -> StageRunner:
+    # Building the generators costs more than a first chunk, so they are kept for later requests
+    # with the same region and dates; only the seed differs between those
+    runners = _worker_state['runners']
+    key = (request.region, request.start_date, request.end_date)
+    runner = runners.get(key)
+    if runner is None:
+        config = request_config(_worker_state['config'], request.region, request.start_date, request.end_date)
+        runner = runners[key] = StageRunner(config, region_vendors(_worker_state['vendors'], request.region),
+                                            _worker_state['catalog'], request.seed)
+        if len(runners) > CACHED_RUNNERS:
+            runners.popitem(last=False)
+    runners.move_to_end(key)
+    runner.seed = request.seed
+    return runner
+
+
+def _warm_up(request: BatchRequest) -> int:
+    _runner(request)
+    return os.getpid()
+
+
+def _generate_chunk(request: BatchRequest, chunk_index: int, first_po: int, count: int) -> Tuple[bytes, Dict[str, int]]:
+    runner = _runner(request)
+    for entity, position in record_positions(request.offset + first_po).items():
+        get_id_allocator(entity).seek(position)
+    data = []
+    counts = {}
+    source = count
+    for stage in STAGES:
+        source = runner.run(stage, chunk_index, source)
+        data.append(json_lines(stage, source))
+        counts[stage] = len(source)
+    return b"".join(data), counts
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    lines.extend(["Connection: close", "", ""])
+    return "\r\n".join(lines).encode('latin-1')
+
+
+def _frame(data: bytes) -> bytes:
+    # One chunk of a Transfer-Encoding: chunked body
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+class BatchService:
+    def __init__(self, config: CompiledConfig, vendors: List[Vendor], catalog: ItemCatalog, master_seed: int,
+                 settings: Dict):
+        self.config = config
+        self.settings = settings
+        self.vendors = vendors
+        self.catalog = catalog
+        self.workers = settings['workers'] or os.cpu_count() or 1
+        self.regions = sorted({region for vendor in vendors for region in vendor.regions})
+        self.request_configs: Dict[Tuple[Optional[str], str, str], Optional[str]] = OrderedDict()
+        # Serialised once; every request for them streams the same bytes
+        self.reference = {"/vendors": json_lines('vendors', vendors), "/catalog": json_lines('catalog', catalog.items)}
+        self.active = 0
+        self.served = 0
+        rate_limiter = create_rate_limiter(config['general']['max_operations_per_second'], shared=True)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                        initargs=(config, vendors, catalog, master_seed, rate_limiter))
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        socket_path = self.settings['socket']
+        try:
+            # Start every worker and build the default request's generators before accepting connections
+            default = self.parse_request({"count": ["1"], "seed": ["0"]})
+            await asyncio.gather(*(loop.run_in_executor(self.pool, _warm_up, default) for _ in range(self.workers)))
+            if socket_path is not None:
+                if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                    # Left behind by a service that did not shut down
+                    os.unlink(socket_path)
+                server = await asyncio.start_unix_server(self.handle, path=socket_path)
+                address = socket_path
+            else:
+                server = await asyncio.start_server(self.handle, self.settings['host'], self.settings['port'])
+                address = f"http://{self.settings['host']}:{self.settings['port']}"
+            stop = asyncio.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(signum, stop.set)
+                except (NotImplementedError, RuntimeError):
+                    # Not on Windows; Ctrl+C still ends asyncio.run() there
+                    pass
+            logger.info(f"Serving batches on {address} with {self.workers} workers, "
+                        f"{len(self.vendors)} vendors and {len(self.catalog.items)} catalog items")
+            async with server:
+                await stop.wait()
+            logger.info(f"Shutting down after {self.served} requests")
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            if socket_path is not None and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    def parse_request(self, params: Dict[str, List[str]]) -> BatchRequest:
+        unknown = sorted(set(params) - set(BATCH_PARAMETERS))
+        if unknown:
+            raise RequestError(f"Unknown parameters: {', '.join(unknown)}")
+        values = {}
+        for name, given in params.items():
+            if len(given) != 1:
+                raise RequestError(f"{name} must be given once")
+            values[name] = given[0]
+        for name in ('count', 'seed', 'offset'):
+            if name in values:
+                try:
+                    values[name] = int(values[name])
+                except ValueError:
+                    raise RequestError(f"{name} must be an integer") from None
+        if 'count' not in values:
+            raise RequestError("count is required")
+        count = values['count']
+        if not 1 <= count <= self.settings['max_count']:
+            raise RequestError(f"count must be between 1 and {self.settings['max_count']}")
+        offset = values.get('offset', 0)
+        if offset < 0:
+            raise RequestError("offset must not be negative")
+        # PO n owns RECORD_INVOICES_PER_PO invoice and payment numbers, so each space must cover the last PO
+        for entity, per_po in (("purchase_order", 1), ("invoice", RECORD_INVOICES_PER_PO),
+                               ("payment", RECORD_INVOICES_PER_PO)):
+            if (offset + count) * per_po > 9 * 10 ** (self.config.id_digits[entity] - 1):
+                raise RequestError(f"offset + count exceeds the {entity} number space; raise ids.digits.{entity}")
+        region = values.get('region')
+        if region is not None and region not in self.regions:
+            raise RequestError(f"No vendor serves region {region!r}; regions: {', '.join(self.regions)}")
+        general = self.config['general']
+        start_date = values.get('start_date', general['start_date'])
+        end_date = values.get('end_date', general['end_date'])
+        self._check_config(region, start_date, end_date)
+        return BatchRequest(count, region, start_date, end_date, resolve_master_seed(values.get('seed')), offset)
+
+    def _check_config(self, region: Optional[str], start_date: str, end_date: str):
+        # Compiled here once per region and dates, so workers only get requests they can run
+        key = (region, start_date, end_date)
+        if key not in self.request_configs:
+            try:
+                request_config(self.config, region, start_date, end_date)
+                self.request_configs[key] = None
+            except (ConfigError, ValueError) as error:
+                self.request_configs[key] = str(error)
+            if len(self.request_configs) > 1024:
+                self.request_configs.popitem(last=False)
+        if self.request_configs[key] is not None:
+            raise RequestError(self.request_configs[key])
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, target = await self._read_request(reader)
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError):
+            writer.close()
+            return
+        url = urlsplit(target)
+        self.active += 1
+        try:
+            if method != 'GET':
+                await self._send_json(writer, 405, {"error": "Only GET is supported"})
+            elif url.path == '/batches':
+                await self._stream_batch(writer, parse_qs(url.query, keep_blank_values=True), target)
+            elif url.path in self.reference:
+                await self._stream_reference(writer, self.reference[url.path])
+            elif url.path == '/health':
+                await self._send_json(writer, 200, {
+                    "status": "ok", "workers": self.workers, "vendors": len(self.vendors),
+                    "catalog_items": len(self.catalog.items), "regions": self.regions,
+                    "active_requests": self.active - 1, "served_requests": self.served,
+                })
+            else:
+                await self._send_json(writer, 404, {"error": f"Unknown path {url.path}"})
+            self.served += 1
+        except ConnectionError:
+            logger.info(f"Client disconnected during {target}")
+        except Exception:
+            # Headers may already be sent; closing without the last chunk tells the client the body is incomplete
+            logger.exception(f"Failed to serve {target}")
+        finally:
+            self.active -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str]:
+        # The request line; headers are read past (there is no body to a GET) and ignored
+        parts = (await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)).decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise ValueError("Malformed request line")
+        for _ in range(MAX_HEADERS):
+            line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+            if line in (b"\r\n", b"\n", b""):
+                return parts[0], parts[1]
+        raise ValueError("Too many headers")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, body: Dict):
+        data = json.dumps(body).encode('utf-8')
+        writer.write(_head(status, {"Content-Type": "application/json", "Content-Length": str(len(data))}) + data)
+        await writer.drain()
+
+    async def _stream_reference(self, writer: asyncio.StreamWriter, data: bytes):
+        writer.write(_head(200, {"Content-Type": "application/x-ndjson", "Content-Length": str(len(data))}))
+        for start in range(0, len(data), REFERENCE_BLOCK):
+            writer.write(data[start:start + REFERENCE_BLOCK])
+            await writer.drain()
+
+    async def _stream_batch(self, writer: asyncio.StreamWriter, params: Dict[str, List[str]], target: str):
+        started = time.perf_counter()
+        try:
+            request = self.parse_request(params)
+        except RequestError as error:
+            await self._send_json(writer, 400, {"error": str(error)})
+            return
+        loop = asyncio.get_running_loop()
+        chunks = iter(enumerate(request_chunks(request.count, self.settings['chunk_size'],
+                                               self.settings['first_chunk_size'])))
+        pending = deque()
+
+        def submit():
+            for chunk_index, (first_po, count) in itertools.islice(chunks, 1):
+                pending.append(loop.run_in_executor(self.pool, _generate_chunk, request, chunk_index, first_po, count))
+
+        for _ in range(self.settings['prefetch_chunks']):
+            submit()
+        writer.write(_head(200, {"Content-Type": "application/x-ndjson", "Transfer-Encoding": "chunked",
+                                 "X-Seed": str(request.seed)}))
+        counts = dict.fromkeys(STAGES, 0)
+        first_chunk = None
+        try:
+            while pending:
+                data, chunk_rows = await pending.popleft()
+                writer.write(_frame(data))
+                await writer.drain()
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                for stage, rows in chunk_rows.items():
+                    counts[stage] += rows
+                submit()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            # Chunks not started yet are dropped when the client goes away or a chunk fails
+            for future in pending:
+                future.cancel()
+        logger.info(f"{target}: {counts['purchase_orders']} POs, {counts['invoices']} invoices and "
+                    f"{counts['payments']} payments in {time.perf_counter() - started:.3f}s, "
+                    f"first chunk after {first_chunk * 1000:.1f} ms")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve synthetic Accounts Payable batches from a warm generator")
+    parser.add_argument('--host', default=None, help="address to listen on (default: service.host)")
+    parser.add_argument('--port', type=int, default=None, help="TCP port to listen on (default: service.port)")
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help="listen on a Unix socket instead of TCP (default: service.socket)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes generating chunks (default: service.workers)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(Path(__file__).parent.parent / "config" / "config.yaml")
+    settings = dict(SERVICE_DEFAULTS, **(config.get('service') or {}))
+    for name in ('host', 'port', 'socket', 'workers'):
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+
+    description_generator = DescriptionGenerator(Path(__file__).parent.parent / "config" / "description_config.yaml")
+    master_seed = resolve_master_seed(config['general'].get('seed'))
+    configure_id_allocation(master_seed, digits=config.id_digits)
+    vendors = load_or_generate_vendors(config, description_generator, master_seed, vendor_cache_path(config))
+    catalog = generate_catalog(config, description_generator, master_seed)
+
+    asyncio.run(BatchService(config, vendors, catalog, master_seed, settings).serve())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import random
+from typing import Callable, Dict, List, TypeVar
+from src.utils.metrics import track
+
+T = TypeVar('T')
+
+
+class AttributePool:
+    # Values of an attribute are produced in one bulk pass the first time it is drawn and then
+    # sampled with the `random` module, so expensive sources (Faker providers, description
+    # templates) run `size` times per attribute instead of once per record. A size of 0 turns
+    # pooling off and calls the factory for every draw.
+    def __init__(self, size: int):
+        self.size = size
+        self.pools: Dict[str, List] = {}
+
+    def draw(self, name: str, factory: Callable[[], T]) -> T:
+        if not self.size:
+            return factory()
+        values = self.pools.get(name)
+        if values is None:
+            with track(f"attribute_pool.{name}"):
+                values = self.pools[name] = [factory() for _ in range(self.size)]
+        return random.choice(values)
@@ -0,0 +1,271 @@
+import os
+import shutil
+from collections import OrderedDict
+from typing import List, Dict, Iterable, Optional, Tuple
+from src.utils.dates import to_day
+from src.utils.metrics import record_output, track
+from src.utils.schema import ITEM_FIELDS, LINE_TABLES
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for the parquet output format
+    pa = None
+    pq = None
+
+# Entity -> (date column used for the month partition, or None when the entity is not partitioned)
+PARTITION_DATE_FIELDS = {
+    "vendors": None,
+    "catalog": None,
+    "purchase_orders": "po_date",
+    "po_lines": "po_date",
+    "invoices": "invoice_date",
+    "invoice_lines": "invoice_date",
+    "payments": "payment_date",
+}
+
+# Date column -> the record slot holding it as an epoch day
+DATE_FIELDS = {"po_date": "po_day", "invoice_date": "invoice_day", "due_date": "due_day", "payment_date": "payment_day"}
+
+
+def _line_fields(keys: List[Tuple[str, object]]) -> List[Tuple[str, object]]:
+    return keys + [
+        ("line_number", pa.int32()),
+        ("item_number", pa.string()),
+        ("description", pa.string()),
+        ("category", pa.string()),
+        ("quantity", pa.int64()),
+        ("unit_price", pa.float64()),
+        ("total_price", pa.float64()),
+        ("currency", pa.string()),
+        ("tax_rate", pa.float64()),
+        ("tax_amount", pa.float64()),
+        ("brand", pa.string()),
+        ("model", pa.string()),
+    ]
+
+
+def _date_array(rows: List[Dict], field: str, slot: str):
+    # date32 counts days since the epoch like the records' *_day slots, so those integers are used
+    # as they are; only plain dict rows (ISO text, no slot) are converted
+    days = [row.get(slot) for row in rows]
+    if None in days:
+        days = [day if day is not None or row.get(field) is None else to_day(row.get(field))
+                for day, row in zip(days, rows)]
+    return pa.array(days, pa.date32())
+
+
+def get_schema(entity: str):
+    # Partition columns (region, month) live in the directory names, not in the files
+    if pa is None:
+        raise ImportError("The parquet output format requires pyarrow: pip install pyarrow")
+    schemas = {
+        "vendors": [
+            ("vendor_id", pa.string()),
+            ("name", pa.string()),
+            ("description", pa.string()),
+            ("address", pa.string()),
+            ("tax_id", pa.string()),
+            ("payment_terms", pa.string()),
+            ("regions", pa.list_(pa.string())),
+            ("specializations", pa.list_(pa.string())),
+            ("rating", pa.float64()),
+            ("is_preferred", pa.bool_()),
+            ("contact", pa.struct([("name", pa.string()), ("email", pa.string()), ("phone", pa.string())])),
+        ],
+        "catalog": [
+            ("item_number", pa.string()),
+            ("description", pa.string()),
+            ("category", pa.string()),
+            ("brand", pa.string()),
+            ("model", pa.string()),
+            ("base_price", pa.float64()),
+        ],
+        "purchase_orders": [
+            ("po_number", pa.string()),
+            ("vendor_id", pa.string()),
+            ("vendor_name", pa.string()),
+            ("po_date", pa.date32()),
+            ("currency", pa.string()),
+            ("status", pa.string()),
+            ("shipping_address", pa.string()),
+            ("billing_address", pa.string()),
+            ("terms_and_conditions", pa.string()),
+            ("notes", pa.string()),
+            ("total_amount", pa.float64()),
+        ],
+        "po_lines": _line_fields([("po_number", pa.string())]),
+        "invoices": [
+            ("invoice_number", pa.string()),
+            ("po_number", pa.string()),
+            ("vendor_id", pa.string()),
+            ("vendor_name", pa.string()),
+            ("invoice_date", pa.date32()),
+            ("due_date", pa.date32()),
+            ("currency", pa.string()),
+            ("subtotal", pa.float64()),
+            ("tax_amount", pa.float64()),
+            ("total_amount", pa.float64()),
+            ("status", pa.string()),
+            ("payment_terms", pa.string()),
+            ("notes", pa.string()),
+            ("block_reason", pa.string()),
+            ("grir_issue", pa.struct([("type", pa.string()), ("description", pa.string())])),
+        ],
+        "invoice_lines": _line_fields([("invoice_number", pa.string()), ("po_number", pa.string())]),
+        "payments": [
+            ("payment_id", pa.string()),
+            ("invoice_number", pa.string()),
+            ("po_number", pa.string()),
+            ("vendor_id", pa.string()),
+            ("vendor_name", pa.string()),
+            ("payment_date", pa.date32()),
+            ("amount", pa.float64()),
+            ("currency", pa.string()),
+            ("payment_method", pa.string()),
+            ("status", pa.string()),
+            ("notes", pa.string()),
+        ],
+    }
+    return pa.schema(schemas[entity])
+
+
+class _PartitionedTable:
+    def __init__(self, root: str, entity: str, row_group_size: int, max_open_files: int, append: bool = False):
+        # Like opening a CSV with 'w', any previous dataset at this location is replaced; with
+        # append, new part files are added next to the existing ones
+        if not append:
+            shutil.rmtree(root, ignore_errors=True)
+        self.appending = append
+        self.root = root
+        self.entity = entity
+        self.schema = get_schema(entity)
+        self.date_field = PARTITION_DATE_FIELDS[entity]
+        self.row_group_size = row_group_size
+        self.max_open_files = max_open_files
+        self.buffers: Dict[str, List[Dict]] = {}
+        self.buffered_rows = 0
+        self.writers: "OrderedDict[str, object]" = OrderedDict()
+        self.file_counts: Dict[str, int] = {}
+
+    def partition_of(self, row: Dict) -> str:
+        if self.date_field is None:
+            return ""
+        # Hive-style directories: region=<name>/month=<YYYY-MM>
+        return os.path.join(f"region={row['region']}", f"month={row[self.date_field][:7]}")
+
+    def append(self, row: Dict, partition: Optional[str] = None):
+        partition = self.partition_of(row) if partition is None else partition
+        buffer = self.buffers.setdefault(partition, [])
+        buffer.append(row)
+        self.buffered_rows += 1
+        if len(buffer) >= self.row_group_size:
+            self._flush(partition)
+        elif self.buffered_rows >= self.row_group_size:
+            # Bound memory across many small partitions by flushing the largest pending one
+            self._flush(max(self.buffers, key=lambda key: len(self.buffers[key])))
+
+    def close(self):
+        for partition in list(self.buffers):
+            self._flush(partition)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+        if not self.file_counts and not (self.appending and os.path.isdir(self.root)):
+            # Still materialise an empty table so readers find the schema
+            os.makedirs(self.root, exist_ok=True)
+            pq.write_table(self.schema.empty_table(), os.path.join(self.root, "part-00000.parquet"))
+
+    def _flush(self, partition: str):
+        rows = self.buffers.pop(partition, None)
+        if not rows:
+            return
+        self.buffered_rows -= len(rows)
+        columns = {}
+        for field in self.schema:
+            if field.name in DATE_FIELDS:
+                columns[field.name] = _date_array(rows, field.name, DATE_FIELDS[field.name])
+            else:
+                columns[field.name] = [row.get(field.name) for row in rows]
+        self._writer_for(partition).write_table(pa.Table.from_pydict(columns, schema=self.schema))
+
+    def _writer_for(self, partition: str):
+        if partition in self.writers:
+            self.writers.move_to_end(partition)
+            return self.writers[partition]
+        # Keep the number of open files bounded; a partition that is reopened gets a new part file
+        if len(self.writers) >= self.max_open_files:
+            _, oldest = self.writers.popitem(last=False)
+            oldest.close()
+        directory = os.path.join(self.root, partition)
+        os.makedirs(directory, exist_ok=True)
+        sequence = self.file_counts.get(partition, 0)
+        while self.appending and os.path.exists(os.path.join(directory, f"part-{sequence:05d}.parquet")):
+            sequence += 1
+        self.file_counts[partition] = sequence + 1
+        writer = pq.ParquetWriter(os.path.join(directory, f"part-{sequence:05d}.parquet"), self.schema)
+        self.writers[partition] = writer
+        return writer
+
+
+class ParquetDatasetWriter:
+    def __init__(self, root: str, entity: str, row_group_size: int = 100000, max_open_files: int = 64,
+                 append: bool = False):
+        # root is the entity's dataset directory; line tables are written next to it
+        self.name = f"write.{entity}"
+        self.table = _PartitionedTable(root, entity, row_group_size, max_open_files, append)
+        self.lines = None
+        if entity in LINE_TABLES:
+            line_entity, self.line_keys = LINE_TABLES[entity]
+            line_root = os.path.join(os.path.dirname(root), line_entity)
+            self.lines = _PartitionedTable(line_root, line_entity, row_group_size, max_open_files, append)
+
+    def write(self, record: Dict):
+        partition = self.table.partition_of(record)
+        self.table.append(record, partition)
+        if self.lines is not None:
+            parent = {key: record[key] for key in self.line_keys}
+            for line_number, item in enumerate(record['items'], start=1):
+                line = dict(zip(ITEM_FIELDS, map(item.get, ITEM_FIELDS)), line_number=line_number, **parent)
+                self.lines.append(line, partition)
+
+    def write_many(self, records: Iterable[Dict]):
+        rows = 0
+        with track(self.name) as section:
+            for record in records:
+                self.write(record)
+                rows += 1
+            section.add(rows=rows)
+
+    def close(self):
+        # Buffered row groups are flushed here, so closing counts towards the write time
+        with track(self.name):
+            self.table.close()
+            if self.lines is not None:
+                self.lines.close()
+        record_output(self.name, self.table.root, *([self.lines.root] if self.lines is not None else []))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def merge_datasets(parts: List[str], root: str):
+    # parts are per-shard dataset directories for the same entity; files are moved into root
+    # under a shard prefix so the merged layout only depends on the shard order
+    entity = os.path.basename(root)
+    tables = [entity] + ([LINE_TABLES[entity][0]] if entity in LINE_TABLES else [])
+    for table in tables:
+        table_root = os.path.join(os.path.dirname(root), table)
+        shutil.rmtree(table_root, ignore_errors=True)
+        os.makedirs(table_root)
+        for shard_index, part in enumerate(parts):
+            part_root = os.path.join(os.path.dirname(part), table)
+            for directory, _, filenames in os.walk(part_root):
+                target = os.path.join(table_root, os.path.relpath(directory, part_root))
+                os.makedirs(target, exist_ok=True)
+                for filename in sorted(filenames):
+                    os.replace(os.path.join(directory, filename),
+                               os.path.join(target, f"shard-{shard_index:05d}-{filename}"))
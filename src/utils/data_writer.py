@@ -1,12 +1,33 @@
 import csv
+import gzip
 import json
-from typing import List, Dict
+import os
+import queue
+import shutil
+import threading
+from typing import List, Dict, Iterable, Optional
+from src.records import json_default
+from src.utils.columnar_writer import ParquetDatasetWriter, merge_datasets
+from src.utils.database_writer import DIALECTS, DatabaseTableWriter, merge_databases
+from src.utils.metrics import hot_path, record_output, track
+from src.utils.schema import TABLES, ITEM_FIELDS, LINE_TABLES, NESTED_FIELDS, table_fields
 
-def write_data(data: List[Dict], filename: str, format: str):
-    if format.lower() == 'csv':
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+def write_data(data: List[Dict], filename: str, format: str, options: Optional[Dict] = None):
+    if format.lower() in ('csv', 'jsonl') and os.path.basename(filename) in TABLES:
+        with TableWriter(filename, format.lower(), **(options or {})) as writer:
+            writer.write_many(data)
+    elif format.lower() == 'csv':
         write_to_csv(data, f"{filename}.csv")
     elif format.lower() == 'json':
         write_to_json(data, f"{filename}.json")
+    elif format.lower() == 'parquet':
+        with ParquetDatasetWriter(filename, os.path.basename(filename), **(options or {})) as writer:
+            writer.write_many(data)
+    elif format.lower() in DIALECTS:
+        with DatabaseTableWriter(filename, DIALECTS[format.lower()](), **(options or {})) as writer:
+            writer.write_many(data)
     else:
         raise ValueError(f"Unsupported format: {format}")
 
@@ -29,5 +50,286 @@ def write_to_csv(data: List[Dict], filename: str):
             writer.writerow(row_data)
 
 def write_to_json(data: List[Dict], filename: str):
-    with open(filename, 'w', encoding='utf-8') as jsonfile:
-        json.dump(data, jsonfile, indent=2, ensure_ascii=False)
\ No newline at end of file
+    name = f"write.{os.path.splitext(os.path.basename(filename))[0]}"
+    with track(name) as section, open(filename, 'w', encoding='utf-8') as jsonfile:
+        json.dump(data, jsonfile, indent=2, ensure_ascii=False, default=json_default)
+        section.add(rows=len(data))
+    record_output(name, filename)
+
+
+class BackgroundCompressedFile:
+    # Text file whose encoding and compression run on a worker thread. Writes are batched
+    # into ~1 MB blocks and handed over through a bounded queue, so generation only blocks
+    # when compression falls behind. zlib and zstd release the GIL while compressing.
+    BLOCK_SIZE = 1 << 20
+
+    def __init__(self, filename: str, compression: str, queue_size: int = 8, append: bool = False):
+        # Appending adds a new gzip member / zstd frame, which readers decode as one stream
+        self.raw = open(filename, 'ab' if append else 'wb')
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', mtime=0)
+        elif compression == 'zstd':
+            import zstandard
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.raw, closefd=False)
+        else:
+            raise ValueError(f"Unsupported compression: {compression}")
+        self.pending = []
+        self.pending_size = 0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._drain, daemon=True)
+        self.thread.start()
+
+    def write(self, text: str):
+        self.pending.append(text)
+        self.pending_size += len(text)
+        if self.pending_size >= self.BLOCK_SIZE:
+            self._hand_over()
+
+    def close(self):
+        self._hand_over()
+        self.queue.put(None)
+        self.thread.join()
+        self.stream.close()
+        self.raw.close()
+        if self.error is not None:
+            raise self.error
+
+    def _hand_over(self):
+        if self.pending:
+            self.queue.put(''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def _drain(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                return
+            if self.error is None:
+                try:
+                    self.stream.write(block.encode('utf-8'))
+                except Exception as error:  # Re-raised on the caller's thread in close()
+                    self.error = error
+
+
+def open_output(filename: str, compression: Optional[str] = None, append: bool = False):
+    if compression:
+        return BackgroundCompressedFile(filename + COMPRESSION_SUFFIXES[compression], compression, append=append)
+    return open(filename, 'a' if append else 'w', newline='', encoding='utf-8', buffering=1 << 20)
+
+
+class _CsvSink:
+    def __init__(self, filename: str, fields: List[str], compression: Optional[str], header: bool,
+                 append: bool = False):
+        self.path = filename + COMPRESSION_SUFFIXES.get(compression, '')
+        self.file = open_output(filename, compression, append)
+        self.writer = csv.writer(self.file)
+        # Positions of list/dict columns, which are written as JSON text
+        self.nested = [index for index, field in enumerate(fields) if field in NESTED_FIELDS]
+        if header:
+            self.writer.writerow(fields)
+
+    @hot_path("write.csv_row")
+    def write_values(self, values: List):
+        for index in self.nested:
+            if values[index] is not None:
+                values[index] = json.dumps(values[index], ensure_ascii=False, default=json_default)
+        self.writer.writerow(values)
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonlSink:
+    def __init__(self, filename: str, fields: List[str], compression: Optional[str], header: bool,
+                 append: bool = False):
+        self.path = filename + COMPRESSION_SUFFIXES.get(compression, '')
+        self.file = open_output(filename, compression, append)
+        self.fields = fields
+
+    @hot_path("write.jsonl_row")
+    def write_values(self, values: List):
+        self.file.write(json.dumps(dict(zip(self.fields, values)), ensure_ascii=False, separators=(',', ':'),
+                                   default=json_default))
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+
+class TableWriter:
+    # Writes one entity to a flat CSV or JSON Lines file using the declared schema. With
+    # normalize_lines, a PO's or invoice's items go to a separate line table (po_lines,
+    # invoice_lines) keyed by the parent number instead of being embedded in the parent row.
+    # Records (or dicts) are read field by field through get(), without converting them first.
+    # With append, rows are added to existing files and no header is written.
+    SINKS = {'csv': _CsvSink, 'jsonl': _JsonlSink}
+
+    def __init__(self, filename: str, format: str, compression: Optional[str] = None,
+                 normalize_lines: bool = False, header: bool = True, append: bool = False):
+        entity = os.path.basename(filename)
+        sink = self.SINKS[format]
+        header = header and not append
+        self.name = f"write.{entity}"
+        self.fields = table_fields(entity, normalize_lines)
+        self.sink = sink(f"{filename}.{format}", self.fields, compression, header, append)
+        self.lines = None
+        if normalize_lines and entity in LINE_TABLES:
+            line_entity, self.line_keys = LINE_TABLES[entity]
+            line_filename = os.path.join(os.path.dirname(filename), line_entity)
+            self.lines = sink(f"{line_filename}.{format}", TABLES[line_entity], compression, header, append)
+
+    def write(self, record: Dict):
+        self.sink.write_values(list(map(record.get, self.fields)))
+        if self.lines is not None:
+            parent = [record[key] for key in self.line_keys]
+            for line_number, item in enumerate(record['items'], start=1):
+                self.lines.write_values(parent + [line_number] + list(map(item.get, ITEM_FIELDS)))
+
+    def write_many(self, records: Iterable[Dict]):
+        rows = 0
+        with track(self.name) as section:
+            for record in records:
+                self.write(record)
+                rows += 1
+            section.add(rows=rows)
+
+    def close(self):
+        with track(self.name):
+            self.sink.close()
+            if self.lines is not None:
+                self.lines.close()
+        record_output(self.name, self.sink.path, *([self.lines.path] if self.lines is not None else []))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JsonRecordWriter:
+    def __init__(self, filename: str, append: bool = False):
+        self.filename = filename
+        self.name = f"write.{os.path.splitext(os.path.basename(filename))[0]}"
+        if append and os.path.exists(filename):
+            # Reopen the array before its closing bracket: the document ends in "\n]", or is "[]"
+            size = os.path.getsize(filename)
+            os.truncate(filename, size - (2 if size > 2 else 1))
+            self.file = open(filename, 'a', encoding='utf-8')
+            self.count = int(size > 2)
+        else:
+            self.file = open(filename, 'w', encoding='utf-8')
+            self.file.write("[")
+            self.count = 0
+
+    def write(self, record: Dict):
+        # Produces the same layout as json.dump(data, indent=2) on the full list
+        body = json.dumps(record, indent=2, ensure_ascii=False, default=json_default).replace("\n", "\n  ")
+        self.file.write(("," if self.count else "") + "\n  " + body)
+        self.count += 1
+
+    def write_many(self, records: Iterable[Dict]):
+        start = self.count
+        with track(self.name) as section:
+            for record in records:
+                self.write(record)
+            section.add(rows=self.count - start)
+
+    def close(self):
+        with track(self.name):
+            self.file.write("\n]" if self.count else "]")
+            self.file.close()
+        record_output(self.name, self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def writer_options(config: Dict, format: str) -> Dict:
+    general = config['general']
+    if format.lower() == 'parquet' or format.lower() in DIALECTS:
+        return dict(general.get(format.lower()) or {})
+    elif format.lower() in ('csv', 'jsonl'):
+        return {
+            "compression": general.get('compression'),
+            "normalize_lines": general.get('normalize_lines', False),
+        }
+    return {}
+
+
+def open_writer(filename: str, format: str, options: Optional[Dict] = None):
+    options = options or {}
+    if format.lower() in ('csv', 'jsonl'):
+        return TableWriter(filename, format.lower(), **options)
+    elif format.lower() == 'json':
+        return JsonRecordWriter(f"{filename}.json", **options)
+    elif format.lower() == 'parquet':
+        return ParquetDatasetWriter(filename, os.path.basename(filename), **options)
+    elif format.lower() in DIALECTS:
+        return DatabaseTableWriter(filename, DIALECTS[format.lower()](), **options)
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+
+
+def output_tables(entity: str, format: str, options: Optional[Dict] = None) -> List[str]:
+    # Files an entity writer produces; used to merge shard outputs
+    options = options or {}
+    if format.lower() in ('csv', 'jsonl') and not options.get('normalize_lines', False):
+        return [entity]
+    if format.lower() == 'json':
+        return [entity]
+    return [entity] + ([LINE_TABLES[entity][0]] if entity in LINE_TABLES else [])
+
+
+def merge_parts(parts: List[str], filename: str, format: str, options: Optional[Dict] = None):
+    # Every part after the first is written without a header, so flat formats (including
+    # gzip members and zstd frames) can be concatenated byte for byte
+    options = options or {}
+    directory = os.path.dirname(filename)
+    if format.lower() == 'json':
+        merge_json_parts([f"{part}.json" for part in parts], f"{filename}.json")
+    elif format.lower() == 'parquet':
+        merge_datasets(parts, filename)
+    elif format.lower() == 'sqlite':
+        merge_databases(parts, filename, **options)
+    elif format.lower() in ('csv', 'jsonl'):
+        suffix = f".{format.lower()}" + COMPRESSION_SUFFIXES.get(options.get('compression'), '')
+        for table in output_tables(os.path.basename(filename), format, options):
+            part_files = [os.path.join(os.path.dirname(part), table) + suffix for part in parts]
+            concatenate_files(part_files, os.path.join(directory, table) + suffix)
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+
+
+def concatenate_files(parts: List[str], filename: str):
+    with open(filename, 'wb') as output:
+        for part in parts:
+            with open(part, 'rb') as source:
+                shutil.copyfileobj(source, output, 1 << 20)
+
+
+def merge_json_parts(parts: List[str], filename: str):
+    # Each part is a JsonRecordWriter document: "[" + records + "\n]", or "[]" when empty
+    written = False
+    with open(filename, 'wb') as output:
+        output.write(b"[")
+        for part in parts:
+            size = os.path.getsize(part)
+            if size <= 2:
+                continue
+            with open(part, 'rb') as source:
+                source.seek(1)
+                if written:
+                    output.write(b",")
+                remaining = size - 3
+                while remaining > 0:
+                    block = source.read(min(remaining, 1 << 20))
+                    output.write(block)
+                    remaining -= len(block)
+            written = True
+        output.write(b"\n]" if written else b"]")
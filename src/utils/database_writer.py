@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+from typing import List, Dict, Iterable
+from src.records import json_default
+from src.utils.metrics import track
+from src.utils.schema import COLUMN_TYPES, ITEM_FIELDS, LINE_TABLES, NESTED_FIELDS, TABLES
+
+# Loads entities straight into a relational database through a DB-API 2.0 driver. Every entity
+# gets its own table and PO/invoice items always go to po_lines/invoice_lines. Rows are buffered
+# and inserted with one prepared statement per table (executemany) in transactions of
+# batch_size rows. Unique keys and lookup indexes are built after the load, which is much faster
+# than maintaining them row by row. Dates are stored as ISO text and list/dict fields as JSON text.
+
+# Table -> (unique key, columns with a lookup index for joins)
+TABLE_KEYS = {
+    "vendors": (["vendor_id"], []),
+    "catalog": (["item_number"], []),
+    "purchase_orders": (["po_number"], ["vendor_id"]),
+    "po_lines": (["po_number", "line_number"], ["item_number"]),
+    "invoices": (["invoice_number"], ["po_number", "vendor_id"]),
+    "invoice_lines": (["invoice_number", "line_number"], ["po_number"]),
+    "payments": (["payment_id"], ["invoice_number", "vendor_id"]),
+}
+
+# DB-API paramstyle -> positional placeholder
+PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+class SqliteDialect:
+    # What the writer needs to know about a database engine. Another DB-API driver plugs in with
+    # a class providing the same attributes and methods, registered in DIALECTS under the
+    # output_format name that selects it.
+    driver = sqlite3
+
+    def location(self, directory: str, database: str) -> str:
+        # The database file lives in the output directory, so every shard gets its own
+        return os.path.abspath(os.path.join(directory, database))
+
+    def connect(self, location: str):
+        connection = self.driver.connect(location)
+        # WAL with synchronous=NORMAL only syncs at checkpoints, which suits bulk loading
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def column_type(self, field: str) -> str:
+        return COLUMN_TYPES.get(field, "TEXT")
+
+
+DIALECTS = {"sqlite": SqliteDialect}
+
+
+class _Database:
+    # One connection per database, shared by every writer open on it in this process. SQLite
+    # allows a single writer at a time, so separate connections would only wait on each other.
+    def __init__(self, dialect, location: str):
+        self.location = location
+        self.connection = dialect.connect(location)
+        self.users = 0
+
+
+_databases: Dict[str, _Database] = {}
+
+
+def _open_database(dialect, location: str) -> _Database:
+    database = _databases.get(location)
+    if database is None:
+        database = _databases[location] = _Database(dialect, location)
+    database.users += 1
+    return database
+
+
+def _release_database(database: _Database):
+    database.users -= 1
+    if database.users == 0:
+        database.connection.close()
+        del _databases[database.location]
+
+
+class DatabaseTableWriter:
+    # Writes one entity (and its line table) to a database. Like opening a file with 'w', the
+    # entity's tables are recreated unless append is set.
+    def __init__(self, filename: str, dialect=None, database: str = "ap_data.sqlite", batch_size: int = 50000,
+                 append: bool = False):
+        entity = os.path.basename(filename)
+        self.dialect = dialect or SqliteDialect()
+        self.database = _open_database(self.dialect, self.dialect.location(os.path.dirname(filename), database))
+        self.name = f"write.{entity}"
+        self.batch_size = batch_size
+        self.fields = TABLES[entity]
+        self.nested = [index for index, field in enumerate(self.fields) if field in NESTED_FIELDS]
+        self.tables = [entity]
+        self.line_keys = None
+        if entity in LINE_TABLES:
+            line_entity, self.line_keys = LINE_TABLES[entity]
+            self.tables.append(line_entity)
+        self.rows: Dict[str, List[List]] = {table: [] for table in self.tables}
+        placeholder = PLACEHOLDERS[self.dialect.driver.paramstyle]
+        self.inserts = {
+            table: f"INSERT INTO {table} ({', '.join(TABLES[table])}) "
+                   f"VALUES ({', '.join([placeholder] * len(TABLES[table]))})"
+            for table in self.tables
+        }
+        cursor = self.database.connection.cursor()
+        for table in self.tables:
+            if not append:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            columns = ', '.join(f"{field} {self.dialect.column_type(field)}" for field in TABLES[table])
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+        self.database.connection.commit()
+
+    def write(self, record: Dict):
+        values = list(map(record.get, self.fields))
+        for index in self.nested:
+            if values[index] is not None:
+                values[index] = json.dumps(values[index], ensure_ascii=False, default=json_default)
+        rows = self.rows[self.tables[0]]
+        rows.append(values)
+        if self.line_keys is not None:
+            lines = self.rows[self.tables[1]]
+            parent = [record[key] for key in self.line_keys]
+            for line_number, item in enumerate(record['items'], start=1):
+                lines.append(parent + [line_number] + list(map(item.get, ITEM_FIELDS)))
+            if len(lines) >= self.batch_size:
+                self.flush()
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records: Iterable[Dict]):
+        rows = 0
+        with track(self.name) as section:
+            for record in records:
+                self.write(record)
+                rows += 1
+            section.add(rows=rows)
+
+    def flush(self):
+        # One transaction per batch, with parent rows and their lines committed together
+        cursor = self.database.connection.cursor()
+        for table, rows in self.rows.items():
+            if rows:
+                cursor.executemany(self.inserts[table], rows)
+                rows.clear()
+        self.database.connection.commit()
+
+    def close(self):
+        with track(self.name):
+            self.flush()
+            create_indexes(self.database.connection, self.tables)
+        _release_database(self.database)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def create_indexes(connection, tables: List[str]):
+    # IF NOT EXISTS, so appending to a dataset keeps the indexes built by its first load
+    cursor = connection.cursor()
+    for table in tables:
+        key, lookups = TABLE_KEYS[table]
+        cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_key ON {table} ({', '.join(key)})")
+        for column in lookups:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+    connection.commit()
+
+
+def merge_databases(parts: List[str], filename: str, database: str = "ap_data.sqlite", **options):
+    # parts are per-shard output paths for the same entity, each next to its own database file;
+    # their rows are copied into the output database in shard order
+    with DatabaseTableWriter(filename, SqliteDialect(), database, **options) as writer:
+        connection = writer.database.connection
+        for part in parts:
+            connection.execute("ATTACH DATABASE ? AS part", (writer.dialect.location(os.path.dirname(part), database),))
+            for table in writer.tables:
+                connection.execute(f"INSERT INTO main.{table} SELECT * FROM part.{table}")
+            connection.commit()
+            connection.execute("DETACH DATABASE part")
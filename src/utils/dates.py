@@ -0,0 +1,87 @@
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+# Calendar dates as integer epoch days: days since 1970-01-01, the same count as NumPy's
+# datetime64[D] and Arrow's date32. Generators do date arithmetic on plain ints and records keep
+# the ints; ISO text is produced only when a writer reads a date field, from a memo holding each
+# day's text once, and parsed text is memoized the same way.
+
+EPOCH = date(1970, 1, 1)
+_EPOCH_ORDINAL = EPOCH.toordinal()
+_texts: Dict[int, str] = {}
+_days: Dict[str, int] = {}
+
+
+def to_day(value) -> int:
+    # An epoch day from an ISO date string, a date or datetime, or an epoch day
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        day = _days.get(value)
+        if day is None:
+            day = _days[value] = date.fromisoformat(value[:10]).toordinal() - _EPOCH_ORDINAL
+        return day
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def day_text(day: int) -> str:
+    text = _texts.get(day)
+    if text is None:
+        text = _texts[day] = date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+    return text
+
+
+def weekday(day: int) -> int:
+    # 0 is Monday; the epoch was a Thursday
+    return (day + 3) % 7
+
+
+def day_field(slot: str) -> property:
+    # A record's ISO date field kept as the epoch day in `slot`; assigning text, a date or a day works
+    def get(record) -> Optional[str]:
+        day = getattr(record, slot)
+        return None if day is None else day_text(day)
+
+    def assign(record, value):
+        setattr(record, slot, None if value is None else to_day(value))
+
+    return property(get, assign)
+
+
+def daily_values(base, history: Optional[Dict], first_day: int, last_day: int) -> List:
+    # One value per day from first_day to last_day: base until the earliest effective date in
+    # history ({date: value}), then each value from its date until the next one
+    values = [base] * (last_day - first_day + 1)
+    for effective, value in sorted((to_day(key), value) for key, value in (history or {}).items()):
+        start = max(effective - first_day, 0)
+        values[start:] = [value] * (len(values) - start)
+    return values
+
+
+class BusinessCalendar:
+    # The open days of a region: neither a weekend day (0 = Monday) nor a holiday. roll() moves
+    # a day forward to the next open day, a list lookup for days from first_day to last_day.
+    def __init__(self, weekend: Iterable[int], holidays: Iterable, first_day: int, last_day: int):
+        self.weekend = frozenset(weekend)
+        self.holidays = frozenset(to_day(holiday) for holiday in holidays)
+        self.first_day = first_day
+        self.next_open = [0] * (last_day - first_day + 1)
+        following = self._scan(last_day + 1)
+        for offset in range(last_day - first_day, -1, -1):
+            if self.is_open(first_day + offset):
+                following = first_day + offset
+            self.next_open[offset] = following
+
+    def is_open(self, day: int) -> bool:
+        return weekday(day) not in self.weekend and day not in self.holidays
+
+    def roll(self, day: int) -> int:
+        offset = day - self.first_day
+        if 0 <= offset < len(self.next_open):
+            return self.next_open[offset]
+        return self._scan(day)
+
+    def _scan(self, day: int) -> int:
+        while not self.is_open(day):
+            day += 1
+        return day
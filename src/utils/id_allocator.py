@@ -0,0 +1,188 @@
+from typing import List, Dict, Optional
+from src.utils.seeding import derive_seed
+
+# Entity -> (prefix, default number of digits). Numbers are always exactly `digits` long.
+ID_FORMATS = {
+    "vendor": ("V", 7),
+    "purchase_order": ("PO", 7),
+    "invoice": ("INV", 7),
+    "payment": ("PAY", 7),
+    "item": ("ITEM", 6),
+}
+
+_MASK64 = (1 << 64) - 1
+_MULTIPLIER_1 = 0x9E3779B97F4A7C15
+_MULTIPLIER_2 = 0xD6E8FEB86659FD93
+_ROUNDS = 4
+
+
+class IdSpaceExhausted(RuntimeError):
+    pass
+
+
+class IdAllocator:
+    # Document numbers are a keyed permutation of a counter: counter -> 4-round Feistel network
+    # over the smallest even bit width covering the number space, cycle-walking until the value
+    # falls inside it. Distinct counters always give distinct numbers, so uniqueness costs O(1)
+    # per ID with no "seen" set, while the numbers still look random.
+    #
+    # Counters are interleaved so parallel shards never overlap: shard i of n uses
+    # start + sequence * n + i. `position` is the first counter block no shard has touched,
+    # which is where a later (incremental) run must start.
+    def __init__(self, prefix: str, digits: int, key: int, start: int = 0, stride: int = 1, offset: int = 0):
+        self.prefix = prefix
+        self.low = 10 ** (digits - 1)
+        self.size = 9 * self.low
+        bits = max(2, (self.size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.round_keys = [derive_seed(key, prefix, round_index) for round_index in range(_ROUNDS)]
+        self.start = start
+        self.stride = stride
+        self.offset = offset
+        self.sequence = 0
+
+    @property
+    def position(self) -> int:
+        return self.start + self.sequence * self.stride
+
+    def next_id(self) -> str:
+        counter = self._take(1)
+        return f"{self.prefix}{self.low + self._permute(counter)}"
+
+    def next_ids(self, count: int) -> List[str]:
+        first = self._take(count)
+        counters = range(first, first + count * self.stride, self.stride)
+        prefix = self.prefix
+        low = self.low
+        if count >= 64:
+            numbers = self._permute_many(counters)
+            if numbers is not None:
+                return [f"{prefix}{low + number}" for number in numbers]
+        return [f"{prefix}{low + self._permute(counter)}" for counter in counters]
+
+    def seek(self, counter: int):
+        # Continues numbering at an absolute counter (used by record seeding, which needs stride 1)
+        self.start = counter - self.offset
+        self.sequence = 0
+
+    def counter(self, number: str) -> int:
+        # The counter a number was issued for: the inverse permutation
+        value = self._decrypt(int(number[len(self.prefix):]) - self.low)
+        while value >= self.size:
+            value = self._decrypt(value)
+        return value
+
+    def _take(self, count: int) -> int:
+        first = self.start + self.sequence * self.stride + self.offset
+        last = first + (count - 1) * self.stride
+        if count and last >= self.size:
+            raise IdSpaceExhausted(f"{self.prefix} number space ({self.size} values) is exhausted; "
+                                   f"increase its digits under ids.digits in config.yaml")
+        self.sequence += count
+        return first
+
+    def _permute(self, value: int) -> int:
+        value = self._encrypt(value)
+        while value >= self.size:  # Cycle-walk back into the number space
+            value = self._encrypt(value)
+        return value
+
+    def _encrypt(self, value: int) -> int:
+        half_bits = self.half_bits
+        half_mask = self.half_mask
+        left = value >> half_bits
+        right = value & half_mask
+        for round_key in self.round_keys:
+            mixed = ((right ^ round_key) * _MULTIPLIER_1) & _MASK64
+            mixed ^= mixed >> 32
+            mixed = (mixed * _MULTIPLIER_2) & _MASK64
+            mixed ^= mixed >> 32
+            left, right = right, left ^ (mixed & half_mask)
+        return (left << half_bits) | right
+
+    def _decrypt(self, value: int) -> int:
+        # The Feistel rounds run backwards
+        half_bits = self.half_bits
+        half_mask = self.half_mask
+        left = value >> half_bits
+        right = value & half_mask
+        for round_key in reversed(self.round_keys):
+            mixed = ((left ^ round_key) * _MULTIPLIER_1) & _MASK64
+            mixed ^= mixed >> 32
+            mixed = (mixed * _MULTIPLIER_2) & _MASK64
+            mixed ^= mixed >> 32
+            left, right = right ^ (mixed & half_mask), left
+        return (left << half_bits) | right
+
+    def _permute_many(self, counters: range) -> Optional[List[int]]:
+        # Same permutation over a whole block with NumPy (uint64 arithmetic wraps like the
+        # masked Python version); None when NumPy is not installed
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+        values = np.arange(counters.start, counters.stop, counters.step, dtype=np.uint64)
+        values = self._encrypt_array(values, np)
+        outside = values >= self.size
+        while outside.any():
+            values[outside] = self._encrypt_array(values[outside], np)
+            outside = values >= self.size
+        return values.tolist()
+
+    def _encrypt_array(self, values, np):
+        half_bits = np.uint64(self.half_bits)
+        half_mask = np.uint64(self.half_mask)
+        shift = np.uint64(32)
+        left = values >> half_bits
+        right = values & half_mask
+        for round_key in self.round_keys:
+            mixed = (right ^ np.uint64(round_key)) * np.uint64(_MULTIPLIER_1)
+            mixed ^= mixed >> shift
+            mixed = mixed * np.uint64(_MULTIPLIER_2)
+            mixed ^= mixed >> shift
+            left, right = right, left ^ (mixed & half_mask)
+        return (left << half_bits) | right
+
+
+# One allocator per entity and process, like the rate limiter. configure_id_allocation() sets
+# the key (from the master seed), this process's shard and the positions earlier runs reached.
+_allocation = {"master_seed": 0, "shard_index": 0, "shards": 1, "positions": {}, "digits": {}}
+_allocators: Dict[str, IdAllocator] = {}
+
+
+def configure_id_allocation(master_seed: int, shard_index: int = 0, shards: int = 1,
+                            positions: Optional[Dict[str, int]] = None, digits: Optional[Dict[str, int]] = None):
+    _allocation.update(master_seed=master_seed, shard_index=shard_index, shards=shards,
+                       positions=dict(positions or {}), digits=dict(digits or {}))
+    _allocators.clear()
+
+
+def get_id_allocator(entity: str) -> IdAllocator:
+    if entity not in _allocators:
+        prefix, default_digits = ID_FORMATS[entity]
+        _allocators[entity] = IdAllocator(prefix, _allocation["digits"].get(entity, default_digits),
+                                          derive_seed(_allocation["master_seed"], "ids"),
+                                          start=_allocation["positions"].get(entity, 0),
+                                          stride=_allocation["shards"], offset=_allocation["shard_index"])
+    return _allocators[entity]
+
+
+def id_positions() -> Dict[str, int]:
+    # Where the next run has to continue for every entity
+    positions = dict(_allocation["positions"])
+    for entity, allocator in _allocators.items():
+        positions[entity] = allocator.position
+    return positions
+
+
+def advance_id_positions(positions: Dict[str, int]):
+    # Fold in positions reached elsewhere (e.g. by shard workers or a cached stage result);
+    # counters never move backwards. Allocators already handed out continue from the new position.
+    for entity, position in positions.items():
+        current = id_positions().get(entity, 0)
+        if position > current:
+            _allocation["positions"][entity] = position
+            if entity in _allocators:
+                _allocators[entity].start = position
+                _allocators[entity].sequence = 0
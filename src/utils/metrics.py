@@ -0,0 +1,251 @@
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from typing import List, Dict, Callable, Optional
+
+# Run instrumentation. Two kinds of hooks feed one process-wide collector:
+#
+# - track(name) sections around coarse units of work (a stage chunk, a writer batch, a cache
+#   load), which count calls, wall time, rows and bytes and, with trace_allocations, the net
+#   Python allocation. With metrics off, track() returns a shared no-op section.
+# - @hot_path(name) on per-record functions. The decorator leaves the function untouched and
+#   only registers it; configure_metrics() swaps in a timing wrapper while metrics are on, so
+#   disabled runs pay nothing per call. Times are inclusive of nested hot paths.
+#
+# A sampler thread records RSS at a fixed interval together with the innermost active section.
+
+_collector = None
+_hot_paths: List[Callable] = []
+
+
+class _Section:
+    __slots__ = ("collector", "name", "start", "allocated")
+
+    def __init__(self, collector: "MetricsCollector", name: str):
+        self.collector = collector
+        self.name = name
+
+    def add(self, rows: int = 0, bytes: int = 0):
+        self.collector.add(self.name, rows=rows, bytes=bytes)
+
+    def __enter__(self):
+        self.collector.active.append(self.name)
+        if self.collector.trace_allocations:
+            self.allocated = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        allocated = tracemalloc.get_traced_memory()[0] - self.allocated if self.collector.trace_allocations else 0
+        self.collector.add(self.name, calls=1, seconds=seconds, allocated_bytes=allocated)
+        self.collector.active.pop()
+
+
+class _NullSection:
+    __slots__ = ()
+
+    def add(self, rows: int = 0, bytes: int = 0):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SECTION = _NullSection()
+
+
+def current_rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        # Peak rather than current RSS where /proc is not available; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class MetricsCollector:
+    def __init__(self, trace_allocations: bool = False, sample_interval: Optional[float] = 1.0):
+        self.trace_allocations = trace_allocations
+        self.sections: Dict[str, Dict[str, float]] = {}
+        self.functions: Dict[str, Dict[str, float]] = {}
+        self.active: List[str] = []
+        self.rss_samples: List[List] = []
+        self.started = time.perf_counter()
+        self.sample_interval = sample_interval
+        self.stopped = threading.Event()
+        self.sampler = None
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if sample_interval:
+            self.sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self.sampler.start()
+
+    def add(self, name: str, **values):
+        totals = self.sections.get(name)
+        if totals is None:
+            totals = self.sections[name] = {"calls": 0, "seconds": 0.0, "rows": 0, "bytes": 0}
+            if self.trace_allocations:
+                totals["allocated_bytes"] = 0
+        for key, value in values.items():
+            if value and key in totals:
+                totals[key] += value
+
+    def add_call(self, name: str, seconds: float):
+        totals = self.functions.get(name)
+        if totals is None:
+            totals = self.functions[name] = {"calls": 0, "seconds": 0.0}
+        totals["calls"] += 1
+        totals["seconds"] += seconds
+
+    def merge(self, snapshot: Dict):
+        # Folds in the sections and hot-path totals of another process (e.g. a shard worker)
+        for name, totals in snapshot.get("sections", {}).items():
+            self.add(name, **totals)
+        for name, totals in snapshot.get("functions", {}).items():
+            merged = self.functions.setdefault(name, {"calls": 0, "seconds": 0.0})
+            merged["calls"] += totals["calls"]
+            merged["seconds"] += totals["seconds"]
+
+    def snapshot(self) -> Dict:
+        return {"sections": self.sections, "functions": self.functions}
+
+    def stop(self):
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+
+    def report(self) -> Dict:
+        run = {"wall_seconds": round(time.perf_counter() - self.started, 3),
+               "peak_rss_mb": round(max([sample[1] for sample in self.rss_samples] + [current_rss_mb()]), 1)}
+        if self.trace_allocations:
+            run["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        return {"run": run, "sections": _by_time(self.sections), "functions": _by_time(self.functions),
+                "rss_samples": self.rss_samples}
+
+    def _sample_rss(self):
+        while not self.stopped.is_set():
+            try:
+                section = self.active[-1]
+            except IndexError:
+                section = None
+            self.rss_samples.append([round(time.perf_counter() - self.started, 3), round(current_rss_mb(), 1),
+                                     section])
+            self.stopped.wait(self.sample_interval)
+
+
+def _by_time(totals: Dict[str, Dict]) -> Dict[str, Dict]:
+    return dict(sorted(totals.items(), key=lambda item: -item[1]["seconds"]))
+
+
+def hot_path(name: str):
+    def register(function: Callable) -> Callable:
+        function._metrics_name = name
+        _hot_paths.append(function)
+        return function
+    return register
+
+
+def _timed(function: Callable) -> Callable:
+    name = function._metrics_name
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _collector.add_call(name, time.perf_counter() - start)
+    wrapper._metrics_original = function
+    return wrapper
+
+
+def _owner(function: Callable):
+    # The class (or module) that holds the function under its qualified name
+    owner = sys.modules[function.__module__]
+    for part in function.__qualname__.split('.')[:-1]:
+        owner = getattr(owner, part)
+    return owner
+
+
+def _set_hot_paths(enabled: bool):
+    for function in _hot_paths:
+        owner = _owner(function)
+        attribute = function.__name__
+        current = owner.__dict__.get(attribute) if isinstance(owner, type) else getattr(owner, attribute)
+        if enabled and current is function:
+            setattr(owner, attribute, _timed(function))
+        elif not enabled and getattr(current, '_metrics_original', None) is function:
+            setattr(owner, attribute, function)
+
+
+def configure_metrics(enabled: bool, trace_allocations: bool = False, sample_interval: Optional[float] = 1.0):
+    # Modules with hot paths must be imported before this is called so they are registered
+    global _collector
+    if _collector is not None:
+        _collector.stop()
+    _collector = MetricsCollector(trace_allocations, sample_interval) if enabled else None
+    _set_hot_paths(enabled)
+
+
+def metrics_enabled() -> bool:
+    return _collector is not None
+
+
+def metrics_settings() -> Optional[Dict]:
+    # configure_metrics() arguments for worker processes: the same allocation tracing, but no
+    # RSS sampler of their own
+    if _collector is None:
+        return None
+    return {"trace_allocations": _collector.trace_allocations, "sample_interval": None}
+
+
+def track(name: str):
+    if _collector is None:
+        return _NULL_SECTION
+    return _Section(_collector, name)
+
+
+def output_size(*paths: str) -> int:
+    # Bytes in output files and dataset directories; missing paths count as empty
+    size = 0
+    for path in paths:
+        if os.path.isdir(path):
+            size += sum(os.path.getsize(os.path.join(directory, filename))
+                        for directory, _, filenames in os.walk(path) for filename in filenames)
+        elif os.path.exists(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def record_output(name: str, *paths: str):
+    # Adds the size of finished output files (or dataset directories) to a section's bytes
+    if _collector is None:
+        return
+    _collector.add(name, bytes=output_size(*paths))
+
+
+def metrics_snapshot() -> Dict:
+    return _collector.snapshot() if _collector is not None else {}
+
+
+def merge_metrics(snapshot: Dict):
+    if _collector is not None and snapshot:
+        _collector.merge(snapshot)
+
+
+def write_metrics_report(path: str):
+    if _collector is None:
+        return
+    _collector.stop()
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(_collector.report(), file, indent=2)
@@ -1,19 +1,94 @@
+import multiprocessing
+import threading
 import time
+from typing import Optional
+
 
 class RateLimiter:
-    def __init__(self, max_per_second):
+    # Token bucket on the monotonic clock. acquire(n) takes n tokens at once; when the bucket
+    # runs short the caller sleeps off the deficit, so large batches are admitted at the
+    # configured average rate without per-record calls.
+    def __init__(self, max_per_second: float, burst: Optional[float] = None):
         self.max_per_second = max_per_second
-        self.allowance = max_per_second
-        self.last_check = time.time()
+        self.capacity = burst if burst is not None else max_per_second
+        self.lock = threading.Lock()
+        self.allowance = self.capacity
+        self.last_check = time.monotonic()
+
+    def acquire(self, count: int = 1):
+        with self.lock:
+            current = time.monotonic()
+            allowance = self.allowance + (current - self.last_check) * self.max_per_second
+            allowance = min(allowance, self.capacity) - count
+            self.allowance = allowance
+            self.last_check = current
+        if allowance < 0:
+            time.sleep(-allowance / self.max_per_second)
 
     def limit(self):
-        current = time.time()
-        time_passed = current - self.last_check
-        self.last_check = current
-        self.allowance += time_passed * self.max_per_second
-        if self.allowance > self.max_per_second:
-            self.allowance = self.max_per_second
-        if self.allowance < 1.0:
-            time.sleep((1.0 - self.allowance) / self.max_per_second)
-        else:
-            self.allowance -= 1.0
\ No newline at end of file
+        self.acquire(1)
+
+
+class UnlimitedRateLimiter:
+    # Used when no rate is configured; acquire() does no clock reads or locking at all
+    max_per_second = None
+
+    def acquire(self, count: int = 1):
+        pass
+
+    def limit(self):
+        pass
+
+
+class SharedRateLimiter(RateLimiter):
+    # Same bucket, kept in shared memory so every thread and worker process draws from one
+    # global rate. Must be handed to workers at start-up (e.g. a pool initializer).
+    def __init__(self, max_per_second: float, burst: Optional[float] = None, context=None):
+        context = context or multiprocessing.get_context()
+        self.max_per_second = max_per_second
+        self.capacity = burst if burst is not None else max_per_second
+        self.state = context.Array('d', [self.capacity, time.monotonic()])
+        self.lock = self.state.get_lock()
+
+    @property
+    def allowance(self) -> float:
+        return self.state.get_obj()[0]
+
+    @allowance.setter
+    def allowance(self, value: float):
+        self.state.get_obj()[0] = value
+
+    @property
+    def last_check(self) -> float:
+        return self.state.get_obj()[1]
+
+    @last_check.setter
+    def last_check(self, value: float):
+        self.state.get_obj()[1] = value
+
+
+def create_rate_limiter(max_per_second: Optional[float], shared: bool = False):
+    if not max_per_second or max_per_second <= 0:
+        return UnlimitedRateLimiter()
+    if shared:
+        return SharedRateLimiter(max_per_second)
+    return RateLimiter(max_per_second)
+
+
+# All generators in a process draw from one bucket, so the configured rate is a global
+# rate for the pipeline rather than a per-generator one.
+_installed_limiter = None
+_limiters = {}
+
+
+def install_rate_limiter(limiter):
+    global _installed_limiter
+    _installed_limiter = limiter
+
+
+def get_rate_limiter(max_per_second: Optional[float]):
+    if _installed_limiter is not None:
+        return _installed_limiter
+    if max_per_second not in _limiters:
+        _limiters[max_per_second] = create_rate_limiter(max_per_second)
+    return _limiters[max_per_second]
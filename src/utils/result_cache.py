@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from typing import Optional
+from src.records import json_default
+
+# Part of every stage key; bump when what a key covers changes so older entries are no longer hit
+RESULT_CACHE_VERSION = 2
+
+
+def content_key(*parts) -> str:
+    # Stable digest of JSON-serialisable parts (records included); dict key order does not matter
+    material = json.dumps(parts, sort_keys=True, default=json_default, ensure_ascii=False)
+    return hashlib.blake2b(material.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class ResultCache:
+    # Content-addressed store for stage results. An entry is named after a hash of everything the
+    # result depends on (stage settings, upstream inputs and seed), so changing any of them simply
+    # misses instead of reading a stale result. Entries are written atomically, which makes every
+    # stored entry a checkpoint: after a crash, a rerun reloads them and regenerates only the rest.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, key: str) -> Optional[object]:
+        path = os.path.join(self.directory, f"{key}.pkl")
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        with open(path, 'rb') as file:
+            value = pickle.load(file)
+        self.hits += 1
+        return value
+
+    def store(self, key: str, value: object):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, os.path.join(self.directory, f"{key}.pkl"))
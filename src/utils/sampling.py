@@ -0,0 +1,124 @@
+import random
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Sequence
+
+# Skewed distributions from the `sampling` section of config.yaml, drawn through alias tables.
+# Every table is built once per generator; a draw then costs one random number, one comparison
+# and two list reads whatever the number of outcomes. Distributions left at their defaults
+# build no table, so the generators keep drawing exactly as before.
+
+
+class AliasTable:
+    # Vose's alias method. Outcome i keeps probability prob[i] of its column and hands the rest
+    # to alias[i]; a draw picks a column uniformly and then one of its two outcomes.
+    def __init__(self, weights: Sequence[float]):
+        count = len(weights)
+        total = float(sum(weights))
+        if count == 0 or total <= 0 or any(weight < 0 for weight in weights):
+            raise ValueError("An alias table needs non-negative weights with a positive total")
+        scaled = [weight * count / total for weight in weights]
+        self.prob = [1.0] * count
+        self.alias = list(range(count))
+        small = [index for index, value in enumerate(scaled) if value < 1.0]
+        large = [index for index, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1 up to rounding
+        self.size = count
+        self._arrays = None
+
+    def draw(self) -> int:
+        # The integer part of one uniform number picks the column, its fraction the outcome
+        position = random.random() * self.size
+        column = int(position)
+        return column if position - column < self.prob[column] else self.alias[column]
+
+    def draw_many(self, count: int, rng=None):
+        # A list drawn from `random`, or with a NumPy Generator an array drawn from it
+        if rng is None:
+            return [self.draw() for _ in range(count)]
+        import numpy as np
+        if self._arrays is None:
+            self._arrays = (np.array(self.prob), np.array(self.alias, dtype=np.int64))
+        prob, alias = self._arrays
+        position = rng.random(count) * self.size
+        column = position.astype(np.int64)
+        return np.where(position - column < prob[column], column, alias[column])
+
+
+def zipf_weights(count: int, exponent: float) -> List[float]:
+    # The k-th outcome (1-based) gets weight 1 / k^exponent
+    return [1.0 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def vendor_table(config: Dict, vendor_count: int) -> Optional[AliasTable]:
+    # Vendor popularity by position in the vendor master; None when every vendor is equally likely
+    popularity = (config.get('sampling') or {}).get('vendor_popularity') or {}
+    if popularity.get('distribution', 'uniform') == 'uniform':
+        return None
+    return AliasTable(zipf_weights(vendor_count, popularity.get('exponent', 1.0)))
+
+
+class CategoryMix:
+    # Category mix within a vendor: a Zipf curve over the order the vendor lists its
+    # specializations, so the first one is its main line of business. The curve only depends on
+    # how many specializations a vendor has, so one table per count serves every vendor.
+    def __init__(self, exponent: float):
+        self.exponent = exponent
+        self.tables: Dict[int, AliasTable] = {}
+        self._arrays = None
+
+    def table(self, count: int) -> AliasTable:
+        table = self.tables.get(count)
+        if table is None:
+            table = self.tables[count] = AliasTable(zipf_weights(count, self.exponent))
+        return table
+
+    def pick(self, specializations: List[str]) -> str:
+        return specializations[self.table(len(specializations)).draw()]
+
+    def draw_many(self, counts, rng):
+        # For every entry of the NumPy array counts, a position below it drawn with rng
+        import numpy as np
+        max_count = int(counts.max()) if len(counts) else 0
+        if self._arrays is None or self._arrays[0].shape[1] < max_count:
+            # (prob, alias) of every table, indexed [count, column]
+            prob = np.ones((max_count + 1, max_count))
+            alias = np.zeros((max_count + 1, max_count), dtype=np.int64)
+            for count in range(1, max_count + 1):
+                prob[count, :count] = self.table(count).prob
+                alias[count, :count] = self.table(count).alias
+            self._arrays = (prob, alias)
+        prob, alias = self._arrays
+        position = rng.random(len(counts)) * counts
+        column = position.astype(np.int64)
+        return np.where(position - column < prob[counts, column], column, alias[counts, column])
+
+
+def category_mix(config: Dict) -> Optional[CategoryMix]:
+    mix = (config.get('sampling') or {}).get('category_mix') or {}
+    if mix.get('distribution', 'uniform') == 'uniform':
+        return None
+    return CategoryMix(mix.get('exponent', 1.0))
+
+
+def date_table(config: Dict, start_date: datetime, end_date: datetime) -> Optional[AliasTable]:
+    # PO-date density over the days from start_date up to end_date: each day weighs its month's
+    # weight times its weekday's weight. None when both are flat.
+    seasonality = (config.get('sampling') or {}).get('seasonality') or {}
+    month_weights = seasonality.get('month_weights')
+    weekday_weights = seasonality.get('weekday_weights')
+    if month_weights is None and weekday_weights is None:
+        return None
+    month_weights = month_weights or [1.0] * 12
+    weekday_weights = weekday_weights or [1.0] * 7
+    days = [start_date + timedelta(days=offset) for offset in range(max((end_date - start_date).days, 1))]
+    weights = [month_weights[day.month - 1] * weekday_weights[day.weekday()] for day in days]
+    if not any(weights):
+        # A window with no weight at all (e.g. a single zero-weight weekday) stays flat
+        return None
+    return AliasTable(weights)
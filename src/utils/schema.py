@@ -0,0 +1,57 @@
+from typing import List
+
+# Declared output columns per table, in output order. Writers use these directly instead of
+# scanning the data for the union of keys.
+
+ITEM_FIELDS = [
+    "item_number", "description", "category", "quantity", "unit_price", "total_price", "currency",
+    "tax_rate", "tax_amount", "brand", "model"
+]
+
+TABLES = {
+    "vendors": [
+        "vendor_id", "name", "description", "address", "tax_id", "payment_terms", "regions",
+        "specializations", "rating", "is_preferred", "contact"
+    ],
+    "catalog": ["item_number", "description", "category", "brand", "model", "base_price"],
+    "purchase_orders": [
+        "po_number", "vendor_id", "vendor_name", "region", "po_date", "currency", "status",
+        "shipping_address", "billing_address", "terms_and_conditions", "notes", "total_amount"
+    ],
+    "po_lines": ["po_number", "line_number"] + ITEM_FIELDS,
+    "invoices": [
+        "invoice_number", "po_number", "vendor_id", "vendor_name", "region", "invoice_date", "due_date",
+        "currency", "subtotal", "tax_amount", "total_amount", "status", "payment_terms", "notes",
+        "block_reason", "grir_issue"
+    ],
+    "invoice_lines": ["invoice_number", "po_number", "line_number"] + ITEM_FIELDS,
+    "payments": [
+        "payment_id", "invoice_number", "po_number", "vendor_id", "vendor_name", "region", "payment_date",
+        "amount", "currency", "payment_method", "status", "notes"
+    ],
+}
+
+# Parent table -> (line table, parent keys repeated on every line)
+LINE_TABLES = {
+    "purchase_orders": ("po_lines", ["po_number"]),
+    "invoices": ("invoice_lines", ["invoice_number", "po_number"]),
+}
+
+# Column -> SQL type for typed outputs; every other column is text (dates are ISO strings)
+COLUMN_TYPES = {
+    "rating": "REAL", "is_preferred": "INTEGER", "base_price": "REAL", "total_amount": "REAL",
+    "subtotal": "REAL", "tax_amount": "REAL", "amount": "REAL", "line_number": "INTEGER",
+    "quantity": "INTEGER", "unit_price": "REAL", "total_price": "REAL", "tax_rate": "REAL",
+}
+
+# Fields holding lists or dicts; flat formats store them as JSON text
+NESTED_FIELDS = {"regions", "specializations", "contact", "grir_issue", "items"}
+
+
+def table_fields(table: str, normalize_lines: bool = False) -> List[str]:
+    fields = TABLES[table]
+    if table in LINE_TABLES and not normalize_lines:
+        # Line items stay embedded in the parent row
+        return fields + ["items"]
+    return fields
+
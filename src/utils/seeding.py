@@ -0,0 +1,21 @@
+import hashlib
+import random
+from typing import Optional
+from faker import Faker
+
+
+def derive_seed(master_seed: int, *keys) -> int:
+    # Stable across processes and Python versions, unlike hash()
+    material = ":".join(str(part) for part in (master_seed,) + keys).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(material, digest_size=8).digest(), 'big')
+
+
+def resolve_master_seed(config_seed: Optional[int]) -> int:
+    if config_seed is None:
+        return random.SystemRandom().randrange(2 ** 63)
+    return int(config_seed)
+
+
+def seed_generators(seed: int):
+    random.seed(seed)
+    Faker.seed(seed)
@@ -0,0 +1,429 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from src.invoice_generator import parse_terms_days
+from src.main import load_config
+from src.payment_generator import PaymentGenerator
+from src.utils.data_writer import COMPRESSION_SUFFIXES
+from src.utils.dates import BusinessCalendar, to_day
+from src.utils.schema import LINE_TABLES
+
+# Streaming integrity check of a written dataset:
+#
+#   python -m src.validate                     # the dataset in the current directory, as configured
+#   python -m src.validate --dir out --workers 4
+#
+# Every table is read once, each in its own process. A pass checks each row on its own (line
+# arithmetic, invoice totals, due dates, block reasons) and keeps only compact columns: 64-bit
+# hashes of keys and references plus the dates and amounts the cross-table checks need. The
+# parent process then sorts and joins those arrays to find duplicate keys, orphaned references,
+# parent totals that differ from their line sums, dates out of order and payments that disagree
+# with their invoice. Memory grows by a few bytes per row rather than with the size of the files,
+# so datasets much larger than RAM can be checked. Problems found by a join are reported by row
+# number, counted from 0 in the order the table is read.
+
+# Amounts closer than this are equal; floats round-trip exactly through every writer, but sums
+# may be taken in a different order than when they were generated
+TOLERANCE = 0.005
+KEYS = {"vendors": "vendor_id", "catalog": "item_number", "purchase_orders": "po_number",
+        "invoices": "invoice_number", "payments": "payment_id"}
+
+
+class ValidationReport:
+    def __init__(self, max_examples: int = 5):
+        self.max_examples = max_examples
+        self.rows: Dict[str, int] = {}
+        self.problems: Dict[str, Dict] = {}
+
+    def add(self, message: str, examples: Tuple = (), count: int = 1, severity: str = "error"):
+        if count <= 0:
+            return
+        problem = self.problems.setdefault(message, {"severity": severity, "count": 0, "examples": []})
+        problem["count"] += count
+        room = self.max_examples - len(problem["examples"])
+        problem["examples"].extend(str(example) for example in list(examples)[:room])
+
+    def add_rows(self, message: str, table: str, mask: np.ndarray, severity: str = "error"):
+        # Reports the rows of `table` selected by a boolean mask
+        rows = np.flatnonzero(mask)
+        self.add(message, tuple(f"{table} row {row}" for row in rows[:self.max_examples]), len(rows), severity)
+
+    def merge(self, other: "ValidationReport"):
+        self.rows.update(other.rows)
+        for message, problem in other.problems.items():
+            self.add(message, tuple(problem["examples"]), problem["count"], problem["severity"])
+
+    @property
+    def errors(self) -> int:
+        return sum(problem["count"] for problem in self.problems.values() if problem["severity"] == "error")
+
+
+def key_hash(value) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+class _HashMemo(dict):
+    # Hashes of values that repeat across rows (vendors, items, the parent of consecutive lines)
+    def __missing__(self, value) -> int:
+        if len(self) >= 1 << 20:
+            self.clear()
+        hashed = self[value] = key_hash(value)
+        return hashed
+
+
+_references = _HashMemo()
+# Region -> business-day calendar that due dates are moved forward on; set per scan_table call
+_calendars: Dict[str, BusinessCalendar] = {}
+
+
+def _number(value) -> Optional[float]:
+    # CSV cells are text, and empty for None
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def _open_text(path: str, compression: Optional[str]):
+    if compression == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    elif compression == 'zstd':
+        import zstandard
+        # Every appended window is a separate frame
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True)
+        return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def _iter_json_array(path: str, block_size: int = 1 << 20) -> Iterator[Dict]:
+    # Decodes the records of a JSON array one at a time instead of loading the whole document
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer = file.read(block_size)
+        position = buffer.index('[') + 1
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The record continues in the next block
+                block = file.read(block_size)
+                if not block:
+                    raise
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+            yield record
+
+
+def iter_rows(directory: str, table: str, output_format: str, compression: Optional[str] = None,
+              database: str = "ap_data.sqlite") -> Iterator[Dict]:
+    path = os.path.join(directory, table)
+    if output_format == 'csv':
+        with _open_text(f"{path}.csv" + COMPRESSION_SUFFIXES.get(compression, ''), compression) as file:
+            yield from csv.DictReader(file)
+    elif output_format == 'jsonl':
+        with _open_text(f"{path}.jsonl" + COMPRESSION_SUFFIXES.get(compression, ''), compression) as file:
+            for line in file:
+                yield json.loads(line)
+    elif output_format == 'json':
+        yield from _iter_json_array(f"{path}.json")
+    elif output_format == 'parquet':
+        import pyarrow.dataset as ds
+        for batch in ds.dataset(path, format='parquet', partitioning='hive').to_batches():
+            yield from batch.to_pylist()
+    elif output_format == 'sqlite':
+        connection = sqlite3.connect(os.path.join(directory, database))
+        connection.row_factory = sqlite3.Row
+        try:
+            yield from map(dict, connection.execute(f"SELECT * FROM {table}"))
+        finally:
+            connection.close()
+    else:
+        raise ValueError(f"Unsupported format: {output_format}")
+
+
+class _Columns:
+    # Compact columns filled during a pass: hashes and day numbers as int64, amounts as float64
+    TYPES = {"key": 'q', "vendor": 'q', "po": 'q', "invoice": 'q', "parent": 'q', "line": 'q', "item": 'q',
+             "day": 'q', "paid": 'b', "completed": 'b', "total": 'd', "subtotal": 'd', "tax": 'd', "amount": 'd'}
+
+    def __init__(self):
+        self.data = {name: array(typecode) for name, typecode in self.TYPES.items()}
+
+    def add(self, **values):
+        for name, value in values.items():
+            self.data[name].append(value)
+
+    def to_numpy(self) -> Dict[str, np.ndarray]:
+        return {name: np.array(column, dtype=column.typecode) for name, column in self.data.items()}
+
+
+def _check_items(report: ValidationReport, table: str, label, items: List[Dict]) -> Tuple[float, float]:
+    # Line arithmetic; returns the summed total_price and tax_amount
+    total, tax = 0.0, 0.0
+    for item in items:
+        quantity, unit_price = _number(item['quantity']), _number(item['unit_price'])
+        total_price, tax_rate = _number(item['total_price']), _number(item['tax_rate'])
+        tax_amount = _number(item['tax_amount'])
+        if abs(quantity * unit_price - total_price) > TOLERANCE:
+            report.add(f"{table}: total_price is not quantity x unit_price", (label,))
+        if abs(total_price * tax_rate - tax_amount) > TOLERANCE:
+            report.add(f"{table}: tax_amount is not total_price x tax_rate", (label,))
+        total += total_price
+        tax += tax_amount
+    return total, tax
+
+
+def _embedded_items(row: Dict) -> Optional[List[Dict]]:
+    # Items inside the parent row (JSON output or normalize_lines: false); None with line tables
+    items = row.get('items')
+    return json.loads(items) if isinstance(items, str) else items
+
+
+def _scan_purchase_order(row: Dict, report: ValidationReport, columns: _Columns):
+    total = _number(row['total_amount'])
+    columns.add(key=key_hash(row['po_number']), vendor=_references[row['vendor_id']], day=to_day(row['po_date']),
+                total=total)
+    items = _embedded_items(row)
+    if items is not None:
+        lines_total, _ = _check_items(report, "purchase_orders", row['po_number'], items)
+        if abs(lines_total - total) > TOLERANCE:
+            report.add("purchase_orders: total_amount is not the sum of its lines", (row['po_number'],))
+        for item in items:
+            columns.add(item=_references[item['item_number']])
+
+
+def _scan_invoice(row: Dict, report: ValidationReport, columns: _Columns):
+    number = row['invoice_number']
+    subtotal, tax, total = _number(row['subtotal']), _number(row['tax_amount']), _number(row['total_amount'])
+    invoice_day = to_day(row['invoice_date'])
+    columns.add(key=key_hash(number), po=_references[row['po_number']], vendor=_references[row['vendor_id']],
+                day=invoice_day, subtotal=subtotal, tax=tax, total=total,
+                paid=row['status'] in PaymentGenerator.PAID_STATUSES)
+    if abs(subtotal + tax - total) > TOLERANCE:
+        report.add("invoices: total_amount is not subtotal + tax_amount", (number,))
+    due_day = invoice_day + parse_terms_days(row['payment_terms'])
+    calendar = _calendars.get(row['region'])
+    if to_day(row['due_date']) != (due_day if calendar is None else calendar.roll(due_day)):
+        report.add("invoices: due_date does not follow payment_terms", (number,))
+    if (row['status'] == 'Blocked') != bool(row.get('block_reason')):
+        report.add("invoices: block_reason does not match status (set only for Blocked)", (number,))
+    items = _embedded_items(row)
+    if items is not None:
+        lines_total, lines_tax = _check_items(report, "invoices", number, items)
+        if abs(lines_total - subtotal) > TOLERANCE or abs(lines_tax - tax) > TOLERANCE:
+            report.add("invoices: subtotal or tax_amount is not the sum of its lines", (number,))
+        for item in items:
+            columns.add(item=_references[item['item_number']])
+
+
+def _scan_line(parent_key: str, table: str):
+    def scan(row: Dict, report: ValidationReport, columns: _Columns):
+        label = f"{row[parent_key]} line {row['line_number']}"
+        total, tax = _check_items(report, table, label, [row])
+        columns.add(parent=_references[row[parent_key]], line=int(row['line_number']),
+                    item=_references[row['item_number']], total=total, tax=tax)
+    return scan
+
+
+def _scan_payment(row: Dict, report: ValidationReport, columns: _Columns):
+    amount = _number(row['amount'])
+    columns.add(key=key_hash(row['payment_id']), invoice=key_hash(row['invoice_number']),
+                day=to_day(row['payment_date']), amount=amount, completed=row['status'] == 'Completed')
+    if amount < 0:
+        report.add("payments: amount is negative", (row['payment_id'],))
+
+
+SCANNERS = {
+    "vendors": lambda row, report, columns: columns.add(key=key_hash(row['vendor_id'])),
+    "catalog": lambda row, report, columns: columns.add(key=key_hash(row['item_number'])),
+    "purchase_orders": _scan_purchase_order,
+    "po_lines": _scan_line("po_number", "po_lines"),
+    "invoices": _scan_invoice,
+    "invoice_lines": _scan_line("invoice_number", "invoice_lines"),
+    "payments": _scan_payment,
+}
+
+
+def scan_table(directory: str, table: str, output_format: str, compression: Optional[str], database: str,
+               max_examples: int, calendars: Optional[Dict[str, BusinessCalendar]] = None
+               ) -> Tuple[ValidationReport, Dict[str, np.ndarray]]:
+    # One streaming pass over a table
+    _calendars.clear()
+    _calendars.update(calendars or {})
+    report = ValidationReport(max_examples)
+    columns = _Columns()
+    scan = SCANNERS[table]
+    rows = 0
+    for row in iter_rows(directory, table, output_format, compression, database):
+        scan(row, report, columns)
+        rows += 1
+    report.rows[table] = rows
+    return report, columns.to_numpy()
+
+
+def _lookup(keys: np.ndarray, wanted: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # For every wanted hash: whether keys contains it, and the row of (one) match
+    if len(keys) == 0:
+        return np.zeros(len(wanted), dtype=bool), np.zeros(len(wanted), dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    positions = np.minimum(np.searchsorted(keys[order], wanted), len(keys) - 1)
+    rows = order[positions]
+    return keys[rows] == wanted, rows
+
+
+def _duplicates(keys: np.ndarray) -> np.ndarray:
+    # Rows whose key already appeared earlier in the table
+    order = np.argsort(keys, kind='stable')
+    mask = np.zeros(len(keys), dtype=bool)
+    mask[order[1:][keys[order][1:] == keys[order][:-1]]] = True
+    return mask
+
+
+def _duplicate_lines(parents: np.ndarray, lines: np.ndarray) -> np.ndarray:
+    # Rows whose (parent, line_number) already appeared earlier in the table
+    order = np.lexsort((np.arange(len(lines)), lines, parents))
+    parents, lines = parents[order], lines[order]
+    mask = np.zeros(len(order), dtype=bool)
+    mask[order[1:][(parents[1:] == parents[:-1]) & (lines[1:] == lines[:-1])]] = True
+    return mask
+
+
+def _group_sum(keys: np.ndarray, parents: np.ndarray, values: np.ndarray) -> np.ndarray:
+    # Sum of values per key, over the child rows whose parent hash equals it
+    found, rows = _lookup(keys, parents)
+    return np.bincount(rows[found], weights=values[found], minlength=len(keys))
+
+
+def _cross_checks(report: ValidationReport, tables: Dict[str, Dict[str, np.ndarray]]):
+    vendors, catalog = tables['vendors'], tables['catalog']
+    pos, invoices, payments = tables['purchase_orders'], tables['invoices'], tables['payments']
+
+    for table, key in KEYS.items():
+        report.add_rows(f"{table}: duplicate {key}", table, _duplicates(tables[table]['key']))
+    for parent, (line_table, _) in LINE_TABLES.items():
+        if line_table in tables:
+            report.add_rows(f"{line_table}: duplicate {KEYS[parent]}, line_number", line_table,
+                            _duplicate_lines(tables[line_table]['parent'], tables[line_table]['line']))
+
+    def orphans(table: str, column: str, field: str, parent: str, items: bool = False):
+        found, _ = _lookup(tables[parent]['key'], tables[table][column])
+        message = f"{table}: {field} not found in {parent}"
+        if items:
+            # Embedded items are not rows of the table, so only their number is reported
+            report.add(message, count=int(np.count_nonzero(~found)))
+        else:
+            report.add_rows(message, table, ~found)
+
+    orphans("purchase_orders", "vendor", "vendor_id", "vendors")
+    orphans("invoices", "po", "po_number", "purchase_orders")
+    orphans("invoices", "vendor", "vendor_id", "vendors")
+    orphans("payments", "invoice", "invoice_number", "invoices")
+    if "po_lines" in tables:
+        orphans("po_lines", "parent", "po_number", "purchase_orders")
+        orphans("po_lines", "item", "item_number", "catalog")
+        orphans("invoice_lines", "parent", "invoice_number", "invoices")
+        orphans("invoice_lines", "item", "item_number", "catalog")
+
+        po_lines, invoice_lines = tables['po_lines'], tables['invoice_lines']
+        line_totals = _group_sum(pos['key'], po_lines['parent'], po_lines['total'])
+        report.add_rows("purchase_orders: total_amount is not the sum of its lines", "purchase_orders",
+                        np.abs(line_totals - pos['total']) > TOLERANCE)
+        line_totals = _group_sum(invoices['key'], invoice_lines['parent'], invoice_lines['total'])
+        line_taxes = _group_sum(invoices['key'], invoice_lines['parent'], invoice_lines['tax'])
+        report.add_rows("invoices: subtotal or tax_amount is not the sum of its lines", "invoices",
+                        (np.abs(line_totals - invoices['subtotal']) > TOLERANCE) |
+                        (np.abs(line_taxes - invoices['tax']) > TOLERANCE))
+    else:
+        orphans("purchase_orders", "item", "item_number", "catalog", items=True)
+        orphans("invoices", "item", "item_number", "catalog", items=True)
+
+    found, rows = _lookup(pos['key'], invoices['po'])
+    report.add_rows("invoices: invoice_date is before the PO's po_date", "invoices",
+                    found & (invoices['day'] < pos['day'][rows]))
+
+    found, rows = _lookup(invoices['key'], payments['invoice'])
+    invoice_totals = invoices['total'][rows]
+    report.add_rows("payments: payment_date is before the invoice_date", "payments",
+                    found & (payments['day'] < invoices['day'][rows]))
+    report.add_rows(f"payments: invoice status is not {' or '.join(PaymentGenerator.PAID_STATUSES)}", "payments",
+                    found & (invoices['paid'][rows] == 0))
+    report.add_rows("payments: amount exceeds the invoice total_amount", "payments",
+                    found & (payments['amount'] > invoice_totals + TOLERANCE))
+    settled = np.abs(payments['amount'] - invoice_totals) <= TOLERANCE
+    report.add_rows("payments: status does not match amount (Completed only for the full invoice total)", "payments",
+                    found & (settled != (payments['completed'] == 1)))
+    report.add_rows("payments: more than one payment for an invoice", "payments", _duplicates(payments['invoice']))
+
+    # Not an error in incremental datasets, where payments dated after the last window are held back
+    paid, _ = _lookup(payments['invoice'], invoices['key'])
+    report.add_rows(f"invoices: {' or '.join(PaymentGenerator.PAID_STATUSES)} invoice has no payment", "invoices",
+                    (invoices['paid'] == 1) & ~paid, severity="warning")
+
+
+def validate_dataset(directory: str, output_format: str, compression: Optional[str] = None,
+                     normalize_lines: bool = False, database: str = "ap_data.sqlite", workers: Optional[int] = None,
+                     max_examples: int = 5,
+                     calendars: Optional[Dict[str, BusinessCalendar]] = None) -> ValidationReport:
+    tables = list(KEYS)
+    if output_format in ('parquet', 'sqlite') or (output_format in ('csv', 'jsonl') and normalize_lines):
+        tables += [line_table for line_table, _ in LINE_TABLES.values()]
+    report = ValidationReport(max_examples)
+    columns = {}
+    with ProcessPoolExecutor(max_workers=workers or min(len(tables), os.cpu_count() or 1)) as executor:
+        futures = {table: executor.submit(scan_table, directory, table, output_format, compression, database,
+                                          max_examples, calendars)
+                   for table in tables}
+        for table, future in futures.items():
+            table_report, columns[table] = future.result()
+            report.merge(table_report)
+    _cross_checks(report, columns)
+    return report
+
+
+def print_report(report: ValidationReport):
+    for table, rows in report.rows.items():
+        print(f"{table:<16} {rows:>12} rows")
+    for message, problem in sorted(report.problems.items(), key=lambda item: item[1]["severity"]):
+        examples = f" (e.g. {', '.join(problem['examples'])})" if problem["examples"] else ""
+        print(f"{problem['severity'].upper()} {message}: {problem['count']}{examples}")
+    warnings = sum(problem["count"] for problem in report.problems.values()) - report.errors
+    print(f"{report.errors} errors, {warnings} warnings")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check a generated AP dataset for referential and financial integrity")
+    parser.add_argument('--dir', default='.', help="directory holding the dataset")
+    parser.add_argument('--format', help="output format of the dataset (default: general.output_format)")
+    parser.add_argument('--workers', type=int, help="processes reading tables in parallel (default: one per table)")
+    parser.add_argument('--examples', type=int, default=5, help="example rows listed per problem")
+    args = parser.parse_args(argv)
+
+    config = load_config(Path(__file__).parent.parent / "config" / "config.yaml")
+    general = config['general']
+    report = validate_dataset(args.dir, args.format or general['output_format'], general.get('compression'),
+                              general.get('normalize_lines', False),
+                              (general.get('sqlite') or {}).get('database', "ap_data.sqlite"), args.workers,
+                              args.examples, config.calendars)
+    print_report(report)
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
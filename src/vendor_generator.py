@@ -1,58 +1,84 @@
+import hashlib
+import json
+import os
+import pickle
 import random
-from typing import List, Dict
+import tempfile
+from typing import List, Optional
 from faker import Faker
 from tqdm import tqdm
+from src.config import CompiledConfig, compile_config
 from src.description_generator import DescriptionGenerator
-from src.utils.rate_limiter import RateLimiter
+from src.records import Vendor
+from src.utils.attribute_pool import AttributePool
+from src.utils.id_allocator import get_id_allocator, id_positions, advance_id_positions
+from src.utils.metrics import hot_path, track
+from src.utils.rate_limiter import get_rate_limiter
+from src.utils.seeding import derive_seed, seed_generators
 
 fake = Faker()
 
+# Bump when vendor generation changes so cached vendor masters are not reused
+VENDOR_CACHE_VERSION = 2
+
 
 class VendorGenerator:
-    def __init__(self, config: Dict, description_generator: DescriptionGenerator):
-        self.config = config
+    def __init__(self, config: CompiledConfig, description_generator: DescriptionGenerator):
+        self.config = compile_config(config)
         self.description_generator = description_generator
-        self.rate_limiter = RateLimiter(config['general']['max_operations_per_second'])
+        self.rate_limiter = get_rate_limiter(config['general']['max_operations_per_second'])
+        self.vendor_ids = get_id_allocator('vendor')
+        pool_size = config['vendors'].get('attribute_pool_size', 1000) or 0
+        self.pool = AttributePool(min(pool_size, config['vendors']['total_count']))
 
-    def generate_vendors(self) -> List[Dict]:
+    def generate_vendors(self) -> List[Vendor]:
         total_vendors = self.config['vendors']['total_count']
         vendors = []
 
-        for _ in tqdm(range(total_vendors), desc="Generating Vendors"):
-            self.rate_limiter.limit()
-            vendor = self._generate_single_vendor()
-            vendors.append(vendor)
+        with track("stage.vendors") as section:
+            for _ in tqdm(range(total_vendors), desc="Generating Vendors"):
+                self.rate_limiter.acquire()
+                vendor = self._generate_single_vendor()
+                vendors.append(vendor)
+            section.add(rows=len(vendors))
 
         return vendors
 
-    def _generate_single_vendor(self) -> Dict:
-        vendor_id = f"V{fake.unique.random_number(digits=7)}"
+    @hot_path("vendors.single_vendor")
+    def _generate_single_vendor(self) -> Vendor:
+        vendor_id = self.vendor_ids.next_id()
+        # Not pooled: vendors sharing a name and address would look like duplicate vendor records
         name = fake.company()
         regions = self._assign_regions()
-        specializations = random.sample(self.config['items']['categories'], random.randint(1, 3))
-
-        vendor = {
-            "vendor_id": vendor_id,
-            "name": name,
-            "description": self.description_generator.generate_description("Professional Services"),
-            "address": fake.address(),
-            "tax_id": fake.ssn(),  # This is a simplification; in reality, tax IDs would vary by country
-            "payment_terms": random.choice(self.config['vendors']['payment_terms']),
-            "regions": regions,
-            "specializations": specializations,
-            "rating": round(random.uniform(1, 5), 1),
-            "is_preferred": random.random() < 0.2,  # 20% chance of being a preferred vendor
-            "contact": {
-                "name": fake.name(),
-                "email": fake.email(),
-                "phone": fake.phone_number()
+        specializations = random.sample(self.config.categories, random.randint(1, 3))
+
+        vendor = Vendor(
+            vendor_id=vendor_id,
+            name=name,
+            description=self.pool.draw('description', self._generate_description),
+            address=fake.address(),
+            # Not pooled: a tax ID identifies the vendor. This is a simplification; in reality, tax IDs
+            # would vary by country
+            tax_id=fake.ssn(),
+            payment_terms=random.choice(self.config['vendors']['payment_terms']),
+            regions=regions,
+            specializations=specializations,
+            rating=round(random.uniform(1, 5), 1),
+            is_preferred=random.random() < 0.2,  # 20% chance of being a preferred vendor
+            contact={
+                "name": self.pool.draw('contact_name', fake.name),
+                "email": self.pool.draw('email', fake.email),
+                "phone": self.pool.draw('phone', fake.phone_number)
             }
-        }
+        )
 
         return vendor
 
+    def _generate_description(self) -> str:
+        return self.description_generator.generate_description("Professional Services")
+
     def _assign_regions(self) -> List[str]:
-        all_regions = [region['name'] for region in self.config['regions']]
+        all_regions = self.config.region_names
         distribution = self.config['vendors']['allowed_regions_distribution']
 
         if random.random() < distribution['single_region']:
@@ -62,6 +88,44 @@ class VendorGenerator:
             return random.sample(all_regions, num_regions)
 
 
-def generate_vendors(config: Dict, description_generator: DescriptionGenerator) -> List[Dict]:
+def generate_vendors(config: CompiledConfig, description_generator: DescriptionGenerator) -> List[Vendor]:
     generator = VendorGenerator(config, description_generator)
-    return generator.generate_vendors()
\ No newline at end of file
+    return generator.generate_vendors()
+
+
+def vendor_cache_key(config: CompiledConfig, description_generator: DescriptionGenerator, master_seed: int) -> str:
+    # Everything vendor generation reads: the vendors section, regions, categories, vendor ID
+    # digits, the description templates and the seed
+    vendors_config = {key: value for key, value in config['vendors'].items() if key != 'cache_dir'}
+    material = json.dumps([VENDOR_CACHE_VERSION, master_seed, vendors_config, config.region_names,
+                           config.categories, config.id_digits['vendor'], description_generator.config],
+                          sort_keys=True, default=str)
+    return hashlib.blake2b(material.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_or_generate_vendors(config: CompiledConfig, description_generator: DescriptionGenerator, master_seed: int,
+                             cache_dir: Optional[str] = None) -> List[Vendor]:
+    # Vendors get their own random stream, so a cache hit leaves every later stream unchanged
+    seed_generators(derive_seed(master_seed, 'vendors'))
+    if cache_dir is None:
+        return generate_vendors(config, description_generator)
+
+    cache_path = os.path.join(cache_dir, f"vendors-{vendor_cache_key(config, description_generator, master_seed)}.pkl")
+    try:
+        with track("cache.vendors") as section, open(cache_path, 'rb') as file:
+            vendors, vendor_position = pickle.load(file)
+            section.add(rows=len(vendors))
+        advance_id_positions({'vendor': vendor_position})
+        return vendors
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        pass
+
+    vendors = generate_vendors(config, description_generator)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Written to a temporary file and renamed so a concurrent run never reads a partial cache
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as file:
+        pickle.dump((vendors, id_positions()['vendor']), file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, cache_path)
+    return vendors